@@ -0,0 +1,137 @@
+"""Latency of concurrent /subscribe and /status traffic: blocking vs async database layer.
+
+Run with: python -m benchmarks.bench_api [users] [requests] [concurrency]
+
+The API runs under uvicorn in a child process against a fresh SQLite file
+seeded with `users` active users. "blocking" injects a wrapper that calls
+the synchronous Database from the handlers, as the API did before
+AsyncDatabase; "async" is the API as shipped. A fifth of the requests
+subscribe new users, the rest read /status.
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+SUBSCRIBE_SHARE = 0.2
+
+
+class BlockingDatabase:
+    """The synchronous Database behind the async interface, blocking the event loop on every query."""
+
+    def __init__(self, database):
+        self.database = database
+
+    async def add_user(self, *args, **kwargs):
+        return self.database.add_user(*args, **kwargs)
+
+    async def get_user_by_token(self, fcm_token):
+        return self.database.get_user_by_token(fcm_token)
+
+    async def update_user_preferences(self, *args, **kwargs):
+        return self.database.update_user_preferences(*args, **kwargs)
+
+    async def deactivate_user(self, fcm_token):
+        return self.database.deactivate_user(fcm_token)
+
+    async def count_active_users(self):
+        # /status used to load every active user to count them
+        return len(self.database.get_active_users())
+
+
+def seed(database_url: str, n_users: int):
+    from src.api.database import Database, UserDB
+
+    database = Database(database_url)
+    with database.SessionLocal() as session:
+        session.add_all([
+            UserDB(lat=60.0 + i % 20, lon=10.0, radius_km=250, threshold=15, fcm_token=f"seed-{i}", active=True)
+            for i in range(n_users)
+        ])
+        session.commit()
+
+
+def _serve(mode: str, database_url: str, port: int):
+    import uvicorn
+
+    os.environ['DATABASE_URL'] = database_url
+    from src.api import main
+    from src.api.database import Database
+
+    if mode == 'blocking':
+        blocking = BlockingDatabase(Database(database_url))
+        main.app.dependency_overrides[main.get_database] = lambda: blocking
+    uvicorn.run(main.app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _load(url: str, n_requests: int, concurrency: int, tag: str) -> Dict[str, List[float]]:
+    latencies: Dict[str, List[float]] = {'/subscribe': [], '/status': []}
+    rng = np.random.default_rng(0)
+    subscribe = rng.random(n_requests) < SUBSCRIBE_SHARE
+    queue = iter(range(n_requests))
+
+    async with httpx.AsyncClient(base_url=url, timeout=60.0,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        for _ in range(100):
+            try:
+                if (await client.get('/api')).status_code == 200:
+                    break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+
+        async def worker():
+            for i in queue:
+                start = time.perf_counter()
+                if subscribe[i]:
+                    response = await client.post('/subscribe', json={
+                        'lat': 64.8, 'lon': -147.7, 'radius_km': 250, 'threshold': 15, 'fcm_token': f"{tag}-{i}"
+                    })
+                    path = '/subscribe'
+                else:
+                    response = await client.get('/status')
+                    path = '/status'
+                response.raise_for_status()
+                latencies[path].append(time.perf_counter() - start)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def main(n_users: int = 2000, n_requests: int = 300, concurrency: int = 20):
+    print(f"{n_users} users, {n_requests} requests, {concurrency} concurrent")
+    context = multiprocessing.get_context('spawn')
+    for mode in ('blocking', 'async'):
+        with tempfile.TemporaryDirectory() as directory:
+            database_url = f"sqlite:///{os.path.join(directory, 'aurora.db')}"
+            seed(database_url, n_users)
+            port = _free_port()
+            server = context.Process(target=_serve, args=(mode, database_url, port), daemon=True)
+            server.start()
+            try:
+                start = time.perf_counter()
+                latencies = asyncio.run(_load(f"http://127.0.0.1:{port}", n_requests, concurrency, mode))
+                elapsed = time.perf_counter() - start
+            finally:
+                server.terminate()
+                server.join()
+        for path, samples in latencies.items():
+            p50, p99 = np.percentile(np.array(samples) * 1000, [50, 99])
+            print(f"{mode:8s} {path:10s} n={len(samples):5d}  p50 {p50:8.1f} ms  p99 {p99:8.1f} ms")
+        print(f"{mode:8s} throughput {n_requests / elapsed:8.0f} req/s")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:4]))
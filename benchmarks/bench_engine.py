@@ -0,0 +1,52 @@
+"""Engine cost per cycle for a synthetic user base on a full Ovation grid.
+
+Run with: python -m benchmarks.bench_engine
+"""
+import time
+from datetime import datetime
+import numpy as np
+
+from src.engine.aurora_engine import AuroraEngine
+from src.engine.batch import UserBatch
+from src.engine.grid import AuroraGrid
+
+
+def synthetic_grid(seed: int = 0) -> AuroraGrid:
+    rng = np.random.default_rng(seed)
+    prob = np.zeros((360, 181), dtype=np.float32)
+    # Auroral ovals around +/-65° latitude
+    lats = np.arange(-90, 91)
+    oval = np.exp(-((np.abs(lats) - 65) / 6.0) ** 2) * 60
+    prob[:] = oval[np.newaxis, :] * rng.uniform(0.5, 1.0, (360, 1))
+    return AuroraGrid(prob=prob)
+
+
+def synthetic_batch(n_users: int, seed: int = 1) -> UserBatch:
+    rng = np.random.default_rng(seed)
+    return UserBatch(
+        id=np.arange(n_users, dtype=np.int64),
+        lat=rng.uniform(40, 70, n_users),
+        lon=rng.uniform(-170, 30, n_users),
+        radius_km=rng.choice([100, 250, 500], n_users),
+        threshold=rng.choice([10, 15, 30], n_users).astype(np.float64),
+        last_notified=np.full(n_users, np.nan)
+    )
+
+
+def main(n_users: int = 50_000):
+    engine = AuroraEngine()
+    grid = synthetic_grid()
+    batch = synthetic_batch(n_users)
+    timestamp = datetime(2024, 1, 15, 3, 0)
+
+    for use_disk_fields in (False, True):
+        engine.use_disk_fields = use_disk_fields
+        start = time.perf_counter()
+        decision = engine.evaluate_batch(batch, grid, {}, timestamp)
+        elapsed = time.perf_counter() - start
+        print(f"disk_fields={use_disk_fields!s:5}  {elapsed:7.3f} s  "
+              f"({elapsed / n_users * 1e6:6.1f} us/user, {int(decision.notify.sum())} notify)")
+
+
+if __name__ == "__main__":
+    main()
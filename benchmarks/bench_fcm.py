@@ -0,0 +1,54 @@
+"""FCM batch send throughput against a local fake endpoint.
+
+Run with: python -m benchmarks.bench_fcm
+
+Every fake request sleeps for a simulated FCM round-trip. The benchmark also
+checks that the event loop stays responsive while a large batch is sending:
+it reports the worst delay seen by a 10 ms ticker.
+"""
+import asyncio
+import time
+
+from src.notify.fcm_service import FCMService, summarize_results
+from tests.fake_fcm import fake_fcm_app, fcm_responder
+from tests.helpers import notifications
+from tests.stub_server import StubServer
+
+
+async def run(service: FCMService, batch) -> tuple:
+    worst_tick = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst_tick
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            worst_tick = max(worst_tick, time.perf_counter() - start - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    results = await service.send_notifications_batch(batch)
+    elapsed = time.perf_counter() - start
+    done = True
+    await tick
+    return results, elapsed, worst_tick
+
+
+def main(n_messages: int = 2000, latency_s: float = 0.02):
+    with StubServer(fcm_responder(unregistered={'token-7'}, latency_s=latency_s)) as stub:
+        service = FCMService(app=fake_fcm_app(stub.url))
+        try:
+            batch = list(notifications(n_messages))
+            results, elapsed, worst_tick = asyncio.run(run(service, batch))
+        finally:
+            service.close()
+
+    summary = summarize_results(results)
+    print(f"{n_messages} messages in {elapsed:.2f} s ({n_messages / elapsed:,.0f} msg/s), "
+          f"{summary['sent']} sent, {summary['failed']} failed, "
+          f"worst event-loop stall {worst_tick * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Client-per-request vs the shared pooled client, against a local stub server.
+
+Run with: python -m benchmarks.bench_http_client
+
+The stub is plain HTTP on localhost, so the gap shown here is TCP setup and
+client construction only; against OpenWeather each new connection also pays
+a TLS handshake, which widens it considerably.
+"""
+import asyncio
+import time
+import httpx
+
+from src.ingest.http_client import create_http_client
+from src.ingest.weather_data import WeatherDataFetcher
+from tests.stub_server import StubServer, json_responder
+
+
+async def run(fetcher, n_requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await fetcher.fetch_weather_data(45.0 + i * 1e-3, -73.0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    return time.perf_counter() - start
+
+
+class PerRequestClientFetcher:
+    """The previous behaviour: a fresh AsyncClient for every call."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    async def fetch_weather_data(self, lat, lon):
+        async with httpx.AsyncClient() as client:
+            fetcher = WeatherDataFetcher(client=client)
+            fetcher.base_url = self.base_url
+            return await fetcher.fetch_weather_data(lat, lon)
+
+
+async def main(n_requests: int = 2000, concurrency: int = 20):
+    with StubServer(json_responder({'clouds': {'all': 20}})) as stub:
+        per_request = PerRequestClientFetcher(stub.url + "/weather")
+        elapsed = await run(per_request, n_requests, concurrency)
+        print(f"client per request: {elapsed:6.2f} s, {stub.connections} TCP connections")
+
+        stub.connections = 0
+        async with create_http_client() as client:
+            pooled = WeatherDataFetcher(client=client)
+            pooled.base_url = stub.url + "/weather"
+            elapsed = await run(pooled, n_requests, concurrency)
+        print(f"shared pooled client: {elapsed:6.2f} s, {stub.connections} TCP connections")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+"""Parse time and peak RSS of the Ovation payload: json + DataFrame vs streaming.
+
+Run with: python -m benchmarks.bench_ovation_parse [payload.json]
+
+Without an argument the saved sample in benchmarks/data is used; pass a
+fresh download of ovation_aurora_latest.json to measure the live format.
+Each method runs in its own process so peak RSS is not shared between them.
+"""
+import gzip
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+SAMPLE = os.path.join(os.path.dirname(__file__), 'data', 'ovation_sample.json.gz')
+CHUNK_SIZE = 64 * 1024
+
+
+def write_sample(path: str = SAMPLE):
+    """Save a synthetic payload in the NOAA layout, integer probabilities on the full lattice."""
+    from benchmarks.bench_engine import synthetic_grid
+
+    grid = synthetic_grid()
+    coordinates = [
+        [lon, lat, int(round(float(grid.prob[lon, lat + 90])))]
+        for lon in range(360) for lat in range(-90, 91)
+    ]
+    payload = {
+        'Observation Time': '2024-01-15T03:00:00Z',
+        'Forecast Time': '2024-01-15T03:35:00Z',
+        'Data Format': '[Longitude, Latitude, Aurora]',
+        'coordinates': coordinates,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, 'wt') as f:
+        json.dump(payload, f)
+
+
+def _reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux), so imports don't mask the parse peak."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run(method: str, path: str, trace: bool, queue):
+    from src.engine.grid import AuroraGrid
+    from src.ingest.ovation_parser import OvationStreamParser
+
+    _reset_peak_rss()
+    baseline = _peak_rss_kb()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if method == 'stream':
+        # As with a streamed response, only one chunk of the body is held at a time
+        parser = OvationStreamParser()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                parser.feed(chunk)
+        parser.close()
+    else:
+        with open(path, 'rb') as f:
+            data = json.loads(f.read())
+        grid = AuroraGrid.from_payload(data)
+        if method == 'json+frame':
+            df = grid.to_frame()
+            df['timestamp'] = datetime.utcnow()
+    elapsed = time.perf_counter() - start
+    peak_alloc = tracemalloc.get_traced_memory()[1] if trace else 0
+    tracemalloc.stop()
+    queue.put((elapsed, _peak_rss_kb() - baseline, peak_alloc))
+
+
+def main(path: str = None):
+    temporary = path is None
+    if temporary:
+        if not os.path.exists(SAMPLE):
+            write_sample()
+        tmp = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        with gzip.open(SAMPLE, 'rb') as f:
+            tmp.write(f.read())
+        tmp.close()
+        path = tmp.name
+
+    print(f"payload {os.path.getsize(path) / 1e6:.2f} MB")
+    context = multiprocessing.get_context('spawn')
+    try:
+        for method in ('json', 'json+frame', 'stream'):
+            queue = context.Queue()
+            # Best of three timed runs, then one traced run for allocations (tracing slows parsing)
+            runs = []
+            for trace in (False, False, False, True):
+                process = context.Process(target=_run, args=(method, path, trace, queue))
+                process.start()
+                runs.append(queue.get())
+                process.join()
+            elapsed = min(run[0] for run in runs[:-1])
+            peak = min(run[1] for run in runs[:-1])
+            alloc = runs[-1][2]
+            print(f"{method:11s} {elapsed * 1000:8.1f} ms  peak RSS +{peak / 1024:6.1f} MB  "
+                  f"peak allocated {alloc / 1e6:6.1f} MB")
+    finally:
+        if temporary:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
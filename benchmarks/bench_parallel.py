@@ -0,0 +1,39 @@
+"""Scaling of sharded engine evaluation with the number of worker processes.
+
+Run with: python -m benchmarks.bench_parallel
+"""
+import os
+import time
+from datetime import datetime
+
+from src.engine.aurora_engine import AuroraEngine
+from benchmarks.bench_engine import synthetic_batch, synthetic_grid
+
+
+def main(n_users: int = 200_000):
+    grid = synthetic_grid()
+    batch = synthetic_batch(n_users)
+    timestamp = datetime(2024, 1, 15, 3, 0)
+    cores = os.cpu_count() or 1
+
+    baseline = None
+    workers = 1
+    while workers <= cores:
+        engine = AuroraEngine()
+        engine.workers = workers
+        try:
+            # Warm-up run starts the pool so timings exclude process spawn
+            engine.evaluate_batch(batch, grid, {}, timestamp)
+            start = time.perf_counter()
+            engine.evaluate_batch(batch, grid, {}, timestamp)
+            elapsed = time.perf_counter() - start
+        finally:
+            engine.close()
+
+        baseline = baseline or elapsed
+        print(f"workers={workers:3d}  {elapsed:7.3f} s  speedup {baseline / elapsed:5.2f}x")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Per-user cost of the day/night test: astral per user vs one vectorized pass.
+
+Run with: python -m benchmarks.bench_solar
+"""
+import time
+from datetime import datetime, timezone
+import numpy as np
+from astral import Observer
+from astral.sun import elevation
+
+from src.engine.solar import night_mask
+
+
+def main(n_users: int = 100_000, n_astral: int = 2_000):
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(-70, 80, n_users)
+    lons = rng.uniform(-180, 180, n_users)
+    timestamp = datetime(2024, 1, 15, 3, 0)
+
+    start = time.perf_counter()
+    for lat, lon in zip(lats[:n_astral], lons[:n_astral]):
+        elevation(Observer(lat, lon), timestamp.replace(tzinfo=timezone.utc)) < -6
+    astral_us = (time.perf_counter() - start) / n_astral * 1e6
+
+    start = time.perf_counter()
+    night_mask(lats, lons, timestamp)
+    vector_us = (time.perf_counter() - start) / n_users * 1e6
+
+    print(f"astral elevation per user:  {astral_us:8.3f} us")
+    print(f"vectorized night_mask/user: {vector_us:8.3f} us ({n_users} users)")
+
+
+if __name__ == "__main__":
+    main()
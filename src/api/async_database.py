@@ -0,0 +1,164 @@
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from ..engine.models import User
+from ..utils.config import settings
+from .database import UserDB, engine_options, user_from_row
+from .migrations import apply_migrations
+
+logger = logging.getLogger(__name__)
+
+# asyncio driver used for each backend when the URL names a blocking one (or none)
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+
+
+def async_database_url(database_url: str) -> str:
+    """Swap a URL's blocking driver for its asyncio counterpart, e.g. sqlite:// -> sqlite+aiosqlite://."""
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None or url.get_driver_name() == driver:
+        return database_url
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+class AsyncDatabase:
+    """The API's database layer on SQLAlchemy's asyncio engine.
+
+    Same tables and migrations as Database, but queries run on aiosqlite or
+    asyncpg, so a slow query suspends only its own request instead of
+    blocking the event loop. Call init_database() once before serving.
+    """
+
+    def __init__(self, database_url: str = None):
+        self.database_url = async_database_url(database_url or settings.database_url)
+        self.engine = create_async_engine(self.database_url, **engine_options(self.database_url))
+        self.SessionLocal = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+
+    async def init_database(self):
+        """Bring the schema up to date through the versioned migrations."""
+        try:
+            async with self.engine.begin() as connection:
+                await connection.run_sync(apply_migrations)
+            logger.info("Async database initialized successfully")
+        except Exception as e:
+            logger.error(f"Error initializing database: {e}")
+            raise
+
+    async def close(self):
+        """Close every pooled connection."""
+        await self.engine.dispose()
+
+    async def add_user(self, lat: float, lon: float, radius_km: int, threshold: int,
+                       fcm_token: str) -> Optional[User]:
+        """Add a new user subscription."""
+        try:
+            async with self.SessionLocal() as session:
+                existing = await session.scalar(select(UserDB.id).where(UserDB.fcm_token == fcm_token))
+                if existing is not None:
+                    logger.warning("User with FCM token already exists")
+                    return None
+
+                db_user = UserDB(
+                    lat=lat,
+                    lon=lon,
+                    radius_km=radius_km,
+                    threshold=threshold,
+                    fcm_token=fcm_token,
+                    created_at=datetime.utcnow(),
+                    active=True
+                )
+                session.add(db_user)
+                await session.commit()
+                return user_from_row(db_user)
+        except Exception as e:
+            logger.error(f"Error adding user: {e}")
+            return None
+
+    async def get_user_by_token(self, fcm_token: str) -> Optional[User]:
+        """Get user by FCM token."""
+        try:
+            async with self.SessionLocal() as session:
+                db_user = await session.scalar(
+                    select(UserDB).where(UserDB.fcm_token == fcm_token, UserDB.active == True)
+                )
+                return user_from_row(db_user) if db_user is not None else None
+        except Exception as e:
+            logger.error(f"Error getting user by token: {e}")
+            return None
+
+    async def update_user_preferences(self, fcm_token: str, radius_km: Optional[int] = None,
+                                      threshold: Optional[int] = None) -> bool:
+        """Update user preferences."""
+        try:
+            async with self.SessionLocal() as session:
+                db_user = await session.scalar(
+                    select(UserDB).where(UserDB.fcm_token == fcm_token, UserDB.active == True)
+                )
+                if db_user is None:
+                    return False
+
+                updated = False
+                if radius_km is not None:
+                    db_user.radius_km = radius_km
+                    updated = True
+                if threshold is not None:
+                    db_user.threshold = threshold
+                    updated = True
+
+                if updated:
+                    await session.commit()
+                return updated
+        except Exception as e:
+            logger.error(f"Error updating user preferences: {e}")
+            return False
+
+    async def deactivate_user(self, fcm_token: str) -> bool:
+        """Deactivate a user subscription."""
+        try:
+            async with self.SessionLocal() as session:
+                db_user = await session.scalar(select(UserDB).where(UserDB.fcm_token == fcm_token))
+                if db_user is None:
+                    return False
+                db_user.active = False
+                await session.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error deactivating user: {e}")
+            return False
+
+    async def set_topic(self, fcm_token: str, topic: Optional[str]) -> bool:
+        """Record the region topic FCM confirmed the user joined, or None once they left it."""
+        try:
+            async with self.SessionLocal() as session:
+                result = await session.execute(
+                    update(UserDB).where(UserDB.fcm_token == fcm_token).values(topic=topic)
+                )
+                await session.commit()
+                return result.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error updating topic membership: {e}")
+            return False
+
+    async def get_active_users(self) -> List[User]:
+        """Get all active users."""
+        try:
+            async with self.SessionLocal() as session:
+                db_users = await session.scalars(select(UserDB).where(UserDB.active == True))
+                return [user_from_row(db_user) for db_user in db_users]
+        except Exception as e:
+            logger.error(f"Error getting active users: {e}")
+            return []
+
+    async def count_active_users(self) -> int:
+        """Number of active users, counted in the database."""
+        try:
+            async with self.SessionLocal() as session:
+                return await session.scalar(select(func.count(UserDB.id)).where(UserDB.active == True))
+        except Exception as e:
+            logger.error(f"Error counting active users: {e}")
+            return 0
@@ -1,17 +1,25 @@
 import os
-from datetime import datetime
-from typing import List, Optional
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 import logging
-from sqlalchemy import create_engine, Column, Integer, Float, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import (
+    create_engine, func, insert, or_, select, update, Column, Integer, Float, String, Text, Boolean, DateTime, ForeignKey,
+    Index
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from ..engine.models import User
+from ..engine.batch import UserBatch
+from ..engine.models import OutboxMessage, User
 from ..utils.config import settings
 
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+# Ids per "WHERE id IN (...)" statement; stays under SQLite's 999 bound-parameter limit
+BULK_CHUNK_SIZE = 500
+
 class UserDB(Base):
     __tablename__ = 'users'
     
@@ -24,6 +32,13 @@ class UserDB(Base):
     last_notified = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
     active = Column(Boolean, default=True)
+    # Region topic FCM confirmed the user joined (topic mode); NULL while not a member
+    topic = Column(String)
+    
+    __table_args__ = (
+        # get_active_users reads only active rows; pruned and unsubscribed users stay out of the index
+        Index('ix_users_active', 'id', sqlite_where=active == True, postgresql_where=active == True),
+    )
 
 class AlertDB(Base):
     __tablename__ = 'alerts'
@@ -36,19 +51,78 @@ class AlertDB(Base):
     is_night = Column(Boolean)
     should_notify = Column(Boolean)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # A user's alert history, newest first
+        Index('ix_alerts_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+class OutboxDB(Base):
+    __tablename__ = 'outbox'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # "user" (one device), "topic" (region topic send), "subscribe" (topic resubscription)
+    # or "unsubscribe" (retry of a topic leave that failed after a delivery)
+    kind = Column(String(16), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    payload = Column(Text, nullable=False)
+    # pending -> sending -> sent, or back to pending for a retry, or dead after the last attempt
+    status = Column(String(16), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # A "sending" row whose lease ran out belonged to a crashed worker and is claimed again
+    locked_until = Column(DateTime)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+    
+    __table_args__ = (
+        # claim_outbox: due pending rows by next_attempt_at, expired leases by status
+        Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+def engine_options(database_url: str) -> Dict[str, Any]:
+    """Connection pool settings for an engine; in-memory SQLite keeps its single static connection."""
+    if database_url.startswith('sqlite') and (':memory:' in database_url or database_url.rstrip('/').endswith(':')):
+        return {}
+    return {
+        'pool_size': settings.database_pool_size,
+        'max_overflow': settings.database_max_overflow,
+        'pool_recycle': settings.database_pool_recycle_s,
+        'pool_timeout': settings.database_pool_timeout_s,
+        'pool_pre_ping': True
+    }
+
+
+def user_from_row(db_user: UserDB) -> User:
+    """Pydantic user for a users row."""
+    return User(
+        id=db_user.id,
+        lat=db_user.lat,
+        lon=db_user.lon,
+        radius_km=db_user.radius_km,
+        threshold=db_user.threshold,
+        fcm_token=db_user.fcm_token,
+        last_notified=db_user.last_notified,
+        created_at=db_user.created_at,
+        active=db_user.active
+    )
+
 
 class Database:
     def __init__(self, database_url: str = None):
         self.database_url = database_url or settings.database_url
-        self.engine = create_engine(self.database_url)
+        self.engine = create_engine(self.database_url, **engine_options(self.database_url))
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
         self.init_database()
     
     def init_database(self):
-        """Initialize the database with required tables."""
+        """Bring the schema up to date through the versioned migrations."""
+        from .migrations import applied_versions, migrate
+        
         try:
-            Base.metadata.create_all(bind=self.engine)
-            logger.info("Database initialized successfully")
+            migrate(self.engine)
+            logger.info(f"Database initialized successfully (schema version {max(applied_versions(self.engine))})")
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
@@ -194,6 +268,47 @@ class Database:
             logger.error(f"Error getting active users: {e}")
             return []
     
+    def iter_active_users(self, chunk_size: int,
+                          as_arrays: bool = False) -> Iterator[Union[List[User], UserBatch]]:
+        """Stream active users in chunks of at most `chunk_size`, oldest id first.
+        
+        Only the columns the scheduler uses are selected, and rows are fetched
+        per chunk with yield_per (a server-side cursor on PostgreSQL), so no
+        ORM objects are built and at most one chunk of rows is held. With
+        `as_arrays` each chunk is a UserBatch instead of a list of users.
+        """
+        columns = (UserDB.id, UserDB.lat, UserDB.lon, UserDB.radius_km, UserDB.threshold,
+                   UserDB.last_notified, UserDB.fcm_token, UserDB.topic)
+        try:
+            with self.SessionLocal() as session:
+                result = session.execute(
+                    select(*columns).where(UserDB.active == True).order_by(UserDB.id)
+                    .execution_options(yield_per=chunk_size)
+                )
+                for rows in result.partitions():
+                    if as_arrays:
+                        yield UserBatch.from_rows(rows)
+                    else:
+                        yield [
+                            User(id=row.id, lat=row.lat, lon=row.lon, radius_km=row.radius_km,
+                                 threshold=row.threshold, fcm_token=row.fcm_token,
+                                 last_notified=row.last_notified)
+                            for row in rows
+                        ]
+                        
+        except Exception as e:
+            logger.error(f"Error streaming active users: {e}")
+            raise
+    
+    def count_active_users(self) -> int:
+        """Number of active users, counted in the database."""
+        try:
+            with self.SessionLocal() as session:
+                return session.query(func.count(UserDB.id)).filter(UserDB.active == True).scalar()
+        except Exception as e:
+            logger.error(f"Error counting active users: {e}")
+            return 0
+    
     def update_last_notified(self, user_id: int, timestamp: datetime) -> bool:
         """Update the last notified timestamp for a user."""
         try:
@@ -209,4 +324,231 @@ class Database:
                 
         except Exception as e:
             logger.error(f"Error updating last notified: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def set_topic_members(self, user_ids: List[int], topic: Optional[str]) -> int:
+        """Record that users joined `topic` (None: left their topic); returns the rows updated."""
+        if not user_ids:
+            return 0
+        try:
+            updated = 0
+            with self.SessionLocal() as session:
+                for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+                    result = session.execute(
+                        update(UserDB)
+                        .where(UserDB.id.in_(user_ids[start:start + BULK_CHUNK_SIZE]))
+                        .values(topic=topic)
+                        .execution_options(synchronize_session=False)
+                    )
+                    updated += result.rowcount
+                session.commit()
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error updating topic membership: {e}")
+            return 0
+    
+    def deactivate_users(self, user_ids: List[int]) -> int:
+        """Deactivate many users in one transaction; returns the rows updated."""
+        if not user_ids:
+            return 0
+        try:
+            updated = 0
+            with self.SessionLocal() as session:
+                for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+                    chunk = user_ids[start:start + BULK_CHUNK_SIZE]
+                    result = session.execute(
+                        update(UserDB)
+                        .where(UserDB.id.in_(chunk), UserDB.active == True)
+                        .values(active=False)
+                        .execution_options(synchronize_session=False)
+                    )
+                    updated += result.rowcount
+                session.commit()
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error bulk deactivating users: {e}")
+            return 0
+    
+    def enqueue_outbox(self, entries: List[Dict[str, Any]], timestamp: datetime) -> int:
+        """Queue outbox messages in one transaction.
+        
+        Each entry has a `kind`, an optional `user_id` and a JSON-serializable
+        `payload`; topic sends and subscriptions list their users in
+        `payload['user_ids']`.
+        Cooldowns start only when complete_outbox records a delivery, so a
+        message that goes dead leaves its users free to be notified again.
+        """
+        if not entries:
+            return 0
+        try:
+            with self.SessionLocal() as session:
+                rows = [
+                    {
+                        'kind': entry['kind'],
+                        'user_id': entry.get('user_id'),
+                        'payload': json.dumps(entry['payload']),
+                        'status': 'pending',
+                        'attempts': 0,
+                        'next_attempt_at': timestamp,
+                        'created_at': timestamp
+                    }
+                    for entry in entries
+                ]
+                for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                    session.execute(insert(OutboxDB), rows[start:start + BULK_CHUNK_SIZE])
+                session.commit()
+            return len(rows)
+            
+        except Exception as e:
+            logger.error(f"Error enqueueing outbox messages: {e}")
+            raise
+    
+    def pending_outbox_users(self, kinds: Tuple[str, ...] = ('user', 'topic')) -> List[int]:
+        """Users that a pending or in-flight message of one of `kinds` will reach.
+        
+        Notified users are not in cooldown until delivery, so the scheduler
+        leaves them out of new notifications until their message is sent or
+        dead; likewise for users with a topic subscription under way.
+        """
+        in_flight = OutboxDB.status.in_(('pending', 'sending'))
+        try:
+            with self.SessionLocal() as session:
+                user_ids = set()
+                if 'user' in kinds:
+                    user_ids.update(session.execute(
+                        select(OutboxDB.user_id).where(in_flight, OutboxDB.kind == 'user')
+                    ).scalars())
+                # Topic sends and subscriptions are one row per region topic, so the payloads read here are few
+                shared = [kind for kind in kinds if kind != 'user']
+                for payload in session.execute(
+                    select(OutboxDB.payload).where(in_flight, OutboxDB.kind.in_(shared))
+                ).scalars():
+                    user_ids.update(json.loads(payload).get('user_ids', []))
+                return sorted(user_ids)
+                
+        except Exception as e:
+            logger.error(f"Error reading pending outbox users: {e}")
+            raise
+    
+    def claim_outbox(self, limit: int, lease_s: float, now: Optional[datetime] = None) -> List[OutboxMessage]:
+        """Lease up to `limit` due messages, oldest first, for one delivery attempt."""
+        now = now or datetime.utcnow()
+        try:
+            with self.SessionLocal() as session:
+                due = or_(
+                    (OutboxDB.status == 'pending') & (OutboxDB.next_attempt_at <= now),
+                    (OutboxDB.status == 'sending') & (OutboxDB.locked_until <= now)
+                )
+                rows = session.execute(
+                    select(OutboxDB).where(due).order_by(OutboxDB.id).limit(limit)
+                    .with_for_update(skip_locked=True)
+                ).scalars().all()
+                if not rows:
+                    return []
+                
+                ids = [row.id for row in rows]
+                session.execute(
+                    update(OutboxDB)
+                    .where(OutboxDB.id.in_(ids))
+                    .values(status='sending', locked_until=now + timedelta(seconds=lease_s),
+                            attempts=OutboxDB.attempts + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                claimed = [
+                    OutboxMessage(
+                        id=row.id,
+                        kind=row.kind,
+                        user_id=row.user_id,
+                        payload=json.loads(row.payload),
+                        attempts=row.attempts + 1
+                    )
+                    for row in rows
+                ]
+                session.commit()
+                return claimed
+                
+        except Exception as e:
+            logger.error(f"Error claiming outbox messages: {e}")
+            return []
+    
+    def complete_outbox(self, message_ids: List[int], notified_user_ids: Optional[List[int]] = None,
+                        now: Optional[datetime] = None, left_user_ids: Optional[List[int]] = None) -> int:
+        """Mark messages as delivered and start the cooldown of the users they reached.
+        
+        Both happen in one transaction, so a user is never left with a sent
+        message but no cooldown. Users in `left_user_ids` have left their
+        region topic, so their topic is cleared too. Each column is set with
+        one UPDATE ... WHERE id IN (...) per BULK_CHUNK_SIZE users, so a storm
+        night with thousands of deliveries costs a handful of statements.
+        """
+        if not message_ids:
+            return 0
+        now = now or datetime.utcnow()
+        notified_user_ids = notified_user_ids or []
+        left_user_ids = left_user_ids or []
+        try:
+            updated = 0
+            with self.SessionLocal() as session:
+                for start in range(0, len(message_ids), BULK_CHUNK_SIZE):
+                    result = session.execute(
+                        update(OutboxDB)
+                        .where(OutboxDB.id.in_(message_ids[start:start + BULK_CHUNK_SIZE]))
+                        .values(status='sent', sent_at=now, locked_until=None, last_error=None)
+                        .execution_options(synchronize_session=False)
+                    )
+                    updated += result.rowcount
+                for start in range(0, len(notified_user_ids), BULK_CHUNK_SIZE):
+                    session.execute(
+                        update(UserDB)
+                        .where(UserDB.id.in_(notified_user_ids[start:start + BULK_CHUNK_SIZE]))
+                        .values(last_notified=now)
+                        .execution_options(synchronize_session=False)
+                    )
+                for start in range(0, len(left_user_ids), BULK_CHUNK_SIZE):
+                    session.execute(
+                        update(UserDB)
+                        .where(UserDB.id.in_(left_user_ids[start:start + BULK_CHUNK_SIZE]))
+                        .values(topic=None)
+                        .execution_options(synchronize_session=False)
+                    )
+                session.commit()
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error completing outbox messages: {e}")
+            return 0
+    
+    def fail_outbox(self, failures: List[Tuple[int, Optional[datetime], str]]) -> int:
+        """Record failed attempts as (id, next_attempt_at, error); no next attempt means dead."""
+        if not failures:
+            return 0
+        try:
+            with self.SessionLocal() as session:
+                session.execute(update(OutboxDB), [
+                    {
+                        'id': message_id,
+                        'status': 'pending' if next_attempt_at is not None else 'dead',
+                        'next_attempt_at': next_attempt_at or datetime.utcnow(),
+                        'locked_until': None,
+                        'last_error': (error or '')[:500]
+                    }
+                    for message_id, next_attempt_at, error in failures
+                ])
+                session.commit()
+            return len(failures)
+            
+        except Exception as e:
+            logger.error(f"Error recording outbox failures: {e}")
+            return 0
+    
+    def outbox_counts(self) -> Dict[str, int]:
+        """Number of outbox messages per status."""
+        try:
+            with self.SessionLocal() as session:
+                rows = session.query(OutboxDB.status, func.count(OutboxDB.id)).group_by(OutboxDB.status).all()
+                return {status: count for status, count in rows}
+        except Exception as e:
+            logger.error(f"Error counting outbox messages: {e}")
+            return {}
@@ -3,10 +3,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, RedirectResponse
 import logging
-from datetime import datetime
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Optional
 
-from .database import Database
+from .async_database import AsyncDatabase
+from ..notify.fcm_service import FCMService
+from ..notify.topics import region_topic
+from ..utils.config import settings
 from .schemas import (
     SubscribeRequest, 
     UpdatePreferencesRequest, 
@@ -18,10 +23,21 @@ from .schemas import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+db = AsyncDatabase()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db.init_database()
+    yield
+    await db.close()
+
+
 app = FastAPI(
     title="Aurora Alert API",
     description="Real-time aurora notifications based on location and preferences",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -32,24 +48,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-db = Database()
-
 # Mount static files for frontend
 frontend_path = Path(__file__).parent.parent.parent / "frontend"
 if frontend_path.exists():
     app.mount("/static", StaticFiles(directory=str(frontend_path)), name="static")
 
 
-def get_database():
+def get_database() -> AsyncDatabase:
     return db
 
 
+# Only needed for region-topic membership, so created on first use in topic mode
+fcm_service: Optional[FCMService] = None
+
+
+def get_fcm_service() -> Optional[FCMService]:
+    global fcm_service
+    if not settings.fcm_topic_mode:
+        return None
+    if fcm_service is None:
+        fcm_service = FCMService()
+    return fcm_service
+
+
+def in_cooldown(last_notified: Optional[datetime]) -> bool:
+    return last_notified is not None and datetime.utcnow() - last_notified < timedelta(hours=settings.cooldown_h)
+
+
 @app.post("/subscribe", response_model=SubscribeResponse)
-async def subscribe(request: SubscribeRequest, database: Database = Depends(get_database)):
+async def subscribe(request: SubscribeRequest, database: AsyncDatabase = Depends(get_database),
+                    fcm: Optional[FCMService] = Depends(get_fcm_service)):
     """Subscribe to aurora notifications."""
     try:
         # Check if user already exists
-        existing_user = database.get_user_by_token(request.token)
+        existing_user = await database.get_user_by_token(request.token)
         if existing_user:
             return SubscribeResponse(
                 success=False,
@@ -57,7 +89,7 @@ async def subscribe(request: SubscribeRequest, database: Database = Depends(get_
             )
         
         # Add new user
-        user = database.add_user(
+        user = await database.add_user(
             lat=request.lat,
             lon=request.lon,
             radius_km=request.radius_km,
@@ -67,6 +99,11 @@ async def subscribe(request: SubscribeRequest, database: Database = Depends(get_
         
         if user:
             logger.info(f"New user subscribed: {user.id} at {user.lat},{user.lon}")
+            # A failed subscription is retried by the scheduler, which only counts confirmed members
+            if fcm is not None:
+                topic = region_topic(user.lat, user.lon, user.threshold, settings.fcm_topic_precision)
+                if await fcm.update_topic_membership([user.fcm_token], topic, subscribe=True):
+                    await database.set_topic(user.fcm_token, topic)
             return SubscribeResponse(
                 success=True,
                 message="Successfully subscribed to aurora notifications",
@@ -85,16 +122,17 @@ async def subscribe(request: SubscribeRequest, database: Database = Depends(get_
 
 @app.patch("/prefs")
 async def update_preferences(request: UpdatePreferencesRequest, 
-                           token: str, database: Database = Depends(get_database)):
+                           token: str, database: AsyncDatabase = Depends(get_database),
+                           fcm: Optional[FCMService] = Depends(get_fcm_service)):
     """Update user preferences."""
     try:
         # Check if user exists
-        user = database.get_user_by_token(token)
+        user = await database.get_user_by_token(token)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Update preferences
-        success = database.update_user_preferences(
+        success = await database.update_user_preferences(
             fcm_token=token,
             radius_km=request.radius_km,
             threshold=request.threshold
@@ -102,6 +140,17 @@ async def update_preferences(request: UpdatePreferencesRequest,
         
         if success:
             logger.info(f"Updated preferences for user {user.id}")
+            
+            # A new threshold band moves the user to another region topic; during the
+            # cooldown they stay out of topics and the scheduler resubscribes them later
+            if fcm is not None and request.threshold is not None:
+                old_topic = region_topic(user.lat, user.lon, user.threshold, settings.fcm_topic_precision)
+                new_topic = region_topic(user.lat, user.lon, request.threshold, settings.fcm_topic_precision)
+                if new_topic != old_topic:
+                    await fcm.update_topic_membership([token], old_topic, subscribe=False)
+                    joined = (not in_cooldown(user.last_notified)
+                              and await fcm.update_topic_membership([token], new_topic, subscribe=True) > 0)
+                    await database.set_topic(token, new_topic if joined else None)
             return {"success": True, "message": "Preferences updated successfully"}
         else:
             raise HTTPException(status_code=400, detail="Failed to update preferences")
@@ -114,19 +163,23 @@ async def update_preferences(request: UpdatePreferencesRequest,
 
 
 @app.delete("/unsubscribe")
-async def unsubscribe(request: UnsubscribeRequest, database: Database = Depends(get_database)):
+async def unsubscribe(request: UnsubscribeRequest, database: AsyncDatabase = Depends(get_database),
+                      fcm: Optional[FCMService] = Depends(get_fcm_service)):
     """Unsubscribe from aurora notifications."""
     try:
         # Check if user exists
-        user = database.get_user_by_token(request.token)
+        user = await database.get_user_by_token(request.token)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Deactivate user
-        success = database.deactivate_user(request.token)
+        success = await database.deactivate_user(request.token)
         
         if success:
             logger.info(f"User {user.id} unsubscribed")
+            if fcm is not None:
+                topic = region_topic(user.lat, user.lon, user.threshold, settings.fcm_topic_precision)
+                await fcm.update_topic_membership([request.token], topic, subscribe=False)
             return {"success": True, "message": "Successfully unsubscribed"}
         else:
             raise HTTPException(status_code=400, detail="Failed to unsubscribe")
@@ -139,10 +192,10 @@ async def unsubscribe(request: UnsubscribeRequest, database: Database = Depends(
 
 
 @app.get("/status", response_model=StatusResponse)
-async def get_status(database: Database = Depends(get_database)):
+async def get_status(database: AsyncDatabase = Depends(get_database)):
     """Get API health status."""
     try:
-        active_users = len(database.get_active_users())
+        active_users = await database.count_active_users()
         
         return StatusResponse(
             status="healthy",
@@ -0,0 +1,120 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_KEY = 7_417_222
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+@dataclass
+class Migration:
+    """One schema step; `apply` runs inside the migration transaction.
+
+    A fresh database gets today's model definitions from the first steps,
+    so every step must tolerate finding its change already in place
+    (create with checkfirst, inspect before altering).
+    """
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+def _create_tables(*tables) -> Callable[[Connection], None]:
+    def apply(connection: Connection):
+        for table in tables:
+            table.create(connection, checkfirst=True)
+    return apply
+
+
+def _create_indexes(*indexes) -> Callable[[Connection], None]:
+    def apply(connection: Connection):
+        for index in indexes:
+            index.create(connection, checkfirst=True)
+    return apply
+
+
+def _add_columns(table: Table, *names: str) -> Callable[[Connection], None]:
+    def apply(connection: Connection):
+        existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+        for name in names:
+            if name not in existing:
+                column = CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column}"))
+    return apply
+
+
+def migrations() -> List[Migration]:
+    """Every schema step in version order; versions are never reused or renumbered."""
+    from .database import AlertDB, OutboxDB, UserDB
+
+    return [
+        Migration(1, 'users and alerts tables', _create_tables(UserDB.__table__, AlertDB.__table__)),
+        Migration(2, 'notification outbox', _create_tables(OutboxDB.__table__)),
+        Migration(3, 'indexes for active users, alerts per user and due outbox messages', _create_indexes(
+            *UserDB.__table__.indexes, *AlertDB.__table__.indexes, *OutboxDB.__table__.indexes
+        )),
+        # Existing users start as non-members; the scheduler subscribes them on its next cycle
+        Migration(4, 'confirmed region topic per user', _add_columns(UserDB.__table__, 'topic')),
+    ]
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    """Versions recorded in schema_migrations, oldest first."""
+    with engine.connect() as connection:
+        if not engine.dialect.has_table(connection, schema_migrations.name):
+            return []
+        return list(connection.execute(select(schema_migrations.c.version).order_by('version')).scalars())
+
+
+def apply_migrations(connection: Connection, steps: Optional[List[Migration]] = None) -> int:
+    """Apply pending migrations on an open transaction and return how many ran.
+
+    Databases created by create_all before versioning existed have no
+    schema_migrations table; they replay every step, and the steps only add
+    what is missing. On PostgreSQL an advisory lock serializes the API and
+    the scheduler when both start at once. The SQLite drivers only open a
+    transaction before DML and let DDL autocommit, so on SQLite the
+    transaction is begun explicitly; BEGIN IMMEDIATE also takes the write
+    lock, serializing concurrent migrations the same way. `connection`
+    must not have run any statement yet.
+    """
+    steps = sorted(steps if steps is not None else migrations(), key=lambda step: step.version)
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+    elif connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    schema_migrations.create(connection, checkfirst=True)
+    applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+    pending = [step for step in steps if step.version not in applied]
+    for step in pending:
+        step.apply(connection)
+        connection.execute(insert(schema_migrations).values(
+            version=step.version, name=step.name, applied_at=datetime.utcnow()
+        ))
+        logger.info(f"Applied schema migration {step.version}: {step.name}")
+    return len(pending)
+
+
+def migrate(engine: Engine, steps: Optional[List[Migration]] = None) -> int:
+    """Apply pending migrations in one transaction and return how many ran.
+    
+    A step that fails rolls back every step of the run with it, schema
+    changes included, so no version is left half applied.
+    """
+    with engine.begin() as connection:
+        return apply_migrations(connection, steps)
@@ -1,17 +1,28 @@
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Union
 import numpy as np
 from geopy.distance import geodesic
-from astral import LocationInfo
-from astral.sun import sun
+import hashlib
 import logging
+import os
 
 from .models import User, AuroraAlert
+from .geo import geohash_codes, geohash_to_code, haversine_km, index_weather, lookup_weather
+from .batch import BatchDecision, UserBatch, to_epoch
+from .disk_fields import DiskFields
+from .gate import band_upper_bound
+from .grid import AuroraGrid
+from .parallel import ShardedEvaluator
+from .solar import night_mask
+from .spatial_index import GridIndex
 from ..utils.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Below this many users per worker, process startup and IPC outweigh the parallel speedup
+MIN_USERS_PER_SHARD = 2000
+
 
 class AuroraEngine:
     def __init__(self):
@@ -19,13 +30,60 @@ class AuroraEngine:
         self.prob_threshold = settings.prob_threshold
         self.cloud_max = settings.cloud_max
         self.cooldown_h = settings.cooldown_h
+        self.distance_method = settings.distance_method
+        self.use_disk_fields = settings.use_disk_fields
+        self.radius_buckets_km = settings.radius_buckets_km
+        self._disk_fields: Optional[DiskFields] = None
+        self._disk_fields_grid: Optional[AuroraGrid] = None
+        self.workers = settings.engine_workers or os.cpu_count() or 1
+        self._sharded: Optional[ShardedEvaluator] = None
+        self.gate_max_kp = settings.gate_max_kp
     
     def find_nearby_aurora_cells(self, user_lat: float, user_lon: float, 
-                                aurora_df: pd.DataFrame, radius_km: int) -> pd.DataFrame:
+                                aurora_df: Union[pd.DataFrame, AuroraGrid], radius_km: int) -> pd.DataFrame:
         """Find aurora grid cells within radius of user location."""
+        if isinstance(aurora_df, AuroraGrid):
+            lats, lons, probs, distances = aurora_df.query_radius(user_lat, user_lon, radius_km)
+            return pd.DataFrame({
+                'lat': lats,
+                'lon': lons,
+                'prob': probs,
+                'power': 0.0,
+                'distance_km': distances
+            })
+        
         if aurora_df is None or aurora_df.empty:
             return pd.DataFrame()
         
+        if self.distance_method == "geodesic":
+            return self._find_nearby_cells_geodesic(user_lat, user_lon, aurora_df, radius_km)
+        
+        return self._find_nearby_cells_haversine(user_lat, user_lon, aurora_df, radius_km)
+    
+    def _find_nearby_cells_haversine(self, user_lat: float, user_lon: float,
+                                     aurora_df: pd.DataFrame, radius_km: int) -> pd.DataFrame:
+        """Vectorized great-circle scan of the whole grid (within 0.6% of geodesic)."""
+        lats = aurora_df['lat'].to_numpy(dtype=float)
+        lons = aurora_df['lon'].to_numpy(dtype=float)
+        distances = haversine_km(user_lat, user_lon, lats, lons)
+        mask = distances <= radius_km
+        
+        if 'power' in aurora_df.columns:
+            power = aurora_df['power'].to_numpy()[mask]
+        else:
+            power = 0
+        
+        return pd.DataFrame({
+            'lat': lats[mask],
+            'lon': lons[mask],
+            'prob': aurora_df['prob'].to_numpy()[mask],
+            'power': power,
+            'distance_km': distances[mask]
+        })
+    
+    def _find_nearby_cells_geodesic(self, user_lat: float, user_lon: float,
+                                    aurora_df: pd.DataFrame, radius_km: int) -> pd.DataFrame:
+        """Reference implementation using an ellipsoidal geodesic per cell."""
         user_location = (user_lat, user_lon)
         nearby_cells = []
         
@@ -56,26 +114,8 @@ class AuroraEngine:
     
     def is_nighttime(self, lat: float, lon: float, timestamp: datetime) -> bool:
         """Check if it's nighttime (sun altitude < -6°) for aurora visibility."""
-        try:
-            location = LocationInfo(latitude=lat, longitude=lon)
-            s = sun(location.observer, date=timestamp.date())
-            
-            # Check if current time is between sunset and sunrise
-            if s['sunset'] <= timestamp.time() or timestamp.time() <= s['sunrise']:
-                return True
-            
-            # Also check sun altitude for twilight
-            from astral.sun import elevation
-            sun_elevation = elevation(location.observer, timestamp)
-            
-            # Civil twilight threshold (-6°) for aurora visibility
-            return sun_elevation < -6
-            
-        except Exception as e:
-            logger.warning(f"Error calculating sun position for {lat},{lon}: {e}")
-            # Default to nighttime if we can't calculate
-            hour = timestamp.hour
-            return hour < 6 or hour > 18
+        _, is_night = night_mask(lat, lon, timestamp)
+        return bool(is_night)
     
     def should_notify_user(self, user: User, max_prob: float, mean_prob: float, 
                           cloud_coverage: float, is_night: bool, timestamp: datetime) -> bool:
@@ -106,7 +146,7 @@ class AuroraEngine:
         logger.info(f"User {user.id}: All criteria met for notification")
         return True
     
-    def process_user_alert(self, user: User, aurora_df: pd.DataFrame, 
+    def process_user_alert(self, user: User, aurora_df: Union[pd.DataFrame, AuroraGrid], 
                           cloud_coverage: float, timestamp: datetime) -> AuroraAlert:
         """Process aurora alert logic for a single user."""
         
@@ -118,8 +158,16 @@ class AuroraEngine:
         # Calculate probabilities
         max_prob, mean_prob = self.calculate_aurora_probability(nearby_cells)
         
+        return self.build_alert(user, max_prob, mean_prob, cloud_coverage, timestamp)
+    
+    def build_alert(self, user: User, max_prob: float, mean_prob: float,
+                    cloud_coverage: float, timestamp: datetime,
+                    is_night: Optional[bool] = None) -> AuroraAlert:
+        """Apply the night and notification rules to precomputed probabilities."""
+        
         # Check if it's nighttime
-        is_night = self.is_nighttime(user.lat, user.lon, timestamp)
+        if is_night is None:
+            is_night = self.is_nighttime(user.lat, user.lon, timestamp)
         
         # Determine if user should be notified
         should_notify = self.should_notify_user(
@@ -136,23 +184,227 @@ class AuroraEngine:
             timestamp=timestamp
         )
     
-    def process_all_users(self, users: List[User], aurora_df: pd.DataFrame, 
+    def get_disk_fields(self, grid: AuroraGrid) -> DiskFields:
+        """Disk fields for a grid, computed once per grid update."""
+        if self._disk_fields is None or self._disk_fields_grid is not grid:
+            self._disk_fields = DiskFields(grid, self.radius_buckets_km)
+            self._disk_fields_grid = grid
+        return self._disk_fields
+    
+    def _weather_index(self, weather_data: dict) -> dict:
+        """Weather results keyed by quantized location for O(1) lookup."""
+        weather_index = weather_data.get('index')
+        if weather_index is None:
+            weather_index = index_weather(weather_data.get('weather_data', []))
+        return weather_index
+    
+    def resolve_cloud_coverage(self, batch: UserBatch, weather_data: dict) -> np.ndarray:
+        """Cloud coverage per user, defaulting to 100% where no weather matched."""
+        if weather_data.get('tiles') is not None:
+            return self._tile_cloud_coverage(batch, weather_data['tiles'], weather_data['tile_precision'])
+        
+        weather_index = self._weather_index(weather_data)
+        cloud_coverage = np.empty(len(batch))
+        for i, (lat, lon) in enumerate(zip(batch.lat.tolist(), batch.lon.tolist())):
+            user_weather = lookup_weather(weather_index, lat, lon)
+            cloud_coverage[i] = user_weather['current_clouds'] if user_weather else 100
+        return cloud_coverage
+    
+    def _tile_cloud_coverage(self, batch: UserBatch, tiles: dict, precision: int) -> np.ndarray:
+        """Cloud coverage per user from the weather of the geohash tile they fall in."""
+        cloud_coverage = np.full(len(batch), 100.0)
+        if not tiles:
+            return cloud_coverage
+        
+        tile_codes = np.array([geohash_to_code(tile) for tile in tiles], dtype=np.int64)
+        clouds = np.array([result['current_clouds'] for result in tiles.values()], dtype=float)
+        order = np.argsort(tile_codes)
+        tile_codes, clouds = tile_codes[order], clouds[order]
+        
+        codes = geohash_codes(batch.lat, batch.lon, precision)
+        positions = np.minimum(np.searchsorted(tile_codes, codes), len(tile_codes) - 1)
+        found = tile_codes[positions] == codes
+        cloud_coverage[found] = clouds[positions[found]]
+        return cloud_coverage
+    
+    def evaluate_batch(self, batch: UserBatch, aurora_df: Union[pd.DataFrame, AuroraGrid],
+                       weather_data: dict, timestamp: datetime,
+                       cloud_coverage: Optional[np.ndarray] = None) -> BatchDecision:
+        """Evaluate a columnar user batch and return decision vectors."""
+        if cloud_coverage is None:
+            cloud_coverage = self.resolve_cloud_coverage(batch, weather_data)
+        
+        # Large batches on a raster are split across the worker pool
+        if (self.workers > 1 and isinstance(aurora_df, AuroraGrid)
+                and len(batch) >= self.workers * MIN_USERS_PER_SHARD):
+            if self._sharded is None:
+                self._sharded = ShardedEvaluator(self.workers)
+            engine_params = {
+                'cloud_max': self.cloud_max,
+                'cooldown_h': self.cooldown_h,
+                'use_disk_fields': self.use_disk_fields,
+                'radius_buckets_km': self.radius_buckets_km
+            }
+            return self._sharded.evaluate(engine_params, batch, aurora_df, cloud_coverage, timestamp)
+        
+        return self.evaluate_shard(batch, aurora_df, cloud_coverage, timestamp)
+    
+    def probabilities(self, batch: UserBatch,
+                      aurora_df: Union[pd.DataFrame, AuroraGrid]) -> Tuple[np.ndarray, np.ndarray]:
+        """Max and mean aurora probability within each user's radius."""
+        n = len(batch)
+        
+        # Rasters are indexed directly; frames get a spatial index built once per call
+        cells = aurora_df if isinstance(aurora_df, AuroraGrid) else GridIndex(aurora_df)
+        
+        max_prob = np.zeros(n)
+        mean_prob = np.zeros(n)
+        pending = np.ones(n, dtype=bool)
+        
+        # Users whose radius matches a bucket read precomputed disk fields instead
+        if self.use_disk_fields and isinstance(cells, AuroraGrid):
+            fields = self.get_disk_fields(cells)
+            for radius in np.unique(batch.radius_km):
+                selected = batch.radius_km == radius
+                found = fields.lookup_many(batch.lat[selected], batch.lon[selected], int(radius))
+                if found is not None:
+                    max_prob[selected], mean_prob[selected] = found
+                    pending[selected] = False
+        
+        lats = batch.lat.tolist()
+        lons = batch.lon.tolist()
+        radii = batch.radius_km.tolist()
+        for i in np.nonzero(pending)[0].tolist():
+            probs = cells.probabilities_within(lats[i], lons[i], radii[i])
+            if len(probs):
+                max_prob[i] = probs.max()
+                mean_prob[i] = probs.mean()
+        
+        return max_prob, mean_prob
+    
+    def evaluate_shard(self, batch: UserBatch, aurora_df: Union[pd.DataFrame, AuroraGrid],
+                       cloud_coverage: np.ndarray, timestamp: datetime) -> BatchDecision:
+        """Evaluate users in this process given their resolved cloud coverage."""
+        max_prob, mean_prob = self.probabilities(batch, aurora_df)
+        
+        # Day/night for every user in one vectorized pass
+        _, is_night = night_mask(batch.lat, batch.lon, timestamp)
+        
+        return self.decide(batch, max_prob, mean_prob, cloud_coverage, is_night, timestamp)
+    
+    def cooled_down(self, batch: UserBatch, timestamp: datetime) -> np.ndarray:
+        """Users whose last notification is older than the cooldown period."""
+        since_last = to_epoch(timestamp) - batch.last_notified
+        return np.isnan(batch.last_notified) | (since_last >= self.cooldown_h * 3600)
+    
+    def decide(self, batch: UserBatch, max_prob: np.ndarray, mean_prob: np.ndarray,
+               cloud_coverage: np.ndarray, is_night: np.ndarray, timestamp: datetime) -> BatchDecision:
+        """Apply the notification rule to per-user inputs as array expressions."""
+        notify = (
+            (max_prob >= batch.threshold)
+            & is_night
+            & (cloud_coverage <= self.cloud_max)
+            & self.cooled_down(batch, timestamp)
+        )
+        logger.info(f"Evaluated {len(batch)} users: {int(notify.sum())} meet all notification criteria")
+        
+        return BatchDecision(
+            user_id=batch.id,
+            max_prob=max_prob,
+            mean_prob=mean_prob,
+            cloud_coverage=cloud_coverage,
+            is_night=is_night,
+            notify=notify,
+            timestamp=timestamp
+        )
+    
+    def could_any_user_qualify(self, batch: UserBatch, aurora_df: Union[pd.DataFrame, AuroraGrid],
+                               timestamp: datetime, kp: Optional[float] = None) -> bool:
+        """Cheap pre-pass: False only when no user can possibly be notified this cycle.
+        
+        Uses only the grid, the clock and user columns - no weather - so a quiet
+        cycle can end before any weather calls. A Kp at or above gate_max_kp
+        disables the shortcut, so a developing storm is always fully evaluated.
+        """
+        if not isinstance(aurora_df, AuroraGrid) or len(batch) == 0:
+            return len(batch) > 0
+        
+        if kp is not None and kp >= self.gate_max_kp:
+            logger.info(f"Gate bypassed: Kp {kp} >= {self.gate_max_kp}")
+            return True
+        
+        # Global check first: nothing on the grid reaches the lowest threshold
+        grid_max = float(aurora_df.prob.max())
+        if grid_max < batch.threshold.min():
+            logger.info(f"Gate closed: grid max {grid_max:.0f}% below every threshold (Kp {kp})")
+            return False
+        
+        possible = int(self.notification_candidates(batch, aurora_df, timestamp).sum())
+        if not possible:
+            logger.info(f"Gate closed: no user out of cooldown has darkness and a latitude band "
+                        f"reaching their threshold (Kp {kp})")
+            return False
+        
+        logger.info(f"Gate open: {possible} users could qualify (Kp {kp})")
+        return True
+    
+    def notification_candidates(self, batch: UserBatch, aurora_df: Union[pd.DataFrame, AuroraGrid],
+                                timestamp: datetime) -> np.ndarray:
+        """Mask of users who could be notified, judged without weather or radius queries.
+        
+        A superset of what evaluation notifies: users in darkness, out of
+        cooldown, and (on a raster) whose band_upper_bound reaches their
+        threshold. It costs a few array operations per user.
+        """
+        _, is_night = night_mask(batch.lat, batch.lon, timestamp)
+        candidates = is_night & self.cooled_down(batch, timestamp)
+        if isinstance(aurora_df, AuroraGrid) and candidates.any():
+            bound = band_upper_bound(aurora_df, batch.lat[candidates], batch.radius_km[candidates].astype(float))
+            candidates[candidates] = bound >= batch.threshold[candidates]
+        return candidates
+    
+    def input_fingerprint(self, batch: UserBatch, aurora_df: Union[pd.DataFrame, AuroraGrid],
+                          weather_data: dict, timestamp: datetime) -> Optional[str]:
+        """Digest of everything a cycle's decisions depend on, or None if the grid is unversioned.
+        
+        Two cycles with the same fingerprint produce the same decisions: same
+        grid version, users, cloud values, and day/night and cooldown state.
+        """
+        version = getattr(aurora_df, 'version', None)
+        if version is None:
+            return None
+        
+        digest = hashlib.blake2b(version.encode(), digest_size=16)
+        for column in (batch.id, batch.lat, batch.lon, batch.radius_km, batch.threshold, batch.last_notified):
+            digest.update(np.ascontiguousarray(column).tobytes())
+        
+        # Clouds as each user will see them, however the weather is keyed
+        digest.update(self.resolve_cloud_coverage(batch, weather_data).tobytes())
+        
+        _, is_night = night_mask(batch.lat, batch.lon, timestamp)
+        digest.update(np.packbits(is_night).tobytes())
+        digest.update(np.packbits(self.cooled_down(batch, timestamp)).tobytes())
+        return digest.hexdigest()
+    
+    def close(self):
+        """Shut down the worker pool, if one was started."""
+        if self._sharded is not None:
+            self._sharded.close()
+            self._sharded = None
+    
+    def process_all_users(self, users: List[User], aurora_df: Union[pd.DataFrame, AuroraGrid], 
                          weather_data: dict, timestamp: datetime) -> List[AuroraAlert]:
         """Process aurora alerts for all users."""
+        if self.distance_method != "geodesic":
+            decision = self.evaluate_batch(UserBatch.from_users(users), aurora_df, weather_data, timestamp)
+            return [decision.alert(i) for i in range(len(decision))]
+        
         alerts = []
+        # Same per-user weather resolution as the batch path
+        cloud_coverage = self.resolve_cloud_coverage(UserBatch.from_users(users), weather_data)
         
-        for user in users:
-            # Find weather data for this user's location
-            user_weather = None
-            for weather in weather_data.get('weather_data', []):
-                if (abs(weather['lat'] - user.lat) < 0.1 and 
-                    abs(weather['lon'] - user.lon) < 0.1):
-                    user_weather = weather
-                    break
-            
-            cloud_coverage = user_weather['current_clouds'] if user_weather else 100
-            
-            alert = self.process_user_alert(user, aurora_df, cloud_coverage, timestamp)
+        for user, clouds in zip(users, cloud_coverage.tolist()):
+            alert = self.process_user_alert(user, aurora_df, clouds, timestamp)
             alerts.append(alert)
         
         return alerts
\ No newline at end of file
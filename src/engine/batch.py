@@ -0,0 +1,149 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+import numpy as np
+
+from .models import User, AuroraAlert
+
+
+def to_epoch(timestamp: Optional[datetime]) -> float:
+    """Seconds since the epoch, treating naive datetimes as UTC; NaN for None."""
+    if timestamp is None:
+        return np.nan
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+@dataclass
+class UserBatch:
+    """Columnar view of the users the engine needs to evaluate.
+
+    last_notified holds epoch seconds, NaN for users never notified.
+    fcm_token and topic (the region topic a user is a confirmed member of,
+    None otherwise) are only carried for the scheduler to address
+    notifications; the engine never reads them.
+    """
+    id: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    radius_km: np.ndarray
+    threshold: np.ndarray
+    last_notified: np.ndarray
+    fcm_token: Optional[np.ndarray] = None
+    topic: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    @classmethod
+    def from_users(cls, users: List[User]) -> 'UserBatch':
+        n = len(users)
+        return cls(
+            id=np.fromiter((-1 if u.id is None else u.id for u in users), dtype=np.int64, count=n),
+            lat=np.fromiter((u.lat for u in users), dtype=np.float64, count=n),
+            lon=np.fromiter((u.lon for u in users), dtype=np.float64, count=n),
+            radius_km=np.fromiter((u.radius_km for u in users), dtype=np.int64, count=n),
+            threshold=np.fromiter((u.threshold for u in users), dtype=np.float64, count=n),
+            last_notified=np.fromiter((to_epoch(u.last_notified) for u in users), dtype=np.float64, count=n),
+            fcm_token=np.array([u.fcm_token for u in users], dtype=object)
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[tuple]) -> 'UserBatch':
+        """Batch from (id, lat, lon, radius_km, threshold, last_notified, fcm_token, topic) rows."""
+        n = len(rows)
+        ids, lats, lons, radii, thresholds, last_notified, tokens, topics = zip(*rows) if n else ((),) * 8
+        return cls(
+            id=np.fromiter(ids, dtype=np.int64, count=n),
+            lat=np.fromiter(lats, dtype=np.float64, count=n),
+            lon=np.fromiter(lons, dtype=np.float64, count=n),
+            radius_km=np.fromiter(radii, dtype=np.int64, count=n),
+            threshold=np.fromiter(thresholds, dtype=np.float64, count=n),
+            last_notified=np.fromiter((to_epoch(t) for t in last_notified), dtype=np.float64, count=n),
+            fcm_token=np.array(tokens, dtype=object),
+            topic=np.array(topics, dtype=object)
+        )
+
+    @classmethod
+    def concat(cls, batches: List['UserBatch']) -> 'UserBatch':
+        """One batch from several chunks, in order."""
+        if not batches:
+            return cls.from_users([])
+        tokens = [batch.fcm_token for batch in batches]
+        topics = [batch.topic for batch in batches]
+        return cls(
+            id=np.concatenate([batch.id for batch in batches]),
+            lat=np.concatenate([batch.lat for batch in batches]),
+            lon=np.concatenate([batch.lon for batch in batches]),
+            radius_km=np.concatenate([batch.radius_km for batch in batches]),
+            threshold=np.concatenate([batch.threshold for batch in batches]),
+            last_notified=np.concatenate([batch.last_notified for batch in batches]),
+            fcm_token=None if any(t is None for t in tokens) else np.concatenate(tokens),
+            topic=None if any(t is None for t in topics) else np.concatenate(topics)
+        )
+
+    def user(self, i: int) -> User:
+        """Materialize the pydantic user at one position (needs fcm_token)."""
+        last_notified = self.last_notified[i]
+        return User(
+            id=int(self.id[i]),
+            lat=float(self.lat[i]),
+            lon=float(self.lon[i]),
+            radius_km=int(self.radius_km[i]),
+            threshold=int(self.threshold[i]),
+            fcm_token=self.fcm_token[i],
+            last_notified=None if np.isnan(last_notified) else datetime.fromtimestamp(last_notified, timezone.utc)
+        )
+
+    def take(self, positions: np.ndarray) -> 'UserBatch':
+        """Subset of the batch at the given positions."""
+        return UserBatch(
+            id=self.id[positions],
+            lat=self.lat[positions],
+            lon=self.lon[positions],
+            radius_km=self.radius_km[positions],
+            threshold=self.threshold[positions],
+            last_notified=self.last_notified[positions],
+            fcm_token=None if self.fcm_token is None else self.fcm_token[positions],
+            topic=None if self.topic is None else self.topic[positions]
+        )
+
+
+@dataclass
+class BatchDecision:
+    """Per-user engine outputs as parallel arrays, aligned with the input batch."""
+    user_id: np.ndarray
+    max_prob: np.ndarray
+    mean_prob: np.ndarray
+    cloud_coverage: np.ndarray
+    is_night: np.ndarray
+    notify: np.ndarray
+    timestamp: datetime
+
+    def __len__(self) -> int:
+        return len(self.user_id)
+
+    def alert(self, i: int) -> AuroraAlert:
+        """Materialize the pydantic alert for one user."""
+        return AuroraAlert(
+            user_id=int(self.user_id[i]),
+            max_prob=float(self.max_prob[i]),
+            mean_prob=float(self.mean_prob[i]),
+            cloud_coverage=float(self.cloud_coverage[i]),
+            is_night=bool(self.is_night[i]),
+            should_notify=bool(self.notify[i]),
+            timestamp=self.timestamp
+        )
+
+    def group_alert(self, positions: np.ndarray) -> AuroraAlert:
+        """One alert summarizing several users, for a shared topic message; user_id is 0."""
+        return AuroraAlert(
+            user_id=0,
+            max_prob=float(self.max_prob[positions].max()),
+            mean_prob=float(self.mean_prob[positions].mean()),
+            cloud_coverage=float(self.cloud_coverage[positions].mean()),
+            is_night=bool(self.is_night[positions].all()),
+            should_notify=True,
+            timestamp=self.timestamp
+        )
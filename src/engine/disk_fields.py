@@ -0,0 +1,160 @@
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+
+from .geo import EARTH_RADIUS_KM, haversine_km
+from .grid import AuroraGrid, LATS, N_LAT, N_LON
+
+# Sparse-table levels: windows of 1, 2, 4, ... 256 longitude cells
+_LEVELS = int(np.floor(np.log2(N_LON))) + 1
+# Smallest radius given a field: one grid step of latitude. Smaller disks hold
+# a handful of cells that depend on where the user sits between nodes, so
+# those users are cheaper and far more accurate on the exact path.
+MIN_FIELD_RADIUS_KM = int(np.ceil(np.radians(1.0) * EARTH_RADIUS_KM))
+
+
+def _disk_half_widths(radius_km: float) -> Dict[int, np.ndarray]:
+    """Longitude half-width of the disk on each source row, keyed by row offset.
+
+    For a disk centred on target row i, source row i + offset contributes the
+    cells within +/- w[i] longitude steps; w[i] == -1 means the row is outside
+    the disk. Widths depend on latitude, which is what makes the filter exact
+    on the sphere rather than a flat-earth approximation.
+    """
+    max_offset = int(np.ceil(np.degrees(radius_km / EARTH_RADIUS_KM))) + 1
+    steps = np.arange(N_LON // 2 + 1, dtype=np.float64)
+    widths = {}
+
+    for offset in range(-max_offset, max_offset + 1):
+        target = np.arange(N_LAT)
+        source = target + offset
+        valid = (source >= 0) & (source < N_LAT)
+
+        w = np.full(N_LAT, -1, dtype=np.int64)
+        distances = haversine_km(
+            LATS[target[valid]][:, np.newaxis], 0.0,
+            LATS[source[valid]][:, np.newaxis], steps[np.newaxis, :]
+        )
+        # Distance grows monotonically with the longitude step on [0, 180]
+        w[valid] = (distances <= radius_km).sum(axis=1) - 1
+        widths[offset] = w
+
+    return widths
+
+
+class DiskFields:
+    """Max/mean aurora probability within R km of every grid cell, per radius bucket.
+
+    Built once per grid update with latitude-aware separable disk filters:
+    each disk is decomposed into one longitude window per source row, windowed
+    maxima come from a circular sparse table and windowed sums from circular
+    prefix sums. Fields are exact at grid nodes; users between nodes read the
+    four nodes around them, taking the largest max_prob and interpolating
+    mean_prob bilinearly.
+    """
+
+    def __init__(self, grid: AuroraGrid, radii_km: Iterable[int]):
+        self.forecast_time = grid.forecast_time
+        rows = grid.prob.T.astype(np.float64)  # (lat, lon)
+
+        # table[k][j, c] = max(rows[j, c : c + 2**k]) with circular wrap
+        table = np.empty((_LEVELS, N_LAT, N_LON))
+        table[0] = rows
+        for k in range(1, _LEVELS):
+            table[k] = np.maximum(table[k - 1], np.roll(table[k - 1], -(1 << (k - 1)), axis=1))
+
+        # prefix[j, x] = sum(row j tiled three times)[:x]
+        prefix = np.zeros((N_LAT, 3 * N_LON + 1))
+        prefix[:, 1:] = np.cumsum(np.tile(rows, 3), axis=1)
+
+        self.max_prob: Dict[int, np.ndarray] = {}
+        self.mean_prob: Dict[int, np.ndarray] = {}
+        for radius in sorted(set(int(r) for r in radii_km if r >= MIN_FIELD_RADIUS_KM)):
+            self.max_prob[radius], self.mean_prob[radius] = self._filter(
+                table, prefix, rows.max(axis=1), radius
+            )
+
+    @staticmethod
+    def _filter(table: np.ndarray, prefix: np.ndarray, row_max: np.ndarray,
+                radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        cols = np.arange(N_LON)[np.newaxis, :]
+        disk_max = np.full((N_LAT, N_LON), -np.inf)
+        disk_sum = np.zeros((N_LAT, N_LON))
+        disk_count = np.zeros((N_LAT, 1))
+
+        for offset, w in _disk_half_widths(radius_km).items():
+            target = np.nonzero(w >= 0)[0]
+            if not len(target):
+                continue
+            source = target + offset
+            w = w[target][:, np.newaxis]
+            length = np.minimum(2 * w + 1, N_LON)
+            full = length >= N_LON
+
+            # Two overlapping power-of-two windows cover [c - w, c + w]
+            level = np.floor(np.log2(length)).astype(np.int64)
+            left = np.mod(cols - w, N_LON)
+            right = np.mod(cols + w - (1 << level) + 1, N_LON)
+            window_max = np.maximum(
+                table[level, source[:, np.newaxis], left],
+                table[level, source[:, np.newaxis], right]
+            )
+            window_max = np.where(full, row_max[source][:, np.newaxis], window_max)
+
+            start = np.where(full, N_LON, cols - w + N_LON)
+            end = np.where(full, 2 * N_LON, cols + w + N_LON + 1)
+            window_sum = (
+                np.take_along_axis(prefix[source], end, axis=1)
+                - np.take_along_axis(prefix[source], start, axis=1)
+            )
+
+            disk_max[target] = np.maximum(disk_max[target], window_max)
+            disk_sum[target] += window_sum
+            disk_count[target] += length
+
+        disk_max = np.where(np.isfinite(disk_max), disk_max, 0.0)
+        disk_mean = disk_sum / np.maximum(disk_count, 1)
+        return disk_max.T.astype(np.float32), disk_mean.T.astype(np.float32)
+
+    def lookup(self, lat: float, lon: float, radius_km: int) -> Optional[Tuple[float, float]]:
+        """Max and mean probability within radius_km, or None if the radius has no field."""
+        found = self.lookup_many(np.array([lat]), np.array([lon]), radius_km)
+        if found is None:
+            return None
+        return float(found[0][0]), float(found[1][0])
+
+    def lookup_many(self, lats: np.ndarray, lons: np.ndarray,
+                    radius_km: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Vectorized lookup for users sharing one radius bucket.
+
+        max_prob is the largest of the surrounding nodes, so it never
+        reports less than the exact radius query: a cell within radius_km of
+        the user is within radius_km of one of those nodes (to within ~1 km
+        above 80 degrees latitude). It can report more, by at most how much
+        the field varies over one grid step. mean_prob is interpolated and
+        may differ from the exact mean either way.
+        """
+        if radius_km not in self.max_prob:
+            return None
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        rows = np.clip(np.floor(lats).astype(np.int64) + 90, 0, N_LAT - 2)
+        cols = np.floor(lons).astype(np.int64)
+        fy = lats + 90 - rows
+        fx = lons - cols
+        cols = np.mod(cols, N_LON)
+        cols_east = np.mod(cols + 1, N_LON)
+
+        # Nodes with zero interpolation weight are skipped, so users on a node read it exactly
+        max_field = self.max_prob[radius_km]
+        max_prob = np.maximum.reduce([
+            np.where((fx < 1) & (fy < 1), max_field[cols, rows], -np.inf),
+            np.where((fx > 0) & (fy < 1), max_field[cols_east, rows], -np.inf),
+            np.where((fx < 1) & (fy > 0), max_field[cols, rows + 1], -np.inf),
+            np.where((fx > 0) & (fy > 0), max_field[cols_east, rows + 1], -np.inf)
+        ])
+        mean_field = self.mean_prob[radius_km]
+        mean_prob = (
+            (mean_field[cols, rows] * (1 - fx) + mean_field[cols_east, rows] * fx) * (1 - fy)
+            + (mean_field[cols, rows + 1] * (1 - fx) + mean_field[cols_east, rows + 1] * fx) * fy
+        )
+        return max_prob, mean_prob
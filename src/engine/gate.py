@@ -0,0 +1,47 @@
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+from .geo import EARTH_RADIUS_KM
+from .grid import AuroraGrid, N_LAT
+
+
+def latest_kp(kp_data: Optional[List[Dict[str, Any]]]) -> Optional[float]:
+    """Most recent Kp value from the SWPC Kp feed, or None if unavailable."""
+    for entry in reversed(kp_data or []):
+        for key in ('kp_index', 'estimated_kp', 'kp'):
+            try:
+                return float(str(entry[key]).rstrip('+-MPZ'))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return None
+
+
+def band_upper_bound(grid: AuroraGrid, lats: np.ndarray, radii_km: np.ndarray) -> np.ndarray:
+    """Upper bound on each user's max_prob from the per-latitude maxima of the grid.
+
+    Any cell within a user's radius lies in a latitude row inside
+    lat +/- radius, so the largest row maximum over those rows bounds what the
+    exact radius query can return. Rows are combined with a sparse table, so
+    the bound for every user costs a couple of array lookups.
+    """
+    row_max = grid.prob.max(axis=0).astype(np.float64)
+
+    levels = [row_max]
+    while (1 << len(levels)) <= N_LAT:
+        step = 1 << (len(levels) - 1)
+        previous = levels[-1]
+        levels.append(np.maximum(previous[:-step], previous[step:]))
+
+    angular = np.degrees(radii_km / EARTH_RADIUS_KM)
+    lo = np.maximum(np.ceil(lats - angular), -90).astype(np.int64) + 90
+    hi = np.minimum(np.floor(lats + angular), 90).astype(np.int64) + 90
+    # A small radius between two grid rows contains no cells at all
+    span = np.maximum(hi - lo + 1, 1)
+    level = np.floor(np.log2(span)).astype(np.int64)
+
+    bound = np.zeros(len(lats))
+    for k in np.unique(level):
+        selected = (level == k) & (hi >= lo)
+        table = levels[k]
+        bound[selected] = np.maximum(table[lo[selected]], table[hi[selected] - (1 << k) + 1])
+    return bound
@@ -0,0 +1,122 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+import numpy as np
+
+# IUGG mean Earth radius. Haversine distances on this sphere stay within 0.6%
+# of the WGS84 geodesic distance used by geopy (at most ~6 km at the 1000 km
+# maximum subscription radius).
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized great-circle distance in kilometers between points given in degrees."""
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Weather results are keyed on a 0.1° lattice, matching the engine's match tolerance
+WEATHER_KEY_SCALE = 10
+
+
+def location_key(lat: float, lon: float) -> Tuple[int, int]:
+    """Quantize a location to the weather index lattice."""
+    return int(round(lat * WEATHER_KEY_SCALE)), int(round(lon * WEATHER_KEY_SCALE))
+
+
+def index_weather(results: Iterable[Dict[str, Any]]) -> Dict[Tuple[int, int], Dict[str, Any]]:
+    """Index weather results by quantized location; the first result per key wins."""
+    index = {}
+    for result in results:
+        index.setdefault(location_key(result['lat'], result['lon']), result)
+    return index
+
+
+def lookup_weather(index: Dict[Tuple[int, int], Dict[str, Any]],
+                   lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """Find the weather result within 0.1° of (lat, lon) by probing neighbouring keys."""
+    key_lat, key_lon = location_key(lat, lon)
+    result = index.get((key_lat, key_lon))
+    if result is not None:
+        return result
+
+    for d_lat in (-1, 0, 1):
+        for d_lon in (-1, 0, 1):
+            result = index.get((key_lat + d_lat, key_lon + d_lon))
+            if result is not None and abs(result['lat'] - lat) < 0.1 and abs(result['lon'] - lon) < 0.1:
+                return result
+    return None
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def _geohash_bits(precision: int) -> Tuple[int, int]:
+    """Longitude and latitude bit counts of a geohash; longitude takes the extra odd bit."""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def geohash_codes(lats, lons, precision: int) -> np.ndarray:
+    """Vectorized geohash of each point as its integer code (5 bits per character)."""
+    lon_bits, lat_bits = _geohash_bits(precision)
+    lon_idx = np.clip(
+        ((np.asarray(lons, dtype=float) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64),
+        0, (1 << lon_bits) - 1
+    )
+    lat_idx = np.clip(
+        ((np.asarray(lats, dtype=float) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64),
+        0, (1 << lat_bits) - 1
+    )
+
+    # Bits alternate longitude, latitude, starting from the most significant longitude bit
+    code = np.zeros(lon_idx.shape, dtype=np.int64)
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            bit = (lon_idx >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_idx >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+    return code
+
+
+def geohash_from_code(code: int, precision: int) -> str:
+    """Base-32 geohash string of an integer code."""
+    return ''.join(
+        GEOHASH_ALPHABET[(int(code) >> (5 * (precision - 1 - i))) & 31] for i in range(precision)
+    )
+
+
+def geohash_to_code(geohash: str) -> int:
+    """Integer code of a base-32 geohash string."""
+    code = 0
+    for char in geohash:
+        code = (code << 5) | GEOHASH_ALPHABET.index(char)
+    return code
+
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+    """Geohash of a single point."""
+    return geohash_from_code(geohash_codes([lat], [lon], precision)[0], precision)
+
+
+def geohash_center(geohash: str) -> Tuple[float, float]:
+    """Center (lat, lon) of a geohash cell."""
+    precision = len(geohash)
+    lon_bits, lat_bits = _geohash_bits(precision)
+    code = geohash_to_code(geohash)
+
+    lon_idx = lat_idx = 0
+    for i in range(5 * precision):
+        bit = (code >> (5 * precision - 1 - i)) & 1
+        if i % 2 == 0:
+            lon_idx = (lon_idx << 1) | bit
+        else:
+            lat_idx = (lat_idx << 1) | bit
+
+    lat = -90.0 + (lat_idx + 0.5) * 180.0 / (1 << lat_bits)
+    lon = -180.0 + (lon_idx + 0.5) * 360.0 / (1 << lon_bits)
+    return lat, lon
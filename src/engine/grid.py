@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from .geo import EARTH_RADIUS_KM, haversine_km
+
+# Ovation Prime is a regular 1° x 1° lattice: longitude 0..359 east, latitude -90..90
+N_LON = 360
+N_LAT = 181
+LONS = np.arange(N_LON, dtype=np.float64)
+LATS = np.arange(-90, 91, dtype=np.float64)
+
+
+def parse_noaa_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse an SWPC timestamp such as '2024-01-15T03:05:00Z' into naive UTC."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+@dataclass
+class AuroraGrid:
+    """Dense float32 raster of aurora probability indexed as prob[lon, lat + 90].
+
+    A full snapshot is 360 x 181 x 4 bytes (~260 KB). Cell lookups are plain
+    array indexing, and radius queries slice the rows/columns of the user's
+    bounding box instead of scanning the whole grid.
+    """
+    prob: np.ndarray
+    observation_time: Optional[datetime] = None
+    forecast_time: Optional[datetime] = None
+    # Identifies the upstream payload; unchanged payloads keep the same version
+    version: Optional[str] = None
+
+    @classmethod
+    def zeros(cls) -> 'AuroraGrid':
+        return cls(prob=np.zeros((N_LON, N_LAT), dtype=np.float32))
+
+    @classmethod
+    def from_coordinates(cls, coordinates: Iterable, observation_time: Optional[datetime] = None,
+                         forecast_time: Optional[datetime] = None) -> 'AuroraGrid':
+        """Build a grid from NOAA [longitude, latitude, aurora] triples."""
+        triples = np.asarray(coordinates, dtype=np.float64).reshape(-1, 3)
+        grid = cls.zeros()
+        grid.observation_time = observation_time
+        grid.forecast_time = forecast_time
+
+        cols = np.mod(np.rint(triples[:, 0]).astype(np.int64), N_LON)
+        rows = np.clip(np.rint(triples[:, 1]).astype(np.int64) + 90, 0, N_LAT - 1)
+        grid.prob[cols, rows] = triples[:, 2]
+        return grid
+
+    @classmethod
+    def from_payload(cls, data: Dict[str, Any]) -> 'AuroraGrid':
+        """Build a grid from the decoded ovation_aurora_latest.json document."""
+        return cls.from_coordinates(
+            data.get('coordinates', []),
+            observation_time=parse_noaa_time(data.get('Observation Time')),
+            forecast_time=parse_noaa_time(data.get('Forecast Time'))
+        )
+
+    def __len__(self) -> int:
+        return self.prob.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.prob.nbytes
+
+    def cell(self, lat: float, lon: float) -> float:
+        """Probability of the grid cell containing (lat, lon)."""
+        return float(self.prob[int(round(lon)) % N_LON, int(round(lat)) + 90])
+
+    def _window(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Column and row indices of the bounding box around a radius query."""
+        angular = np.degrees(radius_km / EARTH_RADIUS_KM)
+        rows = np.arange(
+            max(int(np.ceil(lat - angular)), -90) + 90,
+            min(int(np.floor(lat + angular)), 90) + 91
+        )
+
+        if abs(lat) + angular >= 90.0:
+            return np.arange(N_LON), rows
+
+        half = np.degrees(np.arcsin(np.sin(radius_km / EARTH_RADIUS_KM) / np.cos(np.radians(lat))))
+        lo = int(np.ceil(lon - half))
+        hi = int(np.floor(lon + half))
+        if hi - lo + 1 >= N_LON:
+            return np.arange(N_LON), rows
+        return np.mod(np.arange(lo, hi + 1), N_LON), rows
+
+    def query_radius(self, lat: float, lon: float,
+                     radius_km: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return lat, lon, prob and distance of every cell within radius_km."""
+        cols, rows = self._window(lat, lon, radius_km)
+        cell_lats = LATS[rows][np.newaxis, :]
+        cell_lons = LONS[cols][:, np.newaxis]
+        distances = haversine_km(lat, lon, cell_lats, cell_lons)
+        mask = distances <= radius_km
+
+        probs = self.prob[np.ix_(cols, rows)]
+        lats = np.broadcast_to(cell_lats, mask.shape)[mask]
+        lons = np.broadcast_to(cell_lons, mask.shape)[mask]
+        return lats, lons, probs[mask].astype(np.float64), distances[mask]
+
+    def probabilities_within(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Probabilities of every cell within radius_km of (lat, lon)."""
+        return self.query_radius(lat, lon, radius_km)[2]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Long-format frame with geographic lat/lon/prob/power columns."""
+        lons, lats = np.meshgrid(LONS, LATS, indexing='ij')
+        return pd.DataFrame({
+            'lat': lats.ravel(),
+            'lon': lons.ravel(),
+            'prob': self.prob.ravel().astype(np.float64),
+            'power': 0.0
+        })
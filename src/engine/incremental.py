@@ -0,0 +1,152 @@
+import logging
+from datetime import datetime
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+
+from .batch import BatchDecision, UserBatch
+from .geo import EARTH_RADIUS_KM
+from .grid import AuroraGrid, N_LAT, N_LON
+from .solar import night_mask
+
+logger = logging.getLogger(__name__)
+
+
+def windows_touch(changed: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+                  radii_km: np.ndarray) -> np.ndarray:
+    """Whether any changed cell lies in each user's radius bounding box.
+
+    Uses a summed-area table over the (lon, lat) raster, with longitude tiled
+    twice so wrapped windows stay contiguous; every user is an O(1) lookup.
+    The box is the one AuroraGrid uses for radius queries, so it is a
+    superset of the disk and never misses a change.
+    """
+    tiled = np.concatenate([changed, changed], axis=0).astype(np.int64)
+    table = np.zeros((2 * N_LON + 1, N_LAT + 1), dtype=np.int64)
+    table[1:, 1:] = tiled.cumsum(axis=0).cumsum(axis=1)
+
+    angular = np.degrees(radii_km / EARTH_RADIUS_KM)
+    row_lo = np.maximum(np.ceil(lats - angular), -90).astype(np.int64) + 90
+    row_hi = np.minimum(np.floor(lats + angular), 90).astype(np.int64) + 91
+
+    polar = np.abs(lats) + angular >= 90.0
+    ratio = np.sin(radii_km / EARTH_RADIUS_KM) / np.maximum(np.cos(np.radians(lats)), 1e-12)
+    half = np.degrees(np.arcsin(np.clip(ratio, 0.0, 1.0)))
+    col_lo = np.ceil(lons - half).astype(np.int64)
+    width = np.floor(lons + half).astype(np.int64) - col_lo + 1
+
+    whole_row = polar | (width >= N_LON)
+    col_lo = np.where(whole_row, 0, np.mod(col_lo, N_LON))
+    col_hi = col_lo + np.where(whole_row, N_LON, width)
+
+    count = (
+        table[col_hi, row_hi] - table[col_lo, row_hi]
+        - table[col_hi, row_lo] + table[col_lo, row_lo]
+    )
+    return count > 0
+
+
+class IncrementalEvaluator:
+    """Re-evaluates only users whose inputs changed since the previous cycle.
+
+    A reference grid tracks the values the cached results were computed
+    against. Each cycle, cells that moved more than `tolerance` probability
+    points are folded into the reference and only users whose radius box
+    covers one of them get a fresh radius query; everybody else keeps their
+    cached max/mean probability, which is therefore never more than
+    `tolerance` away from the live grid. The notification rule itself is a
+    few array expressions, so it is re-applied to every user, which picks up
+    weather, day/night and cooldown changes.
+    """
+
+    def __init__(self, engine, tolerance: float):
+        self.engine = engine
+        self.tolerance = tolerance
+        self._reference: Optional[AuroraGrid] = None
+        self._batch: Optional[UserBatch] = None
+        self._decision: Optional[BatchDecision] = None
+        self._cooled_down: Optional[np.ndarray] = None
+
+    def reset(self):
+        self._reference = None
+        self._batch = None
+        self._decision = None
+        self._cooled_down = None
+
+    def _update_reference(self, grid: AuroraGrid) -> np.ndarray:
+        """Fold cells that changed beyond the tolerance into the reference grid."""
+        changed = np.abs(grid.prob - self._reference.prob) > self.tolerance
+        if changed.any():
+            prob = np.where(changed, grid.prob, self._reference.prob).astype(np.float32)
+            self._reference = AuroraGrid(
+                prob=prob,
+                observation_time=grid.observation_time,
+                forecast_time=grid.forecast_time
+            )
+        return changed
+
+    def _match_previous(self, batch: UserBatch):
+        """Positions of each user in the previous batch, and whether their query is unchanged."""
+        previous = self._batch
+        order = np.argsort(previous.id, kind='stable')
+        found = np.searchsorted(previous.id[order], batch.id)
+        found = np.minimum(found, len(order) - 1)
+        positions = order[found]
+
+        matched = (
+            (previous.id[positions] == batch.id)
+            & (previous.lat[positions] == batch.lat)
+            & (previous.lon[positions] == batch.lon)
+            & (previous.radius_km[positions] == batch.radius_km)
+        )
+        return positions, matched
+
+    def evaluate_batch(self, batch: UserBatch, aurora_df: Union[pd.DataFrame, AuroraGrid],
+                       weather_data: dict, timestamp: datetime) -> BatchDecision:
+        cloud_coverage = self.engine.resolve_cloud_coverage(batch, weather_data)
+
+        first_cycle = self._reference is None or self._batch is None or len(self._batch) == 0
+        if first_cycle or not isinstance(aurora_df, AuroraGrid):
+            decision = self.engine.evaluate_batch(batch, aurora_df, weather_data, timestamp, cloud_coverage)
+            self._store(batch, decision, timestamp, aurora_df)
+            return decision
+
+        changed = self._update_reference(aurora_df)
+        positions, matched = self._match_previous(batch)
+        requery = ~matched | windows_touch(changed, batch.lat, batch.lon, batch.radius_km.astype(float))
+
+        max_prob = self._decision.max_prob[positions].copy()
+        mean_prob = self._decision.mean_prob[positions].copy()
+        if requery.any():
+            fresh = self.engine.evaluate_batch(
+                batch.take(requery), self._reference, weather_data, timestamp, cloud_coverage[requery]
+            )
+            max_prob[requery] = fresh.max_prob
+            mean_prob[requery] = fresh.mean_prob
+
+        _, is_night = night_mask(batch.lat, batch.lon, timestamp)
+        decision = self.engine.decide(batch, max_prob, mean_prob, cloud_coverage, is_night, timestamp)
+
+        cooled_down = self.engine.cooled_down(batch, timestamp)
+        flipped = matched & (
+            (self._decision.cloud_coverage[positions] != cloud_coverage)
+            | (self._decision.is_night[positions] != is_night)
+            | (self._cooled_down[positions] != cooled_down)
+        )
+        skipped = int((~requery & ~flipped).sum())
+        logger.info(
+            f"Incremental evaluation: {int(changed.sum())} cells changed, "
+            f"{int(requery.sum())} users re-queried, {int(flipped.sum())} with weather/night/cooldown "
+            f"changes, {skipped} of {len(batch)} skipped"
+        )
+
+        self._store(batch, decision, timestamp)
+        return decision
+
+    def _store(self, batch: UserBatch, decision: BatchDecision, timestamp: datetime,
+               grid: Optional[Union[pd.DataFrame, AuroraGrid]] = None):
+        if grid is not None:
+            self._reference = grid if isinstance(grid, AuroraGrid) else None
+        self._batch = batch
+        self._decision = decision
+        self._cooled_down = self.engine.cooled_down(batch, timestamp)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 from pydantic import BaseModel
 
 
@@ -22,4 +22,12 @@ class AuroraAlert(BaseModel):
     cloud_coverage: float
     is_night: bool
     should_notify: bool
-    timestamp: datetime
\ No newline at end of file
+    timestamp: datetime
+
+
+class OutboxMessage(BaseModel):
+    id: int
+    kind: str
+    user_id: Optional[int] = None
+    payload: Dict[str, Any]
+    attempts: int = 0
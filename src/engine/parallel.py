@@ -0,0 +1,102 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+from .batch import BatchDecision, UserBatch
+from .grid import AuroraGrid
+
+logger = logging.getLogger(__name__)
+
+# Per-worker state: the engine and the grid of the current cycle, reused across shards
+_worker_engine = None
+_worker_grid: Optional[Tuple[str, AuroraGrid]] = None
+
+
+def _shared_dir() -> str:
+    """Directory for per-cycle grid files; tmpfs when available so pages stay in RAM."""
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def _evaluate_shard(grid_path: str, forecast_time: Optional[datetime], engine_params: Dict[str, Any],
+                    shard: UserBatch, cloud_coverage: np.ndarray, timestamp: datetime) -> BatchDecision:
+    """Worker entry point: map the cycle's grid read-only and evaluate one shard."""
+    global _worker_engine, _worker_grid
+    from .aurora_engine import AuroraEngine
+
+    if _worker_engine is None:
+        _worker_engine = AuroraEngine()
+        _worker_engine.workers = 1
+    for name, value in engine_params.items():
+        setattr(_worker_engine, name, value)
+
+    if _worker_grid is None or _worker_grid[0] != grid_path:
+        prob = np.load(grid_path, mmap_mode='r')
+        _worker_grid = (grid_path, AuroraGrid(prob=prob, forecast_time=forecast_time))
+
+    return _worker_engine.evaluate_shard(shard, _worker_grid[1], cloud_coverage, timestamp)
+
+
+class ShardedEvaluator:
+    """Evaluates a user batch across a process pool, one contiguous shard per task.
+
+    The grid is written once per cycle to a memory-mapped file on tmpfs, so
+    workers share its pages instead of receiving a pickled copy per task.
+    Shard results are concatenated in submission order, preserving user order.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def evaluate(self, engine_params: Dict[str, Any], batch: UserBatch, grid: AuroraGrid,
+                 cloud_coverage: np.ndarray, timestamp: datetime) -> BatchDecision:
+        cycle_dir = tempfile.mkdtemp(prefix='aurora-grid-', dir=_shared_dir())
+        try:
+            grid_path = os.path.join(cycle_dir, 'prob.npy')
+            np.save(grid_path, grid.prob)
+
+            # Workers never read tokens or topics, so they are left out of the pickled shards
+            bounds = np.linspace(0, len(batch), self.workers + 1).astype(np.int64)
+            futures = [
+                self._pool().submit(
+                    _evaluate_shard, grid_path, grid.forecast_time, engine_params,
+                    replace(batch.take(slice(start, end)), fcm_token=None, topic=None),
+                    cloud_coverage[start:end], timestamp
+                )
+                for start, end in zip(bounds[:-1], bounds[1:])
+                if end > start
+            ]
+            shards = [future.result() for future in futures]
+        finally:
+            shutil.rmtree(cycle_dir, ignore_errors=True)
+
+        logger.info(f"Evaluated {len(batch)} users in {len(shards)} shards")
+        return BatchDecision(
+            user_id=np.concatenate([s.user_id for s in shards]),
+            max_prob=np.concatenate([s.max_prob for s in shards]),
+            mean_prob=np.concatenate([s.mean_prob for s in shards]),
+            cloud_coverage=np.concatenate([s.cloud_coverage for s in shards]),
+            is_night=np.concatenate([s.is_night for s in shards]),
+            notify=np.concatenate([s.notify for s in shards]),
+            timestamp=timestamp
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+from typing import Tuple
+import numpy as np
+
+# Sun below civil twilight: dark enough for aurora viewing
+NIGHT_ELEVATION_DEG = -6.0
+
+
+def _utc(timestamp: datetime) -> datetime:
+    """Treat naive timestamps as UTC, as the rest of the pipeline does."""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def _sun_position(timestamp: datetime) -> Tuple[float, float]:
+    """Solar declination (radians) and equation of time (minutes) from the NOAA algorithm."""
+    julian_day = _utc(timestamp).timestamp() / 86400.0 + 2440587.5
+    t = (julian_day - 2451545.0) / 36525.0
+
+    mean_long = np.radians((280.46646 + t * (36000.76983 + t * 0.0003032)) % 360)
+    mean_anomaly = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    eccentricity = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+
+    center = (
+        np.sin(mean_anomaly) * (1.914602 - t * (0.004817 + 0.000014 * t))
+        + np.sin(2 * mean_anomaly) * (0.019993 - 0.000101 * t)
+        + np.sin(3 * mean_anomaly) * 0.000289
+    )
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent_long = np.radians(np.degrees(mean_long) + center - 0.00569 - 0.00478 * np.sin(omega))
+
+    mean_obliquity = 23 + (26 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60) / 60
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_long))
+
+    y = np.tan(obliquity / 2) ** 2
+    eq_time = 4 * np.degrees(
+        y * np.sin(2 * mean_long)
+        - 2 * eccentricity * np.sin(mean_anomaly)
+        + 4 * eccentricity * y * np.sin(mean_anomaly) * np.cos(2 * mean_long)
+        - 0.5 * y * y * np.sin(4 * mean_long)
+        - 1.25 * eccentricity * eccentricity * np.sin(2 * mean_anomaly)
+    )
+    return float(declination), float(eq_time)
+
+
+def solar_elevation(lats, lons, timestamp: datetime) -> np.ndarray:
+    """Geometric solar elevation in degrees for arrays of locations at one instant.
+
+    The sun's declination and equation of time are computed once per call, so
+    the per-location cost is a few vectorized trig operations. Refraction is
+    ignored; it only matters within a degree of the horizon, well above the
+    -6° night threshold.
+    """
+    declination, eq_time = _sun_position(timestamp)
+    utc = _utc(timestamp)
+    minutes = utc.hour * 60 + utc.minute + utc.second / 60 + utc.microsecond / 6e7
+
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    solar_time = minutes + eq_time + 4 * np.asarray(lons, dtype=np.float64)
+    hour_angle = np.radians(solar_time / 4 - 180)
+
+    cos_zenith = (
+        np.sin(lat) * np.sin(declination)
+        + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+    )
+    return 90 - np.degrees(np.arccos(np.clip(cos_zenith, -1.0, 1.0)))
+
+
+def night_mask(lats, lons, timestamp: datetime,
+               threshold_deg: float = NIGHT_ELEVATION_DEG) -> Tuple[np.ndarray, np.ndarray]:
+    """Solar elevation and is-night mask (elevation below threshold) in one pass."""
+    elevation = solar_elevation(lats, lons, timestamp)
+    return elevation, elevation < threshold_deg
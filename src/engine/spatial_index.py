@@ -0,0 +1,103 @@
+from typing import Tuple
+import numpy as np
+import pandas as pd
+
+from .geo import EARTH_RADIUS_KM, haversine_km
+
+# Spacing between bands in the sort key; larger than 360 so windows never spill into the next band
+_BAND_STRIDE = 1000.0
+
+
+class GridIndex:
+    """Lat-band bucket index over aurora grid cells for batched radius queries.
+
+    Cells are sorted by (latitude band, longitude) so that the candidates for a
+    query are a handful of contiguous slices, one per band the radius touches.
+    Only those candidates are measured, so query cost follows the number of
+    cells near the user rather than the size of the grid.
+    """
+
+    def __init__(self, aurora_df: pd.DataFrame, band_deg: float = 1.0):
+        self.band_deg = band_deg
+
+        if aurora_df is None or aurora_df.empty:
+            lats = lons = prob = power = np.empty(0)
+        else:
+            lats = aurora_df['lat'].to_numpy(dtype=float)
+            lons = aurora_df['lon'].to_numpy(dtype=float)
+            prob = aurora_df['prob'].to_numpy(dtype=float)
+            if 'power' in aurora_df.columns:
+                power = aurora_df['power'].to_numpy(dtype=float)
+            else:
+                power = np.zeros(len(aurora_df))
+
+        bands = self._band(lats)
+        lons360 = np.mod(lons, 360.0)
+        order = np.lexsort((lons360, bands))
+
+        self.lat = lats[order]
+        self.lon = lons[order]
+        self.prob = prob[order]
+        self.power = power[order]
+        self.n_bands = int(np.ceil(180.0 / band_deg)) + 1
+        self._keys = bands[order] * _BAND_STRIDE + lons360[order]
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def _band(self, lats) -> np.ndarray:
+        return np.floor((np.asarray(lats, dtype=float) + 90.0) / self.band_deg).astype(np.int64)
+
+    def _candidate_slices(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Start/end positions of the sorted slices that may hold cells within the radius."""
+        angular = np.degrees(radius_km / EARTH_RADIUS_KM)
+        band_lo = max(int(self._band(lat - angular)), 0)
+        band_hi = min(int(self._band(lat + angular)), self.n_bands - 1)
+        bands = np.arange(band_lo, band_hi + 1, dtype=float)
+
+        # Longitude half-width of the bounding box; the whole circle if a pole is inside the radius
+        if abs(lat) + angular >= 90.0:
+            windows = [(0.0, 360.0)]
+        else:
+            half = np.degrees(np.arcsin(
+                np.sin(radius_km / EARTH_RADIUS_KM) / np.cos(np.radians(lat))
+            ))
+            lo = (lon - half) % 360.0
+            hi = lo + 2 * half
+            if hi <= 360.0:
+                windows = [(lo, hi)]
+            else:
+                windows = [(lo, 360.0), (0.0, hi - 360.0)]
+
+        starts = []
+        ends = []
+        for lo, hi in windows:
+            starts.append(np.searchsorted(self._keys, bands * _BAND_STRIDE + lo, side='left'))
+            ends.append(np.searchsorted(self._keys, bands * _BAND_STRIDE + hi, side='right'))
+
+        return np.concatenate(starts), np.concatenate(ends)
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return positions (into the index arrays) and distances of cells within radius_km."""
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        starts, ends = self._candidate_slices(lat, lon, radius_km)
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Concatenate the [start, end) ranges without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        candidates = offsets + np.arange(total)
+
+        distances = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        mask = distances <= radius_km
+        return candidates[mask], distances[mask]
+
+    def probabilities_within(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Probabilities of every cell within radius_km of (lat, lon)."""
+        positions, _ = self.query_radius(lat, lon, radius_km)
+        return self.prob[positions]
+
@@ -1,44 +1,131 @@
 import asyncio
+import hashlib
 from typing import List, Dict, Any, Optional
 import httpx
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+from ..engine.grid import AuroraGrid
+from ..utils.config import settings
+from .grid_cache import GridSnapshotCache
+from .http_client import get_http_client
+from .ovation_parser import OvationStreamParser
 
 logger = logging.getLogger(__name__)
 
 
 class AuroraDataFetcher:
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None,
+                 snapshots: Optional[GridSnapshotCache] = None):
+        # Falls back to the shared pooled client when none is injected
+        self.client = client
+        
+        # Every newly parsed grid is persisted here for warm starts and NOAA outages
+        if snapshots is None and settings.grid_cache_dir:
+            snapshots = GridSnapshotCache(settings.grid_cache_dir, settings.grid_cache_keep)
+        self.snapshots = snapshots
         self.ovation_url = "https://services.swpc.noaa.gov/json/ovation_aurora_latest.json"
         self.kp_url = "https://services.swpc.noaa.gov/json/kp_index_now.json"
+        
+        # Conditional-request and dedup state for the Ovation grid
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._content_hash: Optional[str] = None
+        self._last_grid: Optional[AuroraGrid] = None
+        self.grid_changed = False
     
-    async def fetch_ovation_data(self) -> Optional[pd.DataFrame]:
-        """Fetch latest Ovation Prime grid data from NOAA SWPC."""
+    def warm_start(self) -> Optional[AuroraGrid]:
+        """Adopt the newest persisted snapshot as the last grid, memory-mapped.
+        
+        The snapshot's ETag/Last-Modified and body hash are restored too, so
+        the first fetch after a restart can still come back as a 304.
+        """
+        if self.snapshots is None:
+            return None
+        loaded = self.snapshots.load_latest()
+        if loaded is None:
+            return None
+        
+        grid, meta = loaded
+        self._last_grid = grid
+        self._etag = meta.get('etag')
+        self._last_modified = meta.get('last_modified')
+        self._content_hash = meta.get('content_hash')
+        logger.info(f"Warm start from grid snapshot {grid.version}")
+        return grid
+    
+    def _grid_is_fresh(self, grid: AuroraGrid) -> bool:
+        """Whether a previously fetched grid is recent enough to stand in for a failed fetch."""
+        if grid.forecast_time is None:
+            return False
+        return datetime.utcnow() - grid.forecast_time <= timedelta(minutes=settings.grid_max_age_min)
+    
+    async def fetch_ovation_grid(self) -> Optional[AuroraGrid]:
+        """Fetch latest Ovation Prime grid from NOAA SWPC as a dense raster.
+        
+        The request is conditional on the previous ETag/Last-Modified. The
+        body is streamed through OvationStreamParser; when its hash matches
+        the last one, the previously parsed grid (same object, same version)
+        is returned and `grid_changed` is False, as for a 304.
+        """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.ovation_url, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                
-                if not data:
-                    logger.warning("No Ovation data received")
-                    return None
+            headers = {}
+            if self._last_grid is not None:
+                if self._etag:
+                    headers['If-None-Match'] = self._etag
+                if self._last_modified:
+                    headers['If-Modified-Since'] = self._last_modified
+            
+            client = self.client or get_http_client()
+            async with client.stream('GET', self.ovation_url, headers=headers, timeout=30.0) as response:
+                if response.status_code == 304 and self._last_grid is not None:
+                    logger.info(f"Ovation grid not modified (version {self._last_grid.version})")
+                    self.grid_changed = False
+                    return self._last_grid
                 
-                df = pd.DataFrame(data)
-                df['timestamp'] = datetime.utcnow()
-                
-                # Rename columns to match our expected format
-                df = df.rename(columns={
-                    'GeomagneticLat': 'lat',
-                    'GeomagneticLon': 'lon',
-                    'Probability': 'prob',
-                    'Power': 'power'
-                })
-                
-                logger.info(f"Fetched {len(df)} aurora probability grid points")
-                return df
+                response.raise_for_status()
+                self._etag = response.headers.get('ETag')
+                self._last_modified = response.headers.get('Last-Modified')
                 
+                # Hash and parse the body as it arrives; it is never held in memory whole
+                hasher = hashlib.sha256()
+                parser = OvationStreamParser()
+                async for chunk in response.aiter_bytes():
+                    hasher.update(chunk)
+                    parser.feed(chunk)
+            
+            digest = hasher.hexdigest()
+            if self._last_grid is not None and digest == self._content_hash:
+                logger.info(f"Ovation payload unchanged (version {self._last_grid.version})")
+                self.grid_changed = False
+                return self._last_grid
+            
+            grid = parser.close()
+            if grid is None:
+                logger.warning("No Ovation data received")
+                return None
+            
+            forecast = grid.forecast_time.strftime('%Y%m%dT%H%M') if grid.forecast_time else 'unknown'
+            grid.version = f"{forecast}-{digest[:12]}"
+            
+            self._last_grid = grid
+            self._content_hash = digest
+            self.grid_changed = True
+            
+            if self.snapshots is not None:
+                try:
+                    self.snapshots.save(grid, {
+                        'etag': self._etag,
+                        'last_modified': self._last_modified,
+                        'content_hash': digest
+                    })
+                except OSError as e:
+                    logger.warning(f"Could not persist grid snapshot: {e}")
+            
+            logger.info(f"Fetched {parser.count} aurora probability grid points "
+                        f"(version {grid.version})")
+            return grid
+            
         except httpx.RequestError as e:
             logger.error(f"Error fetching Ovation data: {e}")
             return None
@@ -46,21 +133,32 @@ class AuroraDataFetcher:
             logger.error(f"Unexpected error processing Ovation data: {e}")
             return None
     
+    async def fetch_ovation_data(self) -> Optional[pd.DataFrame]:
+        """Fetch latest Ovation Prime grid data from NOAA SWPC."""
+        grid = await self.fetch_ovation_grid()
+        if grid is None:
+            return None
+        
+        # Ovation coordinates are geographic longitude/latitude
+        df = grid.to_frame()
+        df['timestamp'] = datetime.utcnow()
+        return df
+    
     async def fetch_kp_data(self) -> Optional[List[Dict[str, Any]]]:
         """Fetch current Kp index data from NOAA SWPC."""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.kp_url, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                
-                if not data:
-                    logger.warning("No Kp data received")
-                    return None
-                
-                logger.info(f"Fetched {len(data)} Kp index entries")
-                return data
-                
+            client = self.client or get_http_client()
+            response = await client.get(self.kp_url, timeout=30.0)
+            response.raise_for_status()
+            data = response.json()
+            
+            if not data:
+                logger.warning("No Kp data received")
+                return None
+            
+            logger.info(f"Fetched {len(data)} Kp index entries")
+            return data
+            
         except httpx.RequestError as e:
             logger.error(f"Error fetching Kp data: {e}")
             return None
@@ -70,13 +168,21 @@ class AuroraDataFetcher:
     
     async def fetch_all_data(self) -> Dict[str, Any]:
         """Fetch both Ovation and Kp data concurrently."""
-        ovation_task = self.fetch_ovation_data()
+        ovation_task = self.fetch_ovation_grid()
         kp_task = self.fetch_kp_data()
         
         ovation_data, kp_data = await asyncio.gather(ovation_task, kp_task)
         
+        # NOAA unreachable: keep evaluating on the last grid while it is recent enough
+        if ovation_data is None and self._last_grid is not None and self._grid_is_fresh(self._last_grid):
+            logger.warning(f"Ovation fetch failed, using last grid {self._last_grid.version}")
+            ovation_data = self._last_grid
+            self.grid_changed = False
+        
         return {
             'ovation': ovation_data,
+            'ovation_changed': ovation_data is not None and self.grid_changed,
+            'grid_version': ovation_data.version if ovation_data is not None else None,
             'kp': kp_data,
             'timestamp': datetime.utcnow()
         }
\ No newline at end of file
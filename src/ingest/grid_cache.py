@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from ..engine.grid import AuroraGrid, N_LAT, N_LON, parse_noaa_time
+
+logger = logging.getLogger(__name__)
+
+
+class GridSnapshotCache:
+    """Parsed Ovation grids persisted as .npy files with a JSON metadata sidecar.
+
+    Snapshots are loaded with mmap_mode='r', so a warm start costs no parse
+    and no copy, and every process on the host that maps the same snapshot
+    shares its page-cache pages. Files are written under a temporary name
+    and renamed into place, so readers never see a partial snapshot. Only
+    the newest `keep` snapshots are retained.
+    """
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+
+    def _paths(self, name: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, f"ovation-{name}")
+        return f"{base}.npy", f"{base}.json"
+
+    def save(self, grid: AuroraGrid, validators: Optional[Dict[str, Any]] = None) -> str:
+        """Persist a grid and its metadata; `validators` holds the HTTP cache state to restore."""
+        os.makedirs(self.directory, exist_ok=True)
+        name = grid.version or datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        array_path, meta_path = self._paths(name)
+
+        with open(array_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(grid.prob, dtype=np.float32))
+        os.replace(array_path + '.tmp', array_path)
+
+        meta = {
+            'version': grid.version,
+            'observation_time': grid.observation_time.isoformat() if grid.observation_time else None,
+            'forecast_time': grid.forecast_time.isoformat() if grid.forecast_time else None,
+            'saved_at': datetime.utcnow().isoformat(),
+            **(validators or {})
+        }
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+        self.prune()
+        return array_path
+
+    def snapshots(self) -> List[Dict[str, Any]]:
+        """Metadata of every complete snapshot, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for entry in os.listdir(self.directory):
+            if not (entry.startswith('ovation-') and entry.endswith('.json')):
+                continue
+            meta_path = os.path.join(self.directory, entry)
+            array_path = meta_path[:-len('.json')] + '.npy'
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if os.path.exists(array_path):
+                found.append(dict(meta, array_path=array_path, meta_path=meta_path))
+        return sorted(found, key=lambda meta: meta.get('saved_at') or '', reverse=True)
+
+    def prune(self):
+        """Delete all but the newest `keep` snapshots."""
+        for meta in self.snapshots()[self.keep:]:
+            for path in (meta['array_path'], meta['meta_path']):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def load_latest(self) -> Optional[Tuple[AuroraGrid, Dict[str, Any]]]:
+        """Memory-map the newest readable snapshot and return it with its metadata."""
+        for meta in self.snapshots():
+            try:
+                prob = np.load(meta['array_path'], mmap_mode='r')
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable grid snapshot {meta['array_path']}: {e}")
+                continue
+            if prob.shape != (N_LON, N_LAT):
+                continue
+            grid = AuroraGrid(
+                prob=prob,
+                observation_time=parse_noaa_time(meta.get('observation_time')),
+                forecast_time=parse_noaa_time(meta.get('forecast_time')),
+                version=meta.get('version')
+            )
+            return grid, meta
+        return None
@@ -0,0 +1,42 @@
+import importlib.util
+from typing import Optional
+import httpx
+import logging
+from ..utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# One pooled client shared by every fetcher in the ingest package
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build a keep-alive client with the configured pool limits."""
+    http2 = settings.http2
+    if http2 and importlib.util.find_spec('h2') is None:
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry_s
+    )
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=30.0)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client():
+    """Close the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Shared HTTP client closed")
@@ -0,0 +1,107 @@
+import re
+from typing import Iterable, Optional
+import numpy as np
+
+from ..engine.grid import AuroraGrid, N_LAT, N_LON, parse_noaa_time
+
+# Bytes of body fed to the parser at a time when parsing an in-memory payload
+CHUNK_SIZE = 64 * 1024
+
+_COORDINATES_KEY = re.compile(rb'"coordinates"\s*:\s*\[')
+_ARRAY_END = re.compile(rb'\]\s*\]')
+_PUNCTUATION = bytes.maketrans(b'[],', b'   ')
+
+
+class OvationStreamParser:
+    """Incremental parser for ovation_aurora_latest.json.
+
+    Body chunks are fed as they arrive. Header fields outside the
+    `coordinates` array are kept as raw bytes (a few hundred bytes). Triples
+    are decoded straight from each chunk into one preallocated (N, 3) array
+    sized for the full 1° lattice. No Python object is built per value and
+    at most one chunk plus a partial triple is buffered.
+    """
+
+    def __init__(self, capacity: int = N_LON * N_LAT):
+        self.triples = np.empty((capacity, 3), dtype=np.float64)
+        self.count = 0
+        self._header = bytearray()
+        self._pending = b''
+        self._in_coordinates = False
+
+    def feed(self, chunk: bytes):
+        data = self._pending + chunk
+        self._pending = b''
+        while data:
+            if not self._in_coordinates:
+                match = _COORDINATES_KEY.search(data)
+                if match is None:
+                    # Keep enough of the tail to catch a key split across chunks
+                    split = max(len(data) - 32, 0)
+                    self._header += data[:split]
+                    self._pending = data[split:]
+                    return
+                self._header += data[:match.start()]
+                self._in_coordinates = True
+                data = data[match.end():]
+                continue
+
+            # Segments always start between triples, so a leading ']' closes the array
+            data = data.lstrip(b' \t\r\n,')
+            if not data:
+                return
+            if data[:1] == b']':
+                self._in_coordinates = False
+                data = data[1:]
+                continue
+
+            end = _ARRAY_END.search(data)
+            if end is not None:
+                self._decode(data[:end.start() + 1])
+                self._in_coordinates = False
+                data = data[end.end():]
+                continue
+
+            # Decode every complete triple; the partial one waits for the next chunk
+            last = data.rfind(b']')
+            if last < 0:
+                self._pending = data
+                return
+            self._decode(data[:last + 1])
+            self._pending = data[last + 1:]
+            return
+
+    def _decode(self, segment: bytes):
+        values = np.fromstring(segment.translate(_PUNCTUATION), dtype=np.float64, sep=' ')
+        rows = len(values) // 3
+        if self.count + rows > len(self.triples):
+            self.triples = np.resize(self.triples, (max(2 * len(self.triples), self.count + rows), 3))
+        self.triples[self.count:self.count + rows] = values[:rows * 3].reshape(rows, 3)
+        self.count += rows
+
+    def _header_time(self, key: str):
+        match = re.search(b'"' + key.encode() + rb'"\s*:\s*"([^"]*)"', bytes(self._header + self._pending))
+        return parse_noaa_time(match.group(1).decode()) if match else None
+
+    def close(self) -> Optional[AuroraGrid]:
+        """Finish parsing and build the grid, or None if the body had no coordinates."""
+        if self.count == 0:
+            return None
+        return AuroraGrid.from_coordinates(
+            self.triples[:self.count],
+            observation_time=self._header_time('Observation Time'),
+            forecast_time=self._header_time('Forecast Time')
+        )
+
+
+def parse_ovation(chunks: Iterable[bytes]) -> Optional[AuroraGrid]:
+    """Parse an Ovation payload from an iterable of byte chunks."""
+    parser = OvationStreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def parse_ovation_bytes(body: bytes) -> Optional[AuroraGrid]:
+    """Parse an in-memory Ovation payload through the streaming parser."""
+    return parse_ovation(body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
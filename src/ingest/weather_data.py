@@ -1,17 +1,240 @@
 import asyncio
-from typing import Optional, Dict, Any
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
 import httpx
+import numpy as np
 from datetime import datetime
 import logging
+from ..engine.geo import geohash_center, geohash_codes, geohash_from_code, index_weather
+from .http_client import get_http_client
 from ..utils.config import settings
 
 logger = logging.getLogger(__name__)
 
 
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        """Wait until a token is available and take it; waiters are served in order."""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+@dataclass
+class CloudForecast:
+    """Hourly cloud cover for one tile, interpolated to any time inside its horizon."""
+    times: np.ndarray  # epoch seconds, ascending
+    clouds: np.ndarray  # percent
+    
+    @classmethod
+    def from_onecall(cls, data: Dict[str, Any]) -> 'CloudForecast':
+        """Build from a OneCall response: the current reading followed by the hourly steps."""
+        points = [data['current']] if 'current' in data else []
+        points += data.get('hourly', [])
+        points = sorted((int(p['dt']), float(p.get('clouds', 100))) for p in points)
+        return cls(
+            times=np.array([t for t, _ in points], dtype=np.int64),
+            clouds=np.array([c for _, c in points], dtype=np.float32)
+        )
+    
+    def at(self, epoch: float) -> float:
+        """Cloud cover at a time, clamped to the first/last step outside the horizon."""
+        return float(np.interp(epoch, self.times, self.clouds))
+    
+    def to_dict(self) -> Dict[str, list]:
+        return {'times': self.times.tolist(), 'clouds': self.clouds.tolist()}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, list]) -> 'CloudForecast':
+        return cls(
+            times=np.array(data['times'], dtype=np.int64),
+            clouds=np.array(data['clouds'], dtype=np.float32)
+        )
+
+
+def _encode_cached(value):
+    """JSON encoder for values stored in cached weather results."""
+    if isinstance(value, CloudForecast):
+        return value.to_dict()
+    return value.isoformat()
+
+
+class WeatherCache:
+    """In-memory weather results per geohash tile, with a TTL and LRU eviction."""
+    
+    def __init__(self, ttl_s: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, tile: str) -> Optional[Dict[str, Any]]:
+        """Cached result for a tile, or None if missing or older than the TTL."""
+        entry = self._entries.get(tile)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.time() - stored_at > self.ttl_s:
+            self._remove(tile)
+            return None
+        self._entries.move_to_end(tile)
+        return result
+    
+    def put(self, tile: str, result: Dict[str, Any], stored_at: Optional[float] = None):
+        self._entries[tile] = (time.time() if stored_at is None else stored_at, result)
+        self._entries.move_to_end(tile)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+    
+    def _remove(self, tile: str):
+        del self._entries[tile]
+    
+    def flush(self):
+        """Persist pending changes; nothing to do in memory."""
+    
+    def close(self):
+        self.flush()
+
+
+class DiskWeatherCache(WeatherCache):
+    """WeatherCache backed by a SQLite file, so cached tiles survive restarts.
+    
+    Reads are served from memory. Writes and evictions are collected and
+    written in one transaction per `flush()`, once per fetch cycle.
+    """
+    
+    def __init__(self, ttl_s: float, max_entries: int, path: str):
+        super().__init__(ttl_s, max_entries)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS weather_cache "
+            "(tile TEXT PRIMARY KEY, stored_at REAL NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._dirty: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._deleted = set()
+        self._load()
+    
+    def _load(self):
+        cutoff = time.time() - self.ttl_s
+        self._conn.execute("DELETE FROM weather_cache WHERE stored_at < ?", (cutoff,))
+        rows = self._conn.execute(
+            "SELECT tile, stored_at, payload FROM weather_cache ORDER BY stored_at"
+        ).fetchall()
+        for tile, stored_at, payload in rows:
+            result = json.loads(payload)
+            result['timestamp'] = datetime.fromisoformat(result['timestamp'])
+            if 'forecast' in result:
+                result['forecast'] = CloudForecast.from_dict(result['forecast'])
+            WeatherCache.put(self, tile, result, stored_at)
+        self._deleted.clear()
+        self._conn.commit()
+        logger.info(f"Loaded {len(self)} cached weather tiles")
+    
+    def put(self, tile: str, result: Dict[str, Any], stored_at: Optional[float] = None):
+        super().put(tile, result, stored_at)
+        if tile in self._entries:
+            self._dirty[tile] = self._entries[tile]
+            self._deleted.discard(tile)
+    
+    def _remove(self, tile: str):
+        super()._remove(tile)
+        self._dirty.pop(tile, None)
+        self._deleted.add(tile)
+    
+    def flush(self):
+        if not self._dirty and not self._deleted:
+            return
+        rows = [
+            (tile, stored_at, json.dumps(result, default=_encode_cached))
+            for tile, (stored_at, result) in self._dirty.items()
+        ]
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO weather_cache VALUES (?, ?, ?)", rows)
+            self._conn.executemany("DELETE FROM weather_cache WHERE tile = ?", [(t,) for t in self._deleted])
+        self._dirty.clear()
+        self._deleted.clear()
+    
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+def create_weather_cache() -> WeatherCache:
+    """Weather cache from settings; on disk when WEATHER_CACHE_PATH is set.
+    
+    In forecast mode an entry holds the tile's hourly series, so it lives
+    until the next forecast refresh instead of the current-weather TTL.
+    """
+    ttl_s = settings.weather_forecast_refresh_s if settings.weather_mode == 'forecast' else settings.weather_cache_ttl_s
+    if settings.weather_cache_path:
+        return DiskWeatherCache(ttl_s, settings.weather_cache_max_entries, settings.weather_cache_path)
+    return WeatherCache(ttl_s, settings.weather_cache_max_entries)
+
+
 class WeatherDataFetcher:
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        # Falls back to the shared pooled client when none is injected
+        self.client = client
         self.api_key = settings.openweather_key
         self.base_url = "https://api.openweathermap.org/data/2.5/weather"
+        self.onecall_url = "https://api.openweathermap.org/data/3.0/onecall"
+        
+        # "current" fetches clouds each cycle; "forecast" fetches the hourly series once per refresh
+        self.mode = settings.weather_mode
+        
+        # Shared across cycles so the provider's per-minute quota is respected
+        self.max_concurrency = settings.weather_max_concurrency
+        self.rate_limiter = TokenBucket(
+            rate=settings.weather_rate_per_min / 60.0,
+            capacity=settings.weather_rate_burst
+        )
+        self.max_retries = settings.weather_max_retries
+        
+        # Locations are snapped to geohash tiles, fetched once per tile and cached for the TTL
+        self.tile_precision = settings.weather_tile_precision
+        self.cache = create_weather_cache()
+    
+    async def _get(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Rate-limited GET returning the JSON body, retrying on 429."""
+        client = self.client or get_http_client()
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            response = await client.get(url, params=params, timeout=30.0)
+            if response.status_code != 429 or attempt == self.max_retries:
+                break
+            
+            # Quota exceeded anyway (e.g. shared key): honour Retry-After before retrying
+            retry_after = float(response.headers.get('Retry-After') or 1.0)
+            logger.warning(f"Weather API rate limited, retrying in {retry_after:.1f}s")
+            await asyncio.sleep(retry_after)
+        
+        response.raise_for_status()
+        return response.json()
     
     async def fetch_weather_data(self, lat: float, lon: float) -> Optional[Dict[str, Any]]:
         """Fetch weather data including cloud coverage for a specific location."""
@@ -22,24 +245,21 @@ class WeatherDataFetcher:
                 'appid': self.api_key
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.base_url, params=params, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                
-                current_clouds = data.get('clouds', {}).get('all', 100)
-                
-                result = {
-                    'lat': lat,
-                    'lon': lon,
-                    'clouds': current_clouds,
-                    'current_clouds': current_clouds,
-                    'timestamp': datetime.utcnow()
-                }
-                
-                logger.debug(f"Weather data for {lat:.2f},{lon:.2f}: {current_clouds}% clouds")
-                return result
-                
+            data = await self._get(self.base_url, params)
+            
+            current_clouds = data.get('clouds', {}).get('all', 100)
+            
+            result = {
+                'lat': lat,
+                'lon': lon,
+                'clouds': current_clouds,
+                'current_clouds': current_clouds,
+                'timestamp': datetime.utcnow()
+            }
+            
+            logger.debug(f"Weather data for {lat:.2f},{lon:.2f}: {current_clouds}% clouds")
+            return result
+            
         except httpx.RequestError as e:
             logger.error(f"Error fetching weather data for {lat},{lon}: {e}")
             return None
@@ -47,23 +267,112 @@ class WeatherDataFetcher:
             logger.error(f"Unexpected error processing weather data: {e}")
             return None
     
-    async def fetch_weather_for_multiple_locations(self, locations: list) -> Dict[str, Any]:
-        """Fetch weather data for multiple locations concurrently."""
-        tasks = []
-        for lat, lon in locations:
-            task = self.fetch_weather_data(lat, lon)
-            tasks.append(task)
+    async def fetch_cloud_forecast(self, lat: float, lon: float) -> Optional[Dict[str, Any]]:
+        """Fetch the current and hourly cloud forecast for a location from OneCall."""
+        try:
+            params = {
+                'lat': lat,
+                'lon': lon,
+                'exclude': 'minutely,daily,alerts',
+                'appid': self.api_key
+            }
+            
+            data = await self._get(self.onecall_url, params)
+            forecast = CloudForecast.from_onecall(data)
+            if len(forecast.times) == 0:
+                logger.warning(f"Empty cloud forecast for {lat:.2f},{lon:.2f}")
+                return None
+            
+            logger.debug(f"Cloud forecast for {lat:.2f},{lon:.2f}: {len(forecast.times)} steps")
+            return {
+                'lat': lat,
+                'lon': lon,
+                'forecast': forecast,
+                'timestamp': datetime.utcnow()
+            }
+            
+        except httpx.RequestError as e:
+            logger.error(f"Error fetching cloud forecast for {lat},{lon}: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error processing cloud forecast: {e}")
+            return None
+    
+    def _interpolated(self, result: Dict[str, Any], epoch: float) -> Dict[str, Any]:
+        """Per-cycle view of a cached tile forecast, with clouds interpolated to `epoch`."""
+        # Whole percent, like the API reports, so small drifts don't change the cycle fingerprint
+        clouds = round(result['forecast'].at(epoch))
+        return {**result, 'clouds': clouds, 'current_clouds': clouds}
+    
+    async def fetch_weather_for_multiple_locations(self, locations: list,
+                                                   priorities: Optional[list] = None) -> Dict[str, Any]:
+        """Fetch weather data for multiple locations, one request per uncached tile.
+        
+        Locations are snapped to geohash tiles of `tile_precision` characters;
+        tiles with a fresh cached result cost no request. Misses are fetched
+        at the tile center with at most `max_concurrency` requests in flight,
+        every request waiting on the rate limiter. Tiles with a higher
+        priority are fetched first, so the users closest to an alert get real
+        cloud data even if the quota runs out later in the cycle.
+        
+        In forecast mode a tile's hourly series is fetched once per refresh
+        and every cycle interpolates it to the current time.
+        """
+        precision = self.tile_precision
+        lats = np.array([location[0] for location in locations], dtype=float)
+        lons = np.array([location[1] for location in locations], dtype=float)
+        codes, inverse = np.unique(geohash_codes(lats, lons, precision), return_inverse=True)
+        tile_priority = np.zeros(len(codes))
+        if priorities is not None:
+            np.maximum.at(tile_priority, inverse, np.asarray(priorities, dtype=float))
+        
+        tiles: Dict[str, Dict[str, Any]] = {}
+        misses: List[Tuple[float, str]] = []
+        for code, priority in zip(codes.tolist(), tile_priority.tolist()):
+            tile = geohash_from_code(code, precision)
+            cached = self.cache.get(tile)
+            if cached is not None:
+                tiles[tile] = cached
+            else:
+                misses.append((priority, tile))
+        misses.sort(key=lambda miss: miss[0], reverse=True)
+        
+        pending = iter(misses)
+        
+        async def worker():
+            # Workers share one iterator, so tiles start strictly in priority order
+            for _, tile in pending:
+                try:
+                    if self.mode == 'forecast':
+                        result = await self.fetch_cloud_forecast(*geohash_center(tile))
+                    else:
+                        result = await self.fetch_weather_data(*geohash_center(tile))
+                except Exception as e:
+                    logger.error(f"Weather fetch error: {e}")
+                    continue
+                if isinstance(result, dict):
+                    result['tile'] = tile
+                    tiles[tile] = result
+                    self.cache.put(tile, result)
+        
+        await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, len(misses)))))
+        self.cache.flush()
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        fetched = len(tiles) - (len(codes) - len(misses))
+        logger.info(f"Weather for {len(locations)} locations in {len(codes)} tiles: "
+                    f"{len(codes) - len(misses)} cached, {fetched} fetched")
+        if len(tiles) < len(codes):
+            logger.warning(f"Weather unavailable for {len(codes) - len(tiles)} of {len(codes)} tiles")
         
-        valid_results = []
-        for result in results:
-            if isinstance(result, dict):
-                valid_results.append(result)
-            elif isinstance(result, Exception):
-                logger.error(f"Weather fetch error: {result}")
+        if self.mode == 'forecast':
+            now = time.time()
+            tiles = {tile: self._interpolated(result, now) for tile, result in tiles.items()}
         
+        valid_results = list(tiles.values())
         return {
             'weather_data': valid_results,
+            'index': index_weather(valid_results),
+            'tiles': tiles,
+            'tile_precision': precision,
             'timestamp': datetime.utcnow()
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from ..api.database import Database
+from ..engine.models import AuroraAlert, OutboxMessage, User
+from ..utils.config import settings
+from .fcm_service import FCMService, SendResult, summarize_results
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two attempts at the same message
+MAX_BACKOFF_S = 3600.0
+# Failures that will fail the same way on every retry
+PERMANENT_ERRORS = {'SenderIdMismatchError', 'InvalidArgumentError'}
+
+
+def user_entry(alert: AuroraAlert, user: User, topic: Optional[str] = None) -> Dict:
+    """Outbox entry for one device; `topic` is the region topic the user leaves once reached."""
+    return {
+        'kind': 'user',
+        'user_id': user.id,
+        'payload': {
+            'alert': alert.model_dump(mode='json'),
+            'token': user.fcm_token,
+            'lat': user.lat,
+            'lon': user.lon,
+            'topic': topic
+        }
+    }
+
+
+def topic_entry(alert: AuroraAlert, topic: str, tokens: List[str], user_ids: List[int]) -> Dict:
+    """Outbox entry for a region topic send; the reached `tokens` leave the topic afterwards."""
+    return {
+        'kind': 'topic',
+        'payload': {'alert': alert.model_dump(mode='json'), 'topic': topic, 'tokens': tokens, 'user_ids': user_ids}
+    }
+
+
+def subscribe_entry(topic: str, tokens: List[str], user_ids: List[int]) -> Dict:
+    """Outbox entry putting users into their region topic; each is recorded as a member once FCM confirms."""
+    return {'kind': 'subscribe', 'payload': {'topic': topic, 'tokens': tokens, 'user_ids': user_ids}}
+
+
+def unsubscribe_entry(topic: str, tokens: List[str], user_ids: List[int]) -> Dict:
+    """Outbox entry taking users out of their region topic; each stops being a member once FCM confirms."""
+    return {'kind': 'unsubscribe', 'payload': {'topic': topic, 'tokens': tokens, 'user_ids': user_ids}}
+
+
+class DeliveryWorker:
+    """Drains the notification outbox independently of aurora evaluation.
+
+    Due messages are leased in id order, up to `batch_size` per FCM batch and
+    `concurrency` batches in flight. Failed attempts are retried with
+    exponential backoff until `max_attempts`; dead tokens are never retried
+    and their users are deactivated. A message is marked sent only after FCM
+    accepted it, in the same transaction that starts the cooldown of the
+    users it reached, so a message that goes dead starts no cooldown. Reached
+    users then leave their region topic; a leave FCM rejects is queued again
+    as an unsubscribe entry, and the user stays a member until one succeeds. A
+    worker that dies mid-send leaves its lease to expire, so the message is
+    sent again rather than lost. Every message carries its
+    outbox id as collapse key, so such a resend replaces the first copy on
+    the device instead of showing twice.
+    """
+
+    def __init__(self, database: Database, fcm_service: FCMService):
+        self.database = database
+        self.fcm_service = fcm_service
+        self.batch_size = settings.outbox_batch_size
+        self.concurrency = settings.outbox_concurrency
+        self.max_attempts = settings.outbox_max_attempts
+        self.backoff_s = settings.outbox_backoff_s
+        self.lease_s = settings.outbox_lease_s
+        self.poll_interval_s = settings.outbox_poll_interval_s
+
+        # Users deactivated for dead tokens since start
+        self.pruned_total = 0
+        self._stopping = asyncio.Event()
+
+    def _retry_at(self, attempts: int, now: datetime) -> Optional[datetime]:
+        """When to try again after `attempts` failed attempts, or None once they are used up."""
+        if attempts >= self.max_attempts:
+            return None
+        return now + timedelta(seconds=min(self.backoff_s * 2 ** (attempts - 1), MAX_BACKOFF_S))
+
+    async def run_once(self) -> Dict[str, int]:
+        """Deliver one round of due messages and return per-outcome counts."""
+        # Database calls block, so they run on worker threads off the event loop
+        claimed = await asyncio.to_thread(
+            self.database.claim_outbox, self.batch_size * self.concurrency, self.lease_s
+        )
+        stats = {'claimed': len(claimed), 'sent': 0, 'retried': 0, 'dead': 0, 'pruned': 0}
+        if not claimed:
+            return stats
+
+        users = [message for message in claimed if message.kind == 'user']
+        others = [message for message in claimed if message.kind != 'user']
+        jobs = [self._deliver_users(users[i:i + self.batch_size]) for i in range(0, len(users), self.batch_size)]
+        jobs += [self._deliver_one(message) for message in others]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(job):
+            async with semaphore:
+                return await job
+
+        outcomes = await asyncio.gather(*(bounded(job) for job in jobs))
+
+        now = datetime.utcnow()
+        delivered = [message_id for done, _, _ in outcomes for message_id in done]
+        failures = [
+            (message.id, None if permanent else self._retry_at(message.attempts, now), error)
+            for _, failed, _ in outcomes for message, error, permanent in failed
+        ]
+        messages = {message.id: message for message in claimed}
+        notified = [user_id for message_id in delivered for user_id in self._reached(messages[message_id])]
+        left, retry = await self._leave_topics([messages[message_id] for message_id in delivered])
+        # Retries are queued first, so a crash in between repeats a leave rather than losing it
+        if retry:
+            await asyncio.to_thread(self.database.enqueue_outbox, retry, now)
+        await asyncio.to_thread(self.database.complete_outbox, delivered, notified, now, left)
+        await asyncio.to_thread(self.database.fail_outbox, failures)
+
+        invalid = [user_id for _, _, dead_users in outcomes for user_id in dead_users]
+        if invalid:
+            stats['pruned'] = await asyncio.to_thread(self.database.deactivate_users, invalid)
+            self.pruned_total += stats['pruned']
+
+        stats['sent'] = len(delivered)
+        stats['retried'] = sum(1 for _, next_attempt_at, _ in failures if next_attempt_at is not None)
+        stats['dead'] = len(failures) - stats['retried']
+        logger.info(f"Outbox delivery: {stats}")
+        return stats
+
+    @staticmethod
+    def _reached(message: OutboxMessage) -> List[int]:
+        """Users whose cooldown starts once `message` is delivered."""
+        if message.kind == 'user':
+            return [message.user_id]
+        if message.kind == 'topic':
+            return message.payload.get('user_ids', [])
+        return []
+
+    async def _leave_topics(self, delivered: List[OutboxMessage]) -> Tuple[List[int], List[Dict]]:
+        """Take the users reached by `delivered` out of their region topic.
+
+        Returns the users FCM confirmed left, and unsubscribe entries for
+        the rest, so a later topic send cannot reach them during cooldown.
+        """
+        leaving: Dict[str, Tuple[List[str], List[int]]] = {}
+        for message in delivered:
+            topic = message.payload.get('topic')
+            if not topic or message.kind not in ('user', 'topic'):
+                continue
+            tokens, user_ids = leaving.setdefault(topic, ([], []))
+            if message.kind == 'user':
+                tokens.append(message.payload['token'])
+                user_ids.append(message.user_id)
+            else:
+                tokens.extend(message.payload['tokens'])
+                user_ids.extend(message.payload.get('user_ids', []))
+        if not leaving:
+            return [], []
+
+        results = await asyncio.gather(*(
+            self.fcm_service.topic_membership_results(tokens, topic, subscribe=False)
+            for topic, (tokens, _) in leaving.items()
+        ))
+        left, retry = [], []
+        for (topic, (tokens, user_ids)), succeeded in zip(leaving.items(), results):
+            left += [user_id for user_id, ok in zip(user_ids, succeeded) if ok]
+            stayed = [i for i, ok in enumerate(succeeded) if not ok]
+            if stayed:
+                retry.append(unsubscribe_entry(
+                    topic, [tokens[i] for i in stayed], [user_ids[i] for i in stayed]
+                ))
+        if retry:
+            logger.warning(f"{sum(len(entry['payload']['tokens']) for entry in retry)} users failed "
+                           f"to leave their topic, queued for retry")
+        return left, retry
+
+    async def _deliver_users(self, messages: List[OutboxMessage]) -> Tuple[List[int], List, List[int]]:
+        """Send one FCM batch of device messages; returns (sent ids, failures, users with dead tokens)."""
+        alerts_and_users = [
+            (
+                AuroraAlert(**message.payload['alert']),
+                User(id=message.user_id, lat=message.payload['lat'], lon=message.payload['lon'],
+                     fcm_token=message.payload['token'])
+            )
+            for message in messages
+        ]
+        results: List[SendResult] = await self.fcm_service.send_notifications_batch(
+            alerts_and_users, collapse_keys=[f"aurora-{message.id}" for message in messages]
+        )
+        logger.info(f"Outbox batch results: {summarize_results(results)}")
+
+        done, failed, dead_users = [], [], []
+        for message, result in zip(messages, results):
+            if result.success:
+                done.append(message.id)
+            elif result.invalid_token:
+                failed.append((message, result.error, True))
+                dead_users.append(message.user_id)
+            else:
+                failed.append((message, result.error, result.error_code in PERMANENT_ERRORS))
+        return done, failed, dead_users
+
+    async def _deliver_one(self, message: OutboxMessage) -> Tuple[List[int], List, List[int]]:
+        """Send a topic message or apply a subscription or unsubscription."""
+        topic = message.payload['topic']
+        tokens = message.payload['tokens']
+        if message.kind in ('subscribe', 'unsubscribe'):
+            subscribe = message.kind == 'subscribe'
+            results = await self.fcm_service.topic_membership_results(tokens, topic, subscribe=subscribe)
+            # Only confirmed members count towards topic sends
+            changed = [user_id for user_id, succeeded in zip(message.payload.get('user_ids', []), results) if succeeded]
+            if changed:
+                await asyncio.to_thread(self.database.set_topic_members, changed, topic if subscribe else None)
+            # Membership changes are idempotent, so a partial failure retries the whole entry
+            failed = results.count(False)
+            if failed:
+                return [], [(message, f"{failed} of {len(tokens)} tokens failed", False)], []
+            return [message.id], [], []
+
+        result = await self.fcm_service.send_topic_notification(
+            AuroraAlert(**message.payload['alert']), topic, collapse_key=f"aurora-{message.id}"
+        )
+        if not result.success:
+            return [], [(message, result.error, result.error_code in PERMANENT_ERRORS)], []
+        return [message.id], [], []
+
+    async def run_forever(self):
+        """Keep draining the outbox until stop() is called."""
+        logger.info("Outbox delivery worker started")
+        while not self._stopping.is_set():
+            try:
+                stats = await self.run_once()
+            except Exception as e:
+                logger.error(f"Error in outbox delivery: {e}")
+                stats = {'claimed': 0}
+            # A full round suggests more is due; otherwise wait for the next poll
+            if stats['claimed'] < self.batch_size * self.concurrency:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval_s)
+                except asyncio.TimeoutError:
+                    pass
+        logger.info("Outbox delivery worker stopped")
+
+    def stop(self):
+        """Ask run_forever() to return after the current round."""
+        self._stopping.set()
@@ -1,18 +1,66 @@
 import asyncio
-from typing import List, Dict, Any
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
 import logging
 from firebase_admin import credentials, messaging
+from firebase_admin import exceptions as firebase_exceptions
 import firebase_admin
 from ..utils.config import settings
 from ..engine.models import User, AuroraAlert
 
 logger = logging.getLogger(__name__)
 
+# FCM accepts at most 500 messages per send_each call and 1000 tokens per topic update
+FCM_BATCH_LIMIT = 500
+TOPIC_BATCH_LIMIT = 1000
+
+
+@dataclass
+class SendResult:
+    """Delivery outcome for one user's notification."""
+    user_id: Optional[int]
+    success: bool
+    message_id: Optional[str] = None
+    # FCM exception class, e.g. "UnregisteredError"; None on success
+    error_code: Optional[str] = None
+    error: Optional[str] = None
+    # The token will never work again, so the user should be deactivated
+    invalid_token: bool = False
+
+
+def is_invalid_token_error(exception: Exception) -> bool:
+    """Whether a send failure means the device token itself is dead or malformed."""
+    if isinstance(exception, messaging.UnregisteredError):
+        return True
+    # INVALID_ARGUMENT also covers bad payloads; only token complaints mean the token is bad
+    return (isinstance(exception, firebase_exceptions.InvalidArgumentError)
+            and 'token' in str(exception).lower())
+
+
+def summarize_results(results: List[SendResult]) -> Dict[str, int]:
+    """Aggregate sent/failed/invalid-token counts for logging."""
+    sent = sum(1 for result in results if result.success)
+    invalid = sum(1 for result in results if result.invalid_token)
+    return {"sent": sent, "failed": len(results) - sent, "invalid_tokens": invalid}
+
 
 class FCMService:
-    def __init__(self):
-        self.app = None
-        self.initialize_firebase()
+    def __init__(self, app: Optional[firebase_admin.App] = None):
+        # Blocking SDK calls run here so the event loop never waits on FCM
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.fcm_send_workers, thread_name_prefix='fcm-send'
+        )
+        self.batch_size = min(settings.fcm_batch_size, FCM_BATCH_LIMIT)
+        self.app = app
+        if app is None:
+            self.initialize_firebase()
+    
+    async def _run_blocking(self, func, *args):
+        """Run a blocking Firebase SDK call on the send pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
     
     def initialize_firebase(self):
         """Initialize Firebase Admin SDK."""
@@ -34,10 +82,8 @@ class FCMService:
             logger.error(f"Failed to initialize Firebase: {e}")
             self.app = None
     
-    def create_aurora_notification(self, alert: AuroraAlert, user: User) -> messaging.Message:
-        """Create a push notification message for aurora alert."""
-        
-        # Create notification title and body
+    def _aurora_content(self, alert: AuroraAlert) -> tuple:
+        """Notification title and body for an aurora alert."""
         title = f"Aurora Alert! {alert.max_prob:.0f}% probability"
         
         # Create helpful message body
@@ -49,10 +95,18 @@ class FCMService:
         if alert.is_night:
             body_parts.append("Look north for best viewing!")
         
-        body = " • ".join(body_parts)
+        return title, " • ".join(body_parts)
+    
+    def _build_message(self, alert: AuroraAlert, data: Dict[str, str], token: Optional[str] = None,
+                       topic: Optional[str] = None, collapse_key: Optional[str] = None) -> messaging.Message:
+        """Aurora alert message addressed to a device token or a topic.
+        
+        Messages sharing a collapse key replace each other on the device, so a
+        message sent again after a crash is not shown twice.
+        """
+        title, body = self._aurora_content(alert)
         
-        # Create the message
-        message = messaging.Message(
+        return messaging.Message(
             notification=messaging.Notification(
                 title=title,
                 body=body,
@@ -63,12 +117,13 @@ class FCMService:
                 'cloud_coverage': str(alert.cloud_coverage),
                 'is_night': str(alert.is_night),
                 'timestamp': alert.timestamp.isoformat(),
-                'user_lat': str(user.lat),
-                'user_lon': str(user.lon),
+                **data
             },
-            token=user.fcm_token,
+            token=token,
+            topic=topic,
             android=messaging.AndroidConfig(
                 priority='high',
+                collapse_key=collapse_key,
                 notification=messaging.AndroidNotification(
                     icon='aurora_icon',
                     color='#4CAF50',
@@ -76,6 +131,7 @@ class FCMService:
                 )
             ),
             apns=messaging.APNSConfig(
+                headers={'apns-collapse-id': collapse_key} if collapse_key else None,
                 payload=messaging.APNSPayload(
                     aps=messaging.Aps(
                         alert=messaging.ApsAlert(
@@ -88,8 +144,19 @@ class FCMService:
                 )
             )
         )
-        
-        return message
+    
+    def create_aurora_notification(self, alert: AuroraAlert, user: User,
+                                   collapse_key: Optional[str] = None) -> messaging.Message:
+        """Create a push notification message for aurora alert."""
+        return self._build_message(
+            alert, {'user_lat': str(user.lat), 'user_lon': str(user.lon)}, token=user.fcm_token,
+            collapse_key=collapse_key
+        )
+    
+    def create_topic_notification(self, alert: AuroraAlert, topic: str,
+                                  collapse_key: Optional[str] = None) -> messaging.Message:
+        """Create one aurora alert message for every member of a region topic."""
+        return self._build_message(alert, {'topic': topic}, topic=topic, collapse_key=collapse_key)
     
     async def send_notification(self, alert: AuroraAlert, user: User) -> bool:
         """Send a notification to a single user."""
@@ -101,7 +168,7 @@ class FCMService:
             message = self.create_aurora_notification(alert, user)
             
             # Send the message
-            response = messaging.send(message)
+            response = await self._run_blocking(messaging.send, message, False, self.app)
             logger.info(f"Successfully sent notification to user {user.id}: {response}")
             return True
             
@@ -115,51 +182,116 @@ class FCMService:
             logger.error(f"Failed to send notification to user {user.id}: {e}")
             return False
     
-    async def send_notifications_batch(self, alerts_and_users: List[tuple]) -> Dict[str, int]:
-        """Send notifications to multiple users."""
+    async def send_notifications_batch(self, alerts_and_users: List[tuple],
+                                       collapse_keys: Optional[List[str]] = None) -> List[SendResult]:
+        """Send notifications to multiple users and return one result per input, in order.
+        
+        Messages go out in chunks of at most 500 through messaging.send_each.
+        Chunks run concurrently on the bounded send pool; further chunks
+        wait for a free worker.
+        """
+        results: List[Optional[SendResult]] = [None] * len(alerts_and_users)
         if not self.app:
             logger.error("Firebase not initialized, cannot send notifications")
-            return {"sent": 0, "failed": 0}
-        
-        results = {"sent": 0, "failed": 0}
+            return [
+                SendResult(user.id, False, error_code='NotInitialized', error="Firebase not initialized")
+                for _, user in alerts_and_users
+            ]
         
         # Create all messages
         messages = []
-        users = []
+        positions = []
         
-        for alert, user in alerts_and_users:
+        for i, (alert, user) in enumerate(alerts_and_users):
             try:
-                message = self.create_aurora_notification(alert, user)
-                messages.append(message)
-                users.append(user)
+                collapse_key = collapse_keys[i] if collapse_keys else None
+                messages.append(self.create_aurora_notification(alert, user, collapse_key))
+                positions.append(i)
             except Exception as e:
                 logger.error(f"Failed to create message for user {user.id}: {e}")
-                results["failed"] += 1
+                results[i] = SendResult(user.id, False, error_code=type(e).__name__, error=str(e))
         
-        if not messages:
-            return results
-        
-        try:
-            # Send batch messages (up to 500 at a time)
-            batch_response = messaging.send_all(messages)
+        async def send_chunk(start: int):
+            chunk_positions = positions[start:start + self.batch_size]
+            chunk = messages[start:start + self.batch_size]
+            try:
+                batch_response = await self._run_blocking(messaging.send_each, chunk, False, self.app)
+            except Exception as e:
+                logger.error(f"Failed to send notification batch of {len(chunk)}: {e}")
+                for i in chunk_positions:
+                    user = alerts_and_users[i][1]
+                    results[i] = SendResult(user.id, False, error_code=type(e).__name__, error=str(e))
+                return
             
-            # Process results
-            for i, response in enumerate(batch_response.responses):
-                user = users[i]
+            for i, response in zip(chunk_positions, batch_response.responses):
+                user = alerts_and_users[i][1]
                 if response.success:
-                    logger.info(f"Successfully sent notification to user {user.id}")
-                    results["sent"] += 1
+                    results[i] = SendResult(user.id, True, message_id=response.message_id)
                 else:
-                    logger.error(f"Failed to send notification to user {user.id}: {response.exception}")
-                    results["failed"] += 1
-            
-            logger.info(f"Batch notification results: {results}")
-            return results
-            
+                    logger.warning(f"Failed to send notification to user {user.id}: {response.exception}")
+                    results[i] = SendResult(
+                        user.id, False,
+                        error_code=type(response.exception).__name__,
+                        error=str(response.exception),
+                        invalid_token=is_invalid_token_error(response.exception)
+                    )
+        
+        await asyncio.gather(*(send_chunk(start) for start in range(0, len(messages), self.batch_size)))
+        
+        logger.info(f"Batch notification results: {summarize_results(results)}")
+        return results
+    
+    async def send_topic_notification(self, alert: AuroraAlert, topic: str,
+                                      collapse_key: Optional[str] = None) -> SendResult:
+        """Send one alert to a region topic."""
+        if not self.app:
+            logger.error("Firebase not initialized, cannot send topic notification")
+            return SendResult(None, False, error_code='NotInitialized', error="Firebase not initialized")
+        
+        try:
+            message = self.create_topic_notification(alert, topic, collapse_key)
+            response = await self._run_blocking(messaging.send, message, False, self.app)
+            logger.info(f"Sent topic notification to {topic}: {response}")
+            return SendResult(None, True, message_id=response)
         except Exception as e:
-            logger.error(f"Failed to send batch notifications: {e}")
-            results["failed"] += len(messages)
-            return results
+            logger.error(f"Failed to send topic notification to {topic}: {e}")
+            return SendResult(None, False, error_code=type(e).__name__, error=str(e))
+    
+    async def topic_membership_results(self, tokens: List[str], topic: str, subscribe: bool) -> List[bool]:
+        """Subscribe or unsubscribe tokens to a topic; returns whether each token succeeded."""
+        if not self.app or not tokens:
+            return [False] * len(tokens)
+        
+        func = messaging.subscribe_to_topic if subscribe else messaging.unsubscribe_from_topic
+        chunks = [tokens[i:i + TOPIC_BATCH_LIMIT] for i in range(0, len(tokens), TOPIC_BATCH_LIMIT)]
+        
+        async def update_chunk(chunk: List[str]) -> List[bool]:
+            try:
+                response = await self._run_blocking(func, chunk, topic, self.app)
+            except Exception as e:
+                logger.error(f"Failed to update membership of {topic} for {len(chunk)} tokens: {e}")
+                return [False] * len(chunk)
+            if response.failure_count:
+                logger.warning(f"{response.failure_count} of {len(chunk)} tokens failed "
+                               f"{'subscribing to' if subscribe else 'unsubscribing from'} {topic}")
+            succeeded = [True] * len(chunk)
+            for error in response.errors:
+                succeeded[error.index] = False
+            return succeeded
+        
+        results = await asyncio.gather(*(update_chunk(chunk) for chunk in chunks))
+        return [succeeded for chunk in results for succeeded in chunk]
+    
+    async def update_topic_membership(self, tokens: List[str], topic: str, subscribe: bool) -> int:
+        """Subscribe or unsubscribe tokens to a topic; returns how many succeeded."""
+        return sum(await self.topic_membership_results(tokens, topic, subscribe))
+    
+    async def update_topics(self, members: Dict[str, List[str]], subscribe: bool) -> int:
+        """Apply membership changes for several topics at once."""
+        counts = await asyncio.gather(*(
+            self.update_topic_membership(tokens, topic, subscribe) for topic, tokens in members.items()
+        ))
+        return sum(counts)
     
     async def send_test_notification(self, fcm_token: str) -> bool:
         """Send a test notification to verify FCM token."""
@@ -176,10 +308,14 @@ class FCMService:
                 token=fcm_token,
             )
             
-            response = messaging.send(message)
+            response = await self._run_blocking(messaging.send, message, False, self.app)
             logger.info(f"Test notification sent successfully: {response}")
             return True
             
         except Exception as e:
             logger.error(f"Failed to send test notification: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def close(self):
+        """Wait for in-flight sends and stop the send pool."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from typing import Dict
+import numpy as np
+
+from ..engine.batch import UserBatch
+from ..engine.geo import geohash, geohash_codes, geohash_from_code
+
+TOPIC_PREFIX = 'aurora'
+# Thresholds are grouped in bands this many points wide
+THRESHOLD_BAND = 5
+
+
+def threshold_band(threshold: float) -> int:
+    return int(threshold) // THRESHOLD_BAND * THRESHOLD_BAND
+
+
+def region_topic(lat: float, lon: float, threshold: float, precision: int) -> str:
+    """FCM topic for a coarse region (geohash cell) and threshold band, e.g. 'aurora-bcs-t15'."""
+    return f"{TOPIC_PREFIX}-{geohash(lat, lon, precision)}-t{threshold_band(threshold)}"
+
+
+def region_topics(batch: UserBatch, precision: int) -> np.ndarray:
+    """Region topic of every user in a batch; names are built once per distinct topic."""
+    codes = geohash_codes(batch.lat, batch.lon, precision)
+    bands = (batch.threshold // THRESHOLD_BAND * THRESHOLD_BAND).astype(np.int64)
+    keys, inverse = np.unique(codes * 1000 + bands, return_inverse=True)
+    names = np.array(
+        [f"{TOPIC_PREFIX}-{geohash_from_code(key // 1000, precision)}-t{key % 1000}" for key in keys.tolist()],
+        dtype=object
+    )
+    return names[inverse.ravel()]
+
+
+@dataclass
+class TopicPlan:
+    """Who is reached through a region topic this cycle and who is notified individually.
+
+    A topic member is subscribed while out of cooldown, so a topic send
+    reaches every `subscribed` user of that topic.
+    """
+    topics: Dict[str, np.ndarray]  # topic -> batch positions of the subscribed members it reaches
+    individual: np.ndarray  # batch positions of qualifying users outside any sent topic
+
+
+def plan_topic_sends(topics: np.ndarray, notify: np.ndarray, subscribed: np.ndarray,
+                     min_users: int, min_fraction: float) -> TopicPlan:
+    """Send to a topic when enough of its subscribed members individually qualify.
+
+    A topic is used once at least `min_users` members qualify and they make
+    up at least `min_fraction` of its current subscribers. That keeps a
+    topic message from reaching a region where most members are clouded out
+    or below threshold. At least one member must qualify whatever the
+    settings, since the message summarizes the qualifying members. Qualifying
+    users in other topics are notified one by one.
+    """
+    names, inverse = np.unique(topics, return_inverse=True)
+    inverse = inverse.ravel()
+    qualifying = np.bincount(inverse, weights=notify & subscribed, minlength=len(names))
+    members = np.bincount(inverse, weights=subscribed, minlength=len(names))
+
+    use_topic = (qualifying >= max(min_users, 1)) & (qualifying >= min_fraction * np.maximum(members, 1))
+    reached = use_topic[inverse] & subscribed
+
+    # Group reached positions by topic with one sort
+    positions = np.flatnonzero(reached)
+    positions = positions[np.argsort(inverse[positions], kind='stable')]
+    groups = inverse[positions]
+    plan_topics = {
+        names[group[0]]: members_of
+        for members_of, group in zip(
+            np.split(positions, np.flatnonzero(np.diff(groups)) + 1),
+            np.split(groups, np.flatnonzero(np.diff(groups)) + 1)
+        )
+        if len(members_of)
+    }
+    return TopicPlan(topics=plan_topics, individual=np.flatnonzero(notify & ~reached))
@@ -1,6 +1,9 @@
 import asyncio
 import logging
+from contextlib import aclosing
 from datetime import datetime
+from typing import AsyncIterator, Dict, List
+import numpy as np
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
@@ -8,16 +11,28 @@ try:
     # Try relative imports (when run as module)
     from .ingest.aurora_data import AuroraDataFetcher
     from .ingest.weather_data import WeatherDataFetcher
+    from .ingest.http_client import close_http_client
     from .engine.aurora_engine import AuroraEngine
+    from .engine.batch import UserBatch
+    from .engine.gate import latest_kp
+    from .engine.incremental import IncrementalEvaluator
     from .notify.fcm_service import FCMService
+    from .notify.delivery import DeliveryWorker, subscribe_entry, topic_entry, user_entry
+    from .notify.topics import plan_topic_sends, region_topics
     from .api.database import Database
     from .utils.config import settings
 except ImportError:
     # Fall back to absolute imports (when run directly)
     from ingest.aurora_data import AuroraDataFetcher
     from ingest.weather_data import WeatherDataFetcher
+    from ingest.http_client import close_http_client
     from engine.aurora_engine import AuroraEngine
+    from engine.batch import UserBatch
+    from engine.gate import latest_kp
+    from engine.incremental import IncrementalEvaluator
     from notify.fcm_service import FCMService
+    from notify.delivery import DeliveryWorker, subscribe_entry, topic_entry, user_entry
+    from notify.topics import plan_topic_sends, region_topics
     from api.database import Database
     from utils.config import settings
 
@@ -31,9 +46,24 @@ class AuroraScheduler:
         self.aurora_fetcher = AuroraDataFetcher()
         self.weather_fetcher = WeatherDataFetcher()
         self.engine = AuroraEngine()
+        self.evaluator = (
+            IncrementalEvaluator(self.engine, settings.incremental_tolerance)
+            if settings.incremental_evaluation else self.engine
+        )
         self.fcm_service = FCMService()
         self.database = Database()
         
+        # Delivery runs beside the scheduled jobs; a cycle only queues notifications
+        self.delivery_worker = DeliveryWorker(self.database, self.fcm_service)
+        self._delivery_task = None
+        
+        # Inputs of the last evaluated cycle, to skip identical re-evaluations
+        self._last_fingerprint = None
+        self._last_notified_count = 0
+        
+        # Queued notification counts of the latest cycle
+        self.last_cycle_stats: Dict[str, int] = {}
+        
         self.setup_jobs()
     
     def setup_jobs(self):
@@ -61,77 +91,211 @@ class AuroraScheduler:
         """Main job that checks aurora conditions and sends notifications."""
         try:
             logger.info("Starting aurora condition check...")
+            self.last_cycle_stats = {}
             
-            # Get all active users
-            users = self.database.get_active_users()
-            if not users:
-                logger.info("No active users, skipping check")
-                return
-            
-            logger.info(f"Checking conditions for {len(users)} active users")
-            
-            # Fetch aurora data
-            logger.info("Fetching aurora data...")
-            aurora_data = await self.aurora_fetcher.fetch_all_data()
-            aurora_df = aurora_data.get('ovation')
-            
-            if aurora_df is None or aurora_df.empty:
-                logger.warning("No aurora data available, skipping check")
-                return
-            
-            # Get unique user locations for weather data
-            unique_locations = list(set((user.lat, user.lon) for user in users))
-            logger.info(f"Fetching weather data for {len(unique_locations)} unique locations...")
-            
-            # Fetch weather data for all unique locations
-            weather_data = await self.weather_fetcher.fetch_weather_for_multiple_locations(unique_locations)
-            
-            # Process alerts for all users
-            logger.info("Processing aurora alerts...")
-            alerts = self.engine.process_all_users(users, aurora_df, weather_data, datetime.utcnow())
-            
-            # Filter users who should be notified
-            notifications_to_send = []
-            for alert, user in zip(alerts, users):
-                if alert.should_notify:
-                    notifications_to_send.append((alert, user))
-            
-            logger.info(f"Found {len(notifications_to_send)} users to notify")
-            
-            # Send notifications
-            if notifications_to_send:
-                logger.info("Sending notifications...")
-                results = await self.fcm_service.send_notifications_batch(notifications_to_send)
+            # Users are read in column chunks on a worker thread while this cycle works
+            async with aclosing(self.stream_user_batches()) as chunks:
+                chunk = await anext(chunks, None)
+                if chunk is None:
+                    logger.info("No active users, skipping check")
+                    return
                 
-                # Update last_notified timestamp for successfully notified users
-                current_time = datetime.utcnow()
-                for (alert, user), i in zip(notifications_to_send, range(len(notifications_to_send))):
-                    # Assuming notifications were sent in the same order
-                    if i < results.get("sent", 0):
-                        self.database.update_last_notified(user.id, current_time)
+                # Fetch aurora data while later chunks load
+                logger.info("Fetching aurora data...")
+                aurora_data = await self.aurora_fetcher.fetch_all_data()
+                aurora_grid = aurora_data.get('ovation')
                 
-                logger.info(f"Notification results: {results}")
+                if aurora_grid is None:
+                    logger.warning("No aurora data available, skipping check")
+                    return
+                
+                # Gate each chunk as it arrives, until one of them could qualify
+                kp = latest_kp(aurora_data.get('kp'))
+                gate_time = datetime.utcnow()
+                loaded = []
+                gate_open = False
+                while chunk is not None:
+                    loaded.append(chunk)
+                    gate_open = gate_open or self.engine.could_any_user_qualify(chunk, aurora_grid, gate_time, kp)
+                    chunk = await anext(chunks, None)
+            
+            batch = UserBatch.concat(loaded)
+            logger.info(f"Checking conditions for {len(batch)} active users ({len(loaded)} chunks)")
+            
+            # End quiet cycles before any weather calls or per-user processing
+            if gate_open:
+                await self.evaluate_and_queue(batch, aurora_data, aurora_grid, gate_time)
             else:
-                logger.info("No notifications to send")
+                logger.info("No user can qualify this cycle, skipping weather and evaluation")
+            
+            # Subscriptions are queued last, so users notified this cycle wait out their cooldown
+            if settings.fcm_topic_mode:
+                self.sync_topic_membership(batch, datetime.utcnow())
             
             logger.info("Aurora condition check completed successfully")
             
         except Exception as e:
             logger.error(f"Error in aurora condition check: {e}")
     
+    async def evaluate_and_queue(self, batch: UserBatch, aurora_data: dict, aurora_grid, gate_time: datetime):
+        """Fetch weather, evaluate every user and queue this cycle's notifications."""
+        # Get unique user locations for weather data, prioritising users who could qualify.
+        # The ranking uses the gate's cheap bounds; radius queries run once, in evaluation
+        candidates = self.engine.notification_candidates(batch, aurora_grid, gate_time)
+        location_priority = {}
+        for location, possible in zip(zip(batch.lat.tolist(), batch.lon.tolist()), candidates.tolist()):
+            location_priority[location] = location_priority.get(location, False) or possible
+        unique_locations = list(location_priority)
+        logger.info(f"Fetching weather data for {len(unique_locations)} unique locations "
+                    f"({sum(location_priority.values())} that could qualify first)...")
+        
+        # Fetch weather data for all unique locations
+        weather_data = await self.weather_fetcher.fetch_weather_for_multiple_locations(
+            unique_locations, priorities=list(location_priority.values())
+        )
+        
+        # An unchanged grid with unchanged weather, users and day/night state yields the
+        # same decisions; skip unless last cycle queued notifications
+        now = datetime.utcnow()
+        fingerprint = self.engine.input_fingerprint(batch, aurora_grid, weather_data, now)
+        if (fingerprint is not None and fingerprint == self._last_fingerprint
+                and self._last_notified_count == 0):
+            logger.info(f"Inputs unchanged since last cycle (grid {aurora_data.get('grid_version')}), "
+                        f"skipping evaluation")
+            return
+        
+        # Evaluate all users as one columnar batch; alerts are built only for notified users
+        logger.info("Processing aurora alerts...")
+        decision = self.evaluator.evaluate_batch(batch, aurora_grid, weather_data, now)
+        
+        to_notify = int(decision.notify.sum())
+        logger.info(f"Found {to_notify} users to notify")
+        self._last_fingerprint = fingerprint
+        self._last_notified_count = to_notify
+        
+        # Queue notifications for the delivery worker
+        if to_notify:
+            logger.info("Queueing notifications...")
+            self.enqueue_notifications(batch, decision, now)
+        else:
+            logger.info("No notifications to send")
+    
+    async def stream_user_batches(self) -> AsyncIterator[UserBatch]:
+        """Active users as column chunks, read ahead on a worker thread.
+        
+        The next chunk loads while the caller awaits other I/O or works on
+        the current one. Every chunk is kept for the cycle anyway, so reading
+        ahead costs no extra memory.
+        """
+        iterator = self.database.iter_active_users(settings.user_chunk_size, as_arrays=True)
+        queue: asyncio.Queue = asyncio.Queue()
+        stopping = False
+        
+        async def produce():
+            try:
+                while not stopping:
+                    chunk = await asyncio.to_thread(next, iterator, None)
+                    if chunk is None:
+                        break
+                    queue.put_nowait(chunk)
+            finally:
+                queue.put_nowait(None)
+        
+        producer = asyncio.ensure_future(produce())
+        try:
+            while (chunk := await queue.get()) is not None:
+                yield chunk
+        finally:
+            # Let the read in flight finish, surface loading errors, then release the cursor
+            stopping = True
+            try:
+                await producer
+            finally:
+                await asyncio.to_thread(iterator.close)
+    
+    def enqueue_notifications(self, batch: UserBatch, decision, now: datetime):
+        """Queue this cycle's alerts in the outbox.
+        
+        In topic mode, region topics where enough members qualify get one
+        shared message. Everyone else who qualifies is notified individually.
+        Users reached either way leave their topic once delivered, so a later
+        topic message cannot reach them before their cooldown ends. Cooldowns
+        start at delivery, so users whose earlier message is still in the
+        outbox are left out rather than queued twice, and a topic send does
+        not count them as members.
+        """
+        pending = np.isin(batch.id, self.database.pending_outbox_users())
+        notify = decision.notify & ~pending
+        individual = np.flatnonzero(notify)
+        entries = []
+        queued: List[int] = []
+        topics = None
+        
+        if settings.fcm_topic_mode:
+            topics = region_topics(batch, settings.fcm_topic_precision)
+            # Only confirmed members are reached by a topic send
+            subscribed = (batch.topic == topics) & self.engine.cooled_down(batch, now) & ~pending
+            plan = plan_topic_sends(
+                topics, notify, subscribed, settings.fcm_topic_min_users, settings.fcm_topic_min_fraction
+            )
+            individual = plan.individual
+            for topic, members in plan.topics.items():
+                alert = decision.group_alert(members[notify[members]])
+                entries.append(topic_entry(
+                    alert, topic, batch.fcm_token[members].tolist(), batch.id[members].tolist()
+                ))
+                queued.extend(members.tolist())
+        
+        for i in individual:
+            topic = topics[i] if topics is not None else None
+            entries.append(user_entry(decision.alert(i), batch.user(i), topic))
+            queued.append(int(i))
+        
+        self.database.enqueue_outbox(entries, now)
+        self.last_cycle_stats = {'queued': len(entries), 'users': len(queued)}
+        logger.info(f"Queued {len(entries)} notifications reaching {len(queued)} users")
+    
+    def _topic_members(self, topics: np.ndarray, positions: np.ndarray) -> Dict[str, List[int]]:
+        """Batch positions per region topic."""
+        members: Dict[str, List[int]] = {}
+        for topic, position in zip(topics[positions].tolist(), positions.tolist()):
+            members.setdefault(topic, []).append(position)
+        return members
+    
+    def sync_topic_membership(self, batch: UserBatch, now: datetime):
+        """Subscribe users out of cooldown who are not confirmed members of their region topic.
+        
+        This covers users whose cooldown ended, users whose subscription
+        failed, and users from before topic membership was recorded. Users
+        with a notification or membership change still in the outbox wait for it.
+        """
+        topics = region_topics(batch, settings.fcm_topic_precision)
+        due = (batch.topic != topics) & self.engine.cooled_down(batch, now)
+        due &= ~np.isin(batch.id, self.database.pending_outbox_users(('user', 'topic', 'subscribe', 'unsubscribe')))
+        
+        positions = np.flatnonzero(due)
+        if len(positions):
+            members = self._topic_members(topics, positions)
+            self.database.enqueue_outbox([
+                subscribe_entry(topic, batch.fcm_token[members_of].tolist(), batch.id[members_of].tolist())
+                for topic, members_of in members.items()
+            ], now)
+            logger.info(f"Queued subscription of {len(positions)} users to their region topic")
+    
     async def health_check(self):
         """Periodic health check."""
         try:
             logger.info("Performing health check...")
             
             # Check database connection
-            users = self.database.get_active_users()
-            logger.info(f"Database OK - {len(users)} active users")
+            logger.info(f"Database OK - {self.database.count_active_users()} active users, "
+                        f"{self.delivery_worker.pruned_total} pruned for invalid tokens since start, "
+                        f"outbox {self.database.outbox_counts()}")
             
             # Test aurora data fetch
-            aurora_data = await self.aurora_fetcher.fetch_ovation_data()
-            if aurora_data is not None:
-                logger.info(f"Aurora data OK - {len(aurora_data)} grid points")
+            aurora_grid = await self.aurora_fetcher.fetch_ovation_grid()
+            if aurora_grid is not None:
+                logger.info(f"Aurora data OK - {len(aurora_grid)} grid points")
             else:
                 logger.warning("Aurora data fetch failed")
             
@@ -150,13 +314,23 @@ class AuroraScheduler:
     def start(self):
         """Start the scheduler."""
         logger.info("Starting Aurora Alert scheduler...")
+        self.aurora_fetcher.warm_start()
         self.scheduler.start()
+        self._delivery_task = asyncio.ensure_future(self.delivery_worker.run_forever())
         logger.info(f"Scheduler started. Jobs: {[job.id for job in self.scheduler.get_jobs()]}")
     
-    def stop(self):
-        """Stop the scheduler."""
+    async def stop(self):
+        """Stop the scheduler and release pooled resources."""
         logger.info("Stopping Aurora Alert scheduler...")
         self.scheduler.shutdown()
+        if self._delivery_task is not None:
+            # Finish the round in flight so its results are recorded before the send pool closes
+            self.delivery_worker.stop()
+            await self._delivery_task
+        self.engine.close()
+        self.weather_fetcher.cache.close()
+        self.fcm_service.close()
+        await close_http_client()
         logger.info("Scheduler stopped")
     
     async def run_once(self):
@@ -178,7 +352,7 @@ async def main():
     except KeyboardInterrupt:
         logger.info("Received interrupt signal")
     finally:
-        scheduler.stop()
+        await scheduler.stop()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import os
 import json
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -10,13 +10,91 @@ class Settings(BaseSettings):
     fcm_service_account_json: str
     fcm_vapid_private_key: Optional[str] = None
     database_url: str = "sqlite:///data/aurora_alert.db"
+    # Connection pool per engine: persistent connections, extra connections under load, seconds
+    # before a connection is replaced, and seconds to wait for a free one
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_recycle_s: int = 1800
+    database_pool_timeout_s: float = 30.0
+    # Active users are read in chunks of this many rows; the aurora fetch and the quiet-cycle gate
+    # run while later chunks load, evaluation waits for the last one
+    user_chunk_size: int = 5000
     
     radius_km: int = 250
     prob_threshold: int = 15
     cloud_max: int = 40
     cooldown_h: int = 3
     
+    # "haversine" (vectorized, spherical) or "geodesic" (per-cell geopy, WGS84)
+    distance_method: str = "haversine"
+    
+    # Opt-in: precompute max/mean-within-disk rasters per radius bucket each grid update
+    use_disk_fields: bool = False
+    radius_buckets_km: List[int] = [50, 100, 150, 200, 250, 300, 400, 500, 750, 1000]
+    
+    # Engine worker processes; 1 evaluates in-process, 0 uses every core
+    engine_workers: int = 1
+    
+    # Reuse last cycle's results for users whose grid cells moved less than the tolerance (prob points)
+    incremental_evaluation: bool = False
+    incremental_tolerance: float = 1.0
+    
+    # The quiet-cycle gate never skips a cycle while Kp is at or above this (G1 storm)
+    gate_max_kp: float = 5.0
+    
     check_interval_min: int = 5
+    
+    # Parsed grids are kept as memory-mapped snapshots for warm starts; the last one stands in
+    # for a failed NOAA fetch while its forecast time is within the max age
+    grid_cache_dir: Optional[str] = "data/cache"
+    grid_cache_keep: int = 5
+    grid_max_age_min: int = 60
+    
+    # Shared ingest HTTP client pool
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 50
+    http_keepalive_expiry_s: float = 30.0
+    http2: bool = False
+    
+    # OpenWeather request limits (free tier: 60 calls/minute)
+    weather_max_concurrency: int = 10
+    weather_rate_per_min: float = 60.0
+    weather_rate_burst: int = 10
+    weather_max_retries: int = 2
+    
+    # Weather is fetched per geohash tile (precision 5 is ~5 km) and cached for the TTL;
+    # set a cache path to keep tiles across restarts
+    weather_tile_precision: int = 5
+    weather_cache_ttl_s: float = 1800.0
+    weather_cache_max_entries: int = 100000
+    weather_cache_path: Optional[str] = None
+    
+    # "current" reads clouds every cycle; "forecast" pulls the OneCall hourly series once per
+    # refresh and interpolates it each cycle
+    weather_mode: str = "current"
+    weather_forecast_refresh_s: float = 3600.0
+    
+    # FCM sends: messages per send_each call (max 500) and chunks in flight at once
+    fcm_batch_size: int = 500
+    fcm_send_workers: int = 2
+    
+    # Opt-in: one message per region topic (geohash cell + threshold band) once enough of its
+    # members qualify, instead of one per user
+    fcm_topic_mode: bool = False
+    fcm_topic_precision: int = 3
+    fcm_topic_min_users: int = 20
+    fcm_topic_min_fraction: float = 0.5
+    
+    # Notification outbox: messages per delivery batch, batches in flight, attempts before a
+    # message is dead, base of the exponential retry backoff, lease before a claimed message is
+    # retried (a crashed worker), and idle poll interval of the delivery worker
+    outbox_batch_size: int = 500
+    outbox_concurrency: int = 4
+    outbox_max_attempts: int = 5
+    outbox_backoff_s: float = 30.0
+    outbox_lease_s: float = 120.0
+    outbox_poll_interval_s: float = 2.0
+    
     log_level: str = "INFO"
     
     class Config:
@@ -0,0 +1,122 @@
+"""Local stand-in for the FCM HTTP v1 send endpoint.
+
+fake_fcm_app() returns a firebase_admin app whose messaging service posts to
+a StubServer. It uses a static access token, so no Google credentials or
+network access are needed. Tokens in `unregistered` get the same 404
+UNREGISTERED error body FCM returns for dead devices, and tokens in
+`invalid` the 400 INVALID_ARGUMENT body for malformed ones, and tokens in
+`throttled` the 429 QUOTA_EXCEEDED body of a transient failure. Unregistered
+tokens also fail topic subscriptions, and tokens in `stuck` fail to leave
+topics with a 503. Topic subscriptions and sent messages can be recorded
+for assertions.
+"""
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import parse_qs, unquote, urlparse
+
+import firebase_admin
+import google.oauth2.credentials
+from firebase_admin import credentials, messaging
+
+from tests.stub_server import Responder
+
+PROJECT_ID = 'aurora-bench'
+UNREGISTERED = {'error': {
+    'code': 404,
+    'message': 'Requested entity was not found.',
+    'status': 'NOT_FOUND',
+    'details': [{
+        '@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError',
+        'errorCode': 'UNREGISTERED'
+    }]
+}}
+
+
+class _StaticCredential(credentials.Base):
+    def get_credential(self):
+        # A token without expiry is always valid, so google-auth never tries to refresh it
+        return google.oauth2.credentials.Credentials(token='fake-token')
+
+
+def fcm_responder(unregistered: Iterable[str] = (), invalid: Iterable[str] = (), latency_s: float = 0.0,
+                  throttled: Iterable[str] = (), topics: Optional[Dict[str, Set[str]]] = None,
+                  sent: Optional[List[dict]] = None, stuck: Iterable[str] = ()) -> Responder:
+    """Responder emulating messages:send and topic registrations, with optional latency."""
+    unregistered = set(unregistered)
+    invalid = set(invalid)
+    throttled = set(throttled)
+    stuck = set(stuck)
+    counter = iter(range(1 << 62))
+    lock = threading.Lock()
+
+    def respond(method, path, headers, request_body):
+        if latency_s:
+            time.sleep(latency_s)
+
+        url = urlparse(path)
+        if '/topicSubscriptions' in url.path:
+            # POST .../registrations/<token>/topicSubscriptions?topic_name=<topic>
+            # DELETE .../registrations/<token>/topicSubscriptions/<topic>
+            parts = url.path.split('/')
+            token = unquote(parts[parts.index('topicSubscriptions') - 1])
+            if token in unregistered:
+                return 404, {'Content-Type': 'application/json'}, json.dumps(UNREGISTERED).encode()
+            if token in stuck and method == 'DELETE':
+                error = {'error': {'code': 503, 'message': 'The service is currently unavailable.',
+                                   'status': 'UNAVAILABLE'}}
+                return 503, {'Content-Type': 'application/json'}, json.dumps(error).encode()
+            with lock:
+                if topics is not None and method == 'POST':
+                    topics.setdefault(parse_qs(url.query)['topic_name'][0], set()).add(token)
+                elif topics is not None:
+                    topics.get(unquote(parts[-1]), set()).discard(token)
+            return 200, {'Content-Type': 'application/json'}, b'{}'
+
+        message = json.loads(request_body)['message']
+        if sent is not None:
+            with lock:
+                sent.append(message)
+        token = message.get('token')
+        if token in unregistered:
+            return 404, {'Content-Type': 'application/json'}, json.dumps(UNREGISTERED).encode()
+        if token in invalid:
+            error = {'error': {
+                'code': 400,
+                'message': 'The registration token is not a valid FCM registration token',
+                'status': 'INVALID_ARGUMENT',
+                'details': [{
+                    '@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError',
+                    'errorCode': 'INVALID_ARGUMENT'
+                }]
+            }}
+            return 400, {'Content-Type': 'application/json'}, json.dumps(error).encode()
+        if token in throttled:
+            error = {'error': {
+                'code': 429,
+                'message': 'Quota exceeded for the sending project.',
+                'status': 'RESOURCE_EXHAUSTED',
+                'details': [{
+                    '@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError',
+                    'errorCode': 'QUOTA_EXCEEDED'
+                }]
+            }}
+            return 429, {'Content-Type': 'application/json'}, json.dumps(error).encode()
+        with lock:
+            message_id = next(counter)
+        body = {'name': f'projects/{PROJECT_ID}/messages/{message_id}'}
+        return 200, {'Content-Type': 'application/json'}, json.dumps(body).encode()
+    return respond
+
+
+def fake_fcm_app(url: str, name: str = 'fake-fcm') -> firebase_admin.App:
+    """Firebase app whose messaging service sends to `url` instead of fcm.googleapis.com."""
+    try:
+        app = firebase_admin.get_app(name)
+    except ValueError:
+        app = firebase_admin.initialize_app(_StaticCredential(), {'projectId': PROJECT_ID}, name=name)
+    service = messaging._get_messaging_service(app)
+    service._fcm_url = f"{url}/v1/projects/{PROJECT_ID}/messages:send"
+    service._fcm_topic_url = f"{url}/v1/projects/{PROJECT_ID}/registrations"
+    return app
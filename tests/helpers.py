@@ -0,0 +1,25 @@
+"""Factories shared by the test modules."""
+from datetime import datetime
+
+from src.api.database import Database, UserDB
+from src.engine.models import AuroraAlert, User
+
+
+def make_database(tmp_path, n_users: int = 0) -> Database:
+    database = Database(f"sqlite:///{tmp_path / 'aurora.db'}")
+    with database.SessionLocal() as session:
+        session.add_all([
+            UserDB(lat=60.0, lon=10.0, radius_km=250, threshold=15, fcm_token=f"token-{i}", active=True)
+            for i in range(n_users)
+        ])
+        session.commit()
+    return database
+
+
+def notifications(n: int):
+    timestamp = datetime(2024, 1, 15, 3, 0)
+    for i in range(n):
+        user = User(id=i, lat=64.8, lon=-147.7, fcm_token=f"token-{i}")
+        alert = AuroraAlert(user_id=i, max_prob=40, mean_prob=25, cloud_coverage=10,
+                            is_night=True, should_notify=True, timestamp=timestamp)
+        yield alert, user
@@ -0,0 +1,78 @@
+"""Minimal local HTTP/1.1 server standing in for remote APIs in tests and benchmarks.
+
+The responder receives (method, path, headers, body) and returns
+(status, headers, body). The server counts accepted TCP connections and
+requests, so callers can see how well a client reuses connections.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+Response = Tuple[int, Dict[str, str], bytes]
+Responder = Callable[[str, str, Dict[str, str], bytes], Response]
+
+
+def json_responder(payload) -> Responder:
+    """Responder that answers every request with the same JSON document."""
+    body = json.dumps(payload).encode()
+
+    def respond(method, path, headers, request_body):
+        return 200, {'Content-Type': 'application/json'}, body
+    return respond
+
+
+class StubServer:
+    def __init__(self, responder: Responder):
+        self.responder = responder
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with stub._lock:
+                    stub.requests += 1
+                status, headers, payload = stub.responder(
+                    self.command, self.path, dict(self.headers), body
+                )
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _handle
+            do_POST = _handle
+            do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
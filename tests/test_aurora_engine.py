@@ -1,7 +1,18 @@
 import pytest
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timezone
+from astral import Observer
+from astral.sun import elevation as astral_elevation
+from src.engine import aurora_engine as aurora_engine_module
 from src.engine.aurora_engine import AuroraEngine
+from src.engine.batch import UserBatch
+from src.engine.geo import geohash, geohash_center, index_weather, lookup_weather
+from src.engine.gate import band_upper_bound, latest_kp
+from src.engine.grid import AuroraGrid
+from src.engine.incremental import IncrementalEvaluator, windows_touch
+from src.engine.solar import night_mask
+from src.engine.spatial_index import GridIndex
 from src.engine.models import User
 
 
@@ -108,4 +119,345 @@ def test_should_notify_user_cloudy(aurora_engine, sample_user):
         timestamp=datetime.utcnow()
     )
     
-    assert should_notify is False
\ No newline at end of file
+    assert should_notify is False
+
+def test_haversine_matches_geodesic(aurora_engine, sample_aurora_data, sample_user):
+    haversine = aurora_engine._find_nearby_cells_haversine(
+        sample_user.lat, sample_user.lon, sample_aurora_data, sample_user.radius_km
+    )
+    geodesic = aurora_engine._find_nearby_cells_geodesic(
+        sample_user.lat, sample_user.lon, sample_aurora_data, sample_user.radius_km
+    )
+    
+    assert list(haversine.columns) == ['lat', 'lon', 'prob', 'power', 'distance_km']
+    assert haversine['prob'].tolist() == geodesic['prob'].tolist()
+    assert haversine['distance_km'].to_numpy() == pytest.approx(
+        geodesic['distance_km'].to_numpy(), rel=0.006, abs=1e-6
+    )
+
+
+def test_grid_index_matches_full_scan(aurora_engine):
+    lats, lons = np.meshgrid(np.arange(-90, 91), np.arange(0, 360, 2))
+    grid = pd.DataFrame({
+        'lat': lats.ravel(),
+        'lon': lons.ravel(),
+        'prob': np.arange(lats.size) % 100,
+    })
+    index = GridIndex(grid)
+    
+    # Includes a query across the antimeridian and one covering the pole
+    for lat, lon, radius in [(45.5, -73.6, 250), (64.8, 179.5, 1000), (88.0, 10.0, 500)]:
+        positions, distances = index.query_radius(lat, lon, radius)
+        full = aurora_engine._find_nearby_cells_haversine(lat, lon, grid, radius)
+        
+        assert sorted(index.prob[positions].tolist()) == sorted(full['prob'].tolist())
+        assert np.all(distances <= radius)
+
+
+def test_process_all_users_uses_index(aurora_engine, sample_aurora_data, sample_user):
+    timestamp = datetime(2024, 1, 15, 3, 0)
+    weather = {'weather_data': [{'lat': 45.5, 'lon': -73.6, 'current_clouds': 10}]}
+    
+    alerts = aurora_engine.process_all_users([sample_user], sample_aurora_data, weather, timestamp)
+    expected = aurora_engine.process_user_alert(sample_user, sample_aurora_data, 10, timestamp)
+    
+    assert alerts[0] == expected
+
+
+@pytest.fixture
+def sample_payload():
+    lons, lats = np.meshgrid(np.arange(360), np.arange(-90, 91), indexing='ij')
+    probs = np.clip(lats.ravel(), 0, None) % 50
+    return {
+        'Observation Time': '2024-01-15T03:00:00Z',
+        'Forecast Time': '2024-01-15T03:35:00Z',
+        'Data Format': '[Longitude, Latitude, Aurora]',
+        'coordinates': [[int(lo), int(la), int(p)] for lo, la, p in zip(lons.ravel(), lats.ravel(), probs)]
+    }
+
+
+def test_aurora_grid_from_payload(sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    
+    assert grid.prob.shape == (360, 181)
+    assert grid.prob.dtype == np.float32
+    assert grid.nbytes == 360 * 181 * 4
+    assert grid.forecast_time == datetime(2024, 1, 15, 3, 35)
+    assert grid.cell(45.4, -73.6) == 45
+    assert grid.cell(-10, 20) == 0
+
+
+def test_aurora_grid_query_matches_frame(aurora_engine, sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    frame = grid.to_frame()
+    
+    for lat, lon, radius in [(45.5, -73.6, 250), (64.8, 179.5, 1000), (88.0, 10.0, 500)]:
+        from_grid = aurora_engine.find_nearby_aurora_cells(lat, lon, grid, radius)
+        from_frame = aurora_engine._find_nearby_cells_haversine(lat, lon, frame, radius)
+        
+        assert len(from_grid) == len(from_frame)
+        assert from_grid['prob'].sum() == pytest.approx(from_frame['prob'].sum())
+
+
+def test_disk_fields_match_exact_path(aurora_engine, sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    users = [
+        User(id=i, lat=lat, lon=lon, radius_km=radius, threshold=20, fcm_token=f"token_{i}")
+        for i, (lat, lon, radius) in enumerate([(45, -74, 250), (65, 179, 1000), (89, 10, 500), (-60, 0, 50)])
+    ]
+    timestamp = datetime(2024, 1, 15, 3, 0)
+    
+    exact = aurora_engine.process_all_users(users, grid, {}, timestamp)
+    aurora_engine.use_disk_fields = True
+    precomputed = aurora_engine.process_all_users(users, grid, {}, timestamp)
+    
+    for a, b in zip(exact, precomputed):
+        assert a.max_prob == pytest.approx(b.max_prob)
+        assert a.mean_prob == pytest.approx(b.mean_prob, rel=1e-5)
+
+
+def test_disk_fields_never_underreport_off_lattice(aurora_engine, sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    rng = np.random.default_rng(0)
+    n = 500
+    batch = UserBatch(
+        id=np.arange(n), lat=rng.uniform(30, 89.9, n), lon=rng.uniform(-180, 180, n),
+        radius_km=rng.choice([50, 250, 1000], n), threshold=np.full(n, 20.0), last_notified=np.full(n, np.nan)
+    )
+    
+    exact_max, exact_mean = aurora_engine.probabilities(batch, grid)
+    aurora_engine.use_disk_fields = True
+    field_max, field_mean = aurora_engine.probabilities(batch, grid)
+    
+    assert np.all(field_max >= exact_max)
+    assert np.all((field_mean >= 0) & (field_mean <= 50))
+
+
+def test_night_mask_matches_astral():
+    timestamp = datetime(2024, 1, 15, 3, 0)
+    lats = np.array([45.5, 64.8, -33.9, 69.6])
+    lons = np.array([-73.6, -147.7, 151.2, 18.9])
+    
+    elevation, is_night = night_mask(lats, lons, timestamp)
+    expected = [
+        astral_elevation(Observer(lat, lon), timestamp.replace(tzinfo=timezone.utc), with_refraction=False)
+        for lat, lon in zip(lats, lons)
+    ]
+    
+    assert elevation == pytest.approx(expected, abs=0.05)
+    assert is_night.tolist() == [e < -6 for e in expected]
+
+
+def test_is_nighttime_uses_elevation(aurora_engine):
+    # Montreal: 03:00 UTC is night, 17:00 UTC is daytime
+    assert aurora_engine.is_nighttime(45.5, -73.6, datetime(2024, 1, 15, 3, 0)) is True
+    assert aurora_engine.is_nighttime(45.5, -73.6, datetime(2024, 1, 15, 17, 0)) is False
+
+
+def test_weather_lookup_by_location_key():
+    index = index_weather([
+        {'lat': 45.5, 'lon': -73.6, 'current_clouds': 10},
+        {'lat': 64.84, 'lon': -147.72, 'current_clouds': 70},
+    ])
+    
+    assert lookup_weather(index, 45.5, -73.6)['current_clouds'] == 10
+    assert lookup_weather(index, 64.78, -147.69)['current_clouds'] == 70
+    assert lookup_weather(index, 45.7, -73.6) is None
+
+
+def test_geohash_matches_reference_encoding():
+    assert geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geohash(42.6, -5.6, 5) == 'ezs42'
+    
+    lat, lon = geohash_center('ezs42')
+    assert geohash(lat, lon, 5) == 'ezs42'
+    assert abs(lat - 42.6) < 0.03 and abs(lon + 5.6) < 0.03
+
+
+def test_cloud_coverage_resolved_per_tile(aurora_engine):
+    users = [
+        User(id=1, fcm_token='token_1', lat=45.5017, lon=-73.5673, radius_km=250, threshold=15),
+        User(id=2, fcm_token='token_2', lat=45.5030, lon=-73.5690, radius_km=250, threshold=15),
+        User(id=3, fcm_token='token_3', lat=64.84, lon=-147.72, radius_km=250, threshold=15),
+    ]
+    tile = geohash(45.5017, -73.5673, 5)
+    weather = {'tiles': {tile: {'current_clouds': 30}}, 'tile_precision': 5}
+    
+    clouds = aurora_engine.resolve_cloud_coverage(UserBatch.from_users(users), weather)
+    
+    assert clouds.tolist() == [30.0, 30.0, 100.0]
+
+
+def test_evaluate_batch_decision_vectors(aurora_engine, sample_aurora_data, sample_user):
+    timestamp = datetime(2024, 1, 15, 3, 0)
+    recently_notified = sample_user.model_copy(update={'id': 2, 'last_notified': datetime(2024, 1, 15, 2, 0)})
+    cloudy = sample_user.model_copy(update={'id': 3, 'lat': 46.0, 'lon': -74.0})
+    users = [sample_user, recently_notified, cloudy]
+    weather = {'weather_data': [
+        {'lat': 45.5, 'lon': -73.6, 'current_clouds': 10},
+        {'lat': 46.0, 'lon': -74.0, 'current_clouds': 90},
+    ]}
+    
+    decision = aurora_engine.evaluate_batch(UserBatch.from_users(users), sample_aurora_data, weather, timestamp)
+    
+    assert decision.notify.tolist() == [True, False, False]
+    assert decision.cloud_coverage.tolist() == [10, 10, 90]
+    assert decision.alert(0) == aurora_engine.process_user_alert(
+        sample_user, sample_aurora_data, 10, timestamp
+    )
+
+
+def test_sharded_evaluation_preserves_order(aurora_engine, sample_payload, monkeypatch):
+    monkeypatch.setattr(aurora_engine_module, 'MIN_USERS_PER_SHARD', 1)
+    grid = AuroraGrid.from_payload(sample_payload)
+    rng = np.random.default_rng(0)
+    batch = UserBatch(
+        id=np.arange(50),
+        lat=rng.uniform(40, 80, 50),
+        lon=rng.uniform(-180, 180, 50),
+        radius_km=np.full(50, 250),
+        threshold=np.full(50, 20.0),
+        last_notified=np.full(50, np.nan)
+    )
+    weather = {'weather_data': [
+        {'lat': float(lat), 'lon': float(lon), 'current_clouds': 0} for lat, lon in zip(batch.lat, batch.lon)
+    ]}
+    timestamp = datetime(2024, 1, 15, 3, 0)
+    
+    local = aurora_engine.evaluate_batch(batch, grid, weather, timestamp)
+    aurora_engine.workers = 2
+    try:
+        sharded = aurora_engine.evaluate_batch(batch, grid, weather, timestamp)
+    finally:
+        aurora_engine.close()
+    
+    assert sharded.user_id.tolist() == list(range(50))
+    assert sharded.max_prob.tolist() == local.max_prob.tolist()
+    assert sharded.notify.tolist() == local.notify.tolist()
+
+
+def test_incremental_evaluation_matches_full(aurora_engine, sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    rng = np.random.default_rng(1)
+    batch = UserBatch(
+        id=np.arange(200),
+        lat=rng.uniform(-80, 80, 200),
+        lon=rng.uniform(-180, 180, 200),
+        radius_km=rng.choice([100, 500], 200),
+        threshold=np.full(200, 20.0),
+        last_notified=np.full(200, np.nan)
+    )
+    timestamp = datetime(2024, 1, 15, 3, 0)
+    incremental = IncrementalEvaluator(aurora_engine, tolerance=0.5)
+    incremental.evaluate_batch(batch, grid, {}, timestamp)
+    
+    # A storm brightens one region; sub-tolerance noise elsewhere is ignored
+    updated = AuroraGrid(prob=grid.prob + rng.uniform(0, 0.4, grid.prob.shape).astype(np.float32))
+    updated.prob[200:230, 150:170] += 30
+    
+    result = incremental.evaluate_batch(batch, updated, {}, timestamp)
+    full = aurora_engine.evaluate_batch(batch, updated, {}, timestamp)
+    
+    assert result.max_prob == pytest.approx(full.max_prob, abs=0.5)
+    assert result.mean_prob == pytest.approx(full.mean_prob, abs=0.5)
+    assert result.notify.tolist() == full.notify.tolist()
+
+
+def test_windows_touch_matches_grid_window(sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    changed = np.zeros((360, 181), dtype=bool)
+    changed[10, 150] = True
+    changed[355, 120] = True
+    lats = np.array([60.0, 30.0, 85.0, -10.0, 29.0])
+    lons = np.array([9.5, -3.0, 100.0, 10.0, 5.0])
+    radii = np.array([100.0, 250.0, 1000.0, 500.0, 200.0])
+    
+    expected = []
+    for lat, lon, radius in zip(lats, lons, radii):
+        cols, rows = grid._window(lat, lon, radius)
+        expected.append(bool(changed[np.ix_(cols, rows)].any()))
+    
+    assert windows_touch(changed, lats, lons, radii).tolist() == expected
+
+
+def test_gate_closes_when_no_user_can_qualify(aurora_engine, sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    night = datetime(2024, 1, 15, 3, 0)
+    # Montreal at night; the sample grid peaks at 49% only near 49°N
+    batch = UserBatch.from_users([
+        User(id=1, lat=45.5, lon=-73.6, radius_km=100, threshold=48, fcm_token="a")
+    ])
+    
+    assert aurora_engine.could_any_user_qualify(batch, grid, night) is False
+    assert aurora_engine.could_any_user_qualify(batch, grid, night, kp=7.0) is True
+    
+    batch.threshold[:] = 45
+    assert aurora_engine.could_any_user_qualify(batch, grid, night) is True
+    assert aurora_engine.could_any_user_qualify(batch, grid, datetime(2024, 1, 15, 17, 0)) is False
+
+
+def test_band_upper_bound_covers_exact_max(sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    rng = np.random.default_rng(2)
+    lats = rng.uniform(-90, 90, 100)
+    lons = rng.uniform(-180, 180, 100)
+    radii = rng.choice([50, 250, 1000], 100).astype(float)
+    
+    bound = band_upper_bound(grid, lats, radii)
+    for b, lat, lon, radius in zip(bound, lats, lons, radii):
+        probs = grid.probabilities_within(lat, lon, radius)
+        assert b >= (probs.max() if len(probs) else 0)
+
+
+def test_latest_kp():
+    assert latest_kp([{'kp_index': 2}, {'kp_index': 5}]) == 5.0
+    assert latest_kp([{'time_tag': 't', 'estimated_kp': 3.33}]) == 3.33
+    assert latest_kp(None) is None
+
+
+def test_input_fingerprint_tracks_decision_inputs(aurora_engine, sample_payload, sample_user):
+    grid = AuroraGrid.from_payload(sample_payload)
+    grid.version = 'v1'
+    batch = UserBatch.from_users([sample_user])
+    weather = {'weather_data': [{'lat': 45.5, 'lon': -73.6, 'current_clouds': 10}]}
+    night = datetime(2024, 1, 15, 3, 0)
+    
+    fingerprint = aurora_engine.input_fingerprint(batch, grid, weather, night)
+    
+    assert fingerprint == aurora_engine.input_fingerprint(batch, grid, weather, datetime(2024, 1, 15, 3, 5))
+    assert fingerprint != aurora_engine.input_fingerprint(batch, grid, weather, datetime(2024, 1, 15, 17, 0))
+    assert fingerprint != aurora_engine.input_fingerprint(
+        batch, grid, {'weather_data': [{'lat': 45.5, 'lon': -73.6, 'current_clouds': 60}]}, night
+    )
+    grid.version = 'v2'
+    assert fingerprint != aurora_engine.input_fingerprint(batch, grid, weather, night)
+
+
+def test_input_fingerprint_tracks_every_weather_tile(aurora_engine, sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    grid.version = 'v1'
+    # Neighbouring precision-5 tiles whose centres share one 0.1 degree location key
+    users = [
+        User(id=i, lat=lat, lon=lon, radius_km=250, threshold=15, fcm_token=f"token_{i}")
+        for i, (lat, lon) in enumerate([geohash_center('bewbx'), geohash_center('bewbz')])
+    ]
+    batch = UserBatch.from_users(users)
+    night = datetime(2024, 1, 15, 3, 0)
+    
+    def fingerprint(clouds):
+        tiles = {tile: {'current_clouds': value} for tile, value in zip(['bewbx', 'bewbz'], clouds)}
+        return aurora_engine.input_fingerprint(batch, grid, {'tiles': tiles, 'tile_precision': 5}, night)
+    
+    assert fingerprint([0, 100]) != fingerprint([0, 0])
+
+
+def test_geodesic_path_resolves_weather_per_tile(aurora_engine, sample_payload):
+    grid = AuroraGrid.from_payload(sample_payload)
+    # Fairbanks is over 0.1 degree from the centre of its precision-4 tile
+    user = User(id=1, lat=64.84, lon=-147.72, radius_km=250, threshold=15, fcm_token="token_1")
+    weather = {'tiles': {geohash(64.84, -147.72, 4): {'current_clouds': 20}}, 'tile_precision': 4}
+    aurora_engine.distance_method = "geodesic"
+    
+    alerts = aurora_engine.process_all_users([user], grid, weather, datetime(2024, 1, 15, 3, 0))
+    
+    assert alerts[0].cloud_coverage == 20
@@ -0,0 +1,228 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+from src.api.async_database import AsyncDatabase, async_database_url
+from src.api.database import Database, UserDB
+from src.engine.batch import UserBatch
+from src.api.migrations import Migration, applied_versions, migrate
+from tests.helpers import make_database
+
+
+def test_completing_outbox_stamps_last_notified_in_bulk(tmp_path):
+    database = make_database(tmp_path, n_users=1200)
+    ids = [user.id for user in database.get_active_users()]
+    notified_at = datetime(2024, 1, 15, 3, 0)
+    database.enqueue_outbox([{'kind': 'topic', 'payload': {'user_ids': ids[:1100]}}], notified_at)
+    message = database.claim_outbox(1, lease_s=60, now=notified_at)[0]
+    
+    statements = []
+    event.listen(database.engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    updated = database.complete_outbox([message.id], message.payload['user_ids'], notified_at)
+    
+    assert updated == 1
+    # One UPDATE for the message, one per 500 users
+    assert sum(statement.startswith('UPDATE') for statement in statements) == 4
+    last_notified = [user.last_notified for user in database.get_active_users()]
+    assert last_notified.count(notified_at) == 1100 and last_notified.count(None) == 100
+
+
+def test_bulk_deactivate_prunes_users(tmp_path):
+    database = make_database(tmp_path, n_users=10)
+    ids = [user.id for user in database.get_active_users()]
+    
+    assert database.deactivate_users(ids[:3] + [9999]) == 3
+    assert database.deactivate_users(ids[:3]) == 0
+    assert [user.id for user in database.get_active_users()] == ids[3:]
+
+
+def test_outbox_claim_lease_and_retry(tmp_path):
+    database = make_database(tmp_path, n_users=3)
+    ids = [user.id for user in database.get_active_users()]
+    queued_at = datetime(2024, 1, 15, 3, 0)
+    entries = [{'kind': 'user', 'user_id': user_id, 'payload': {'token': f"token-{user_id}"}} for user_id in ids]
+    
+    assert database.enqueue_outbox(entries, queued_at) == 3
+    assert database.pending_outbox_users() == ids
+    
+    first = database.claim_outbox(2, lease_s=60, now=queued_at)
+    assert [message.user_id for message in first] == ids[:2]
+    assert first[0].payload == {'token': f"token-{ids[0]}"} and first[0].attempts == 1
+    # Leased messages are not handed out again while the lease holds
+    third = database.claim_outbox(5, lease_s=60, now=queued_at + timedelta(seconds=10))
+    assert [message.user_id for message in third] == ids[2:]
+    assert database.claim_outbox(5, lease_s=60, now=queued_at + timedelta(seconds=30)) == []
+    
+    # The worker holding the first two died; once the lease ends they are claimed again
+    reclaimed = database.claim_outbox(5, lease_s=60, now=queued_at + timedelta(seconds=61))
+    assert [message.id for message in reclaimed] == [message.id for message in first]
+    assert reclaimed[0].attempts == 2
+    
+    retry_at = queued_at + timedelta(minutes=5)
+    database.complete_outbox([reclaimed[0].id], [ids[0]], queued_at)
+    database.fail_outbox([(reclaimed[1].id, retry_at, 'QuotaExceededError'), (third[0].id, None, 'UnregisteredError')])
+    assert database.outbox_counts() == {'sent': 1, 'pending': 1, 'dead': 1}
+    # Only the delivered message starts a cooldown; the retried one still holds its user
+    assert [user.last_notified for user in database.get_active_users()] == [queued_at, None, None]
+    assert database.pending_outbox_users() == [ids[1]]
+    assert database.claim_outbox(5, lease_s=60, now=retry_at - timedelta(seconds=1)) == []
+    assert [message.id for message in database.claim_outbox(5, lease_s=60, now=retry_at)] == [reclaimed[1].id]
+
+
+def test_migrations_upgrade_a_create_all_database(tmp_path):
+    # The schema as create_all built it before versioning: no indexes, no outbox, no version table
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    with create_engine(url).begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, lat FLOAT NOT NULL, lon FLOAT NOT NULL, "
+            "radius_km INTEGER, threshold INTEGER, fcm_token VARCHAR NOT NULL UNIQUE, "
+            "last_notified DATETIME, created_at DATETIME, active BOOLEAN)"
+        ))
+        connection.execute(text(
+            "CREATE TABLE alerts (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users (id), max_prob FLOAT, "
+            "mean_prob FLOAT, cloud_coverage FLOAT, is_night BOOLEAN, should_notify BOOLEAN, timestamp DATETIME)"
+        ))
+        connection.execute(text("INSERT INTO users (lat, lon, radius_km, threshold, fcm_token, active) "
+            "VALUES (64.8, -147.7, 250, 15, 'kept', 1)"))
+    
+    database = Database(url)
+    
+    assert applied_versions(database.engine) == [1, 2, 3, 4]
+    inspector = inspect(database.engine)
+    assert 'topic' in {column['name'] for column in inspector.get_columns('users')}
+    assert [index['name'] for index in inspector.get_indexes('users')] == ['ix_users_active']
+    assert [index['name'] for index in inspector.get_indexes('alerts')] == ['ix_alerts_user_timestamp']
+    assert 'outbox' in inspector.get_table_names()
+    assert [user.fcm_token for user in database.get_active_users()] == ['kept']
+    assert migrate(database.engine) == 0
+
+
+def test_failed_migration_leaves_no_partial_schema_on_sqlite(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'aurora.db'}")
+    
+    def fail(connection):
+        raise RuntimeError("step failed")
+    
+    steps = [
+        Migration(1, 'table', lambda connection: connection.execute(text("CREATE TABLE probe (id INTEGER)"))),
+        Migration(2, 'broken', fail)
+    ]
+    with pytest.raises(RuntimeError):
+        migrate(engine, steps)
+    
+    # The DDL of step 1 and the version table are rolled back with the failed step
+    assert inspect(engine).get_table_names() == []
+    assert migrate(engine, steps[:1]) == 1
+    assert applied_versions(engine) == [1]
+
+
+def _hot_queries(database: Database):
+    """Run the hot queries once and return the (statement, parameters) they executed."""
+    executed = []
+    listener = lambda conn, cursor, statement, parameters, *args: executed.append((statement, parameters))
+    event.listen(database.engine, 'before_cursor_execute', listener)
+    try:
+        database.get_active_users()
+        database.claim_outbox(10, lease_s=60)
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', listener)
+    return [(statement, parameters) for statement, parameters in executed if statement.lstrip().startswith('SELECT')]
+
+
+def test_hot_queries_use_indexes_on_sqlite(tmp_path):
+    database = make_database(tmp_path, n_users=50)
+    (users_sql, users_params), (claim_sql, claim_params) = _hot_queries(database)
+    
+    with database.engine.connect() as connection:
+        def plan(statement, parameters=()):
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            return ' | '.join(row[-1] for row in rows)
+        
+        assert 'USING INDEX ix_users_active' in plan(users_sql, users_params)
+        assert 'USING INDEX ix_outbox_status_next_attempt (status=? AND next_attempt_at<?)' in plan(
+            claim_sql, claim_params
+        )
+        assert 'USING COVERING INDEX ix_alerts_user_timestamp (user_id=?)' in plan(
+            "SELECT user_id, timestamp FROM alerts WHERE user_id = ? ORDER BY timestamp DESC LIMIT 1", (1,)
+        )
+
+
+def test_partial_index_renders_for_postgresql():
+    index = next(iter(UserDB.__table__.indexes))
+    ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert ddl == "CREATE INDEX ix_users_active ON users (id) WHERE active = true"
+
+
+@pytest.mark.skipif(not os.environ.get('AURORA_TEST_POSTGRES_URL'),
+                    reason="set AURORA_TEST_POSTGRES_URL to a disposable PostgreSQL-compatible database")
+def test_hot_queries_use_indexes_on_postgresql():
+    database = Database(os.environ['AURORA_TEST_POSTGRES_URL'])
+    queries = _hot_queries(database)
+    
+    with database.engine.connect() as connection:
+        # Tiny test tables favour sequential scans; ask whether the indexes can serve the queries at all
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        plans = [
+            '\n'.join(row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters))
+            for statement, parameters in queries
+        ]
+    
+    assert 'ix_users_active' in plans[0]
+    assert 'ix_outbox_status_next_attempt' in plans[1]
+
+
+def test_async_database_url_picks_asyncio_drivers():
+    assert async_database_url('sqlite:///data/aurora.db') == 'sqlite+aiosqlite:///data/aurora.db'
+    assert async_database_url('postgresql://u:p@db/aurora') == 'postgresql+asyncpg://u:p@db/aurora'
+    assert async_database_url('postgresql+psycopg2://u@db/aurora') == 'postgresql+asyncpg://u@db/aurora'
+    assert async_database_url('sqlite+aiosqlite:///x.db') == 'sqlite+aiosqlite:///x.db'
+
+
+def test_async_database_shares_tables_with_sync_layer(tmp_path):
+    sync_database = make_database(tmp_path, n_users=3)
+    
+    async def run():
+        database = AsyncDatabase(sync_database.database_url)
+        await database.init_database()
+        try:
+            user = await database.add_user(64.8, -147.7, 100, 30, 'token-new')
+            duplicate = await database.add_user(64.8, -147.7, 100, 30, 'token-new')
+            updated = await database.update_user_preferences('token-new', threshold=40)
+            found = await database.get_user_by_token('token-new')
+            deactivated = await database.deactivate_user('token-0')
+            counts = await asyncio.gather(*(database.count_active_users() for _ in range(8)))
+            return user, duplicate, updated, found, deactivated, counts
+        finally:
+            await database.close()
+    
+    user, duplicate, updated, found, deactivated, counts = asyncio.run(run())
+    
+    assert user.id == 4 and duplicate is None
+    assert updated and found.threshold == 40 and found.radius_km == 100
+    assert deactivated and counts == [3] * 8
+    assert sync_database.count_active_users() == 3
+    assert sorted(u.fcm_token for u in sync_database.get_active_users()) == ['token-1', 'token-2', 'token-new']
+
+
+def test_iter_active_users_streams_column_chunks(tmp_path):
+    database = make_database(tmp_path, n_users=25)
+    database.deactivate_users([3])
+    database.update_last_notified(5, datetime(2024, 1, 15, 3, 0))
+    
+    chunks = list(database.iter_active_users(10, as_arrays=True))
+    lists = list(database.iter_active_users(10))
+    
+    assert [len(chunk) for chunk in chunks] == [10, 10, 4]
+    assert [len(chunk) for chunk in lists] == [10, 10, 4]
+    batch = UserBatch.concat(chunks)
+    expected = UserBatch.from_users(database.get_active_users())
+    for column in ('id', 'lat', 'lon', 'radius_km', 'threshold', 'last_notified', 'fcm_token'):
+        assert np.array_equal(getattr(batch, column), getattr(expected, column), equal_nan=column == 'last_notified')
+    user = batch.user(3)
+    assert (user.id, user.fcm_token) == (5, 'token-4')
+    assert user.last_notified == datetime(2024, 1, 15, 3, 0, tzinfo=timezone.utc)
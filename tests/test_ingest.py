@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pytest
+from src.ingest import http_client
+from src.ingest.aurora_data import AuroraDataFetcher
+from src.ingest.grid_cache import GridSnapshotCache
+from src.ingest.http_client import create_http_client
+from src.ingest.ovation_parser import OvationStreamParser
+from src.ingest.weather_data import DiskWeatherCache, TokenBucket, WeatherCache, WeatherDataFetcher
+from src.engine.grid import AuroraGrid
+from src.utils.config import settings
+from tests.stub_server import StubServer, json_responder
+
+
+def test_shared_client_reuses_connections():
+    async def run(url):
+        fetcher = WeatherDataFetcher()
+        fetcher.base_url = url
+        first = http_client.get_http_client()
+        for i in range(5):
+            result = await fetcher.fetch_weather_data(45.0 + i, -73.0)
+            assert result['current_clouds'] == 20
+        assert http_client.get_http_client() is first
+        await http_client.close_http_client()
+        assert http_client._client is None
+    
+    with StubServer(json_responder({'clouds': {'all': 20}})) as stub:
+        asyncio.run(run(stub.url + "/weather"))
+        assert stub.requests == 5
+        assert stub.connections == 1
+
+
+OVATION_PAYLOAD = {
+    'Observation Time': '2024-01-15T03:00:00Z',
+    'Forecast Time': '2024-01-15T03:35:00Z',
+    'Data Format': '[Longitude, Latitude, Aurora]',
+    'coordinates': [[287, 45, 12], [287, 46, 30]],
+}
+
+
+def test_warm_start_maps_last_snapshot_and_revalidates(tmp_path, monkeypatch):
+    body = json.dumps(OVATION_PAYLOAD).encode()
+    outage = []
+    
+    def respond(method, path, headers, request_body):
+        if outage:
+            return 503, {}, b''
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b''
+        return 200, {'ETag': '"v1"', 'Content-Type': 'application/json'}, body
+    
+    async def run(url):
+        async with create_http_client() as client:
+            cache = GridSnapshotCache(str(tmp_path), keep=2)
+            first = AuroraDataFetcher(client=client, snapshots=cache)
+            first.ovation_url = url
+            fetched = await first.fetch_ovation_grid()
+            
+            # A restarted process maps the snapshot and revalidates it with the saved ETag
+            restarted = AuroraDataFetcher(client=client, snapshots=cache)
+            restarted.ovation_url = url
+            warm = restarted.warm_start()
+            assert isinstance(warm.prob, np.memmap)
+            assert warm.version == fetched.version and warm.cell(46, -73) == 30
+            assert await restarted.fetch_ovation_grid() is warm
+            
+            # NOAA down: the last grid stands in while it is within the max age
+            outage.append(True)
+            monkeypatch.setattr(settings, 'grid_max_age_min', 10 ** 9)
+            data = await restarted.fetch_all_data()
+            assert data['ovation'] is warm and not data['ovation_changed']
+    
+    with StubServer(respond) as stub:
+        asyncio.run(run(stub.url))
+
+
+def test_grid_snapshot_retention(tmp_path):
+    cache = GridSnapshotCache(str(tmp_path), keep=2)
+    for minute in range(4):
+        grid = AuroraGrid.zeros()
+        grid.version = f"20240115T03{minute:02d}-abc"
+        cache.save(grid)
+    
+    versions = [meta['version'] for meta in cache.snapshots()]
+    assert versions == ['20240115T0303-abc', '20240115T0302-abc']
+    assert len(os.listdir(tmp_path)) == 4
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1 << 20])
+def test_streaming_parser_matches_json_decode(chunk_size):
+    payload = dict(OVATION_PAYLOAD, coordinates=[[lon, lat, (lon + lat) % 50] for lon in range(0, 360, 7)
+                                                 for lat in range(-90, 91, 3)])
+    body = json.dumps(payload, indent=1).encode()
+    
+    parser = OvationStreamParser()
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i:i + chunk_size])
+    grid = parser.close()
+    
+    expected = AuroraGrid.from_payload(payload)
+    assert parser.count == len(payload['coordinates'])
+    assert (grid.prob == expected.prob).all()
+    assert grid.forecast_time == expected.forecast_time == datetime(2024, 1, 15, 3, 35)
+
+
+def test_ovation_fetch_is_conditional_and_deduplicated(tmp_path):
+    body = json.dumps(OVATION_PAYLOAD).encode()
+    seen_headers = []
+    
+    def respond(method, path, headers, request_body):
+        seen_headers.append(headers)
+        if path == '/etag':
+            if headers.get('If-None-Match') == '"v1"':
+                return 304, {'ETag': '"v1"'}, b''
+            return 200, {'ETag': '"v1"', 'Content-Type': 'application/json'}, body
+        return 200, {'Content-Type': 'application/json'}, body
+    
+    async def run(url):
+        async with create_http_client() as client:
+            fetcher = AuroraDataFetcher(client=client, snapshots=GridSnapshotCache(str(tmp_path), keep=2))
+            fetcher.ovation_url = url + '/etag'
+            first = await fetcher.fetch_ovation_grid()
+            assert fetcher.grid_changed
+            assert first.version.startswith('20240115T0335-')
+            assert first.cell(46, -73) == 30
+            
+            second = await fetcher.fetch_ovation_grid()
+            assert second is first and not fetcher.grid_changed
+            
+            # No validators from this endpoint: unchanged body is caught by its hash
+            fetcher.ovation_url = url + '/plain'
+            third = await fetcher.fetch_ovation_grid()
+            assert third is first and not fetcher.grid_changed
+    
+    with StubServer(respond) as stub:
+        asyncio.run(run(stub.url))
+    
+    assert 'If-None-Match' not in seen_headers[0]
+    assert seen_headers[1]['If-None-Match'] == '"v1"'
+
+
+def test_weather_fetch_respects_rate_limit_and_priority():
+    # Stub allows at most 10 requests in any 1-second window; the bucket sends at most 3 + 6
+    window = []
+    order = []
+    
+    def respond(method, path, headers, request_body):
+        now = time.monotonic()
+        window[:] = [t for t in window if now - t < 1.0]
+        if len(window) >= 10:
+            return 429, {'Retry-After': '1'}, b'{}'
+        window.append(now)
+        lat = float(parse_qs(urlparse(path).query)['lat'][0])
+        order.append(lat)
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'clouds': {'all': 10}}).encode()
+    
+    async def run(url):
+        async with create_http_client() as client:
+            fetcher = WeatherDataFetcher(client=client)
+            fetcher.base_url = url
+            fetcher.max_concurrency = 1
+            fetcher.max_retries = 0
+            fetcher.rate_limiter = TokenBucket(rate=6.0, capacity=3)
+            locations = [(float(i), 0.0) for i in range(12)]
+            priorities = [i % 4 == 0 for i in range(12)]
+            return await fetcher.fetch_weather_for_multiple_locations(locations, priorities)
+    
+    with StubServer(respond) as stub:
+        result = asyncio.run(run(stub.url))
+    
+    assert len(result['weather_data']) == 12
+    # Requests go to tile centers, a fraction of a tile away from the user
+    assert [round(lat) for lat in order[:3]] == [0, 4, 8]
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(rate=20.0, capacity=5)
+        start = time.monotonic()
+        for _ in range(15):
+            await bucket.acquire()
+        return time.monotonic() - start
+    
+    # 5 burst tokens, then 10 more at 20/s
+    assert asyncio.run(run()) == pytest.approx(0.5, abs=0.15)
+
+
+def test_weather_cache_ttl_and_lru(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = WeatherCache(ttl_s=60, max_entries=2)
+    cache.put('a', {'current_clouds': 1})
+    cache.put('b', {'current_clouds': 2})
+    assert cache.get('a')['current_clouds'] == 1
+    
+    # 'b' is now least recently used
+    cache.put('c', {'current_clouds': 3})
+    assert cache.get('b') is None and len(cache) == 2
+    
+    now[0] += 61
+    assert cache.get('a') is None
+
+
+def test_disk_weather_cache_survives_restart(tmp_path):
+    path = str(tmp_path / 'weather.sqlite')
+    cache = DiskWeatherCache(ttl_s=600, max_entries=10, path=path)
+    cache.put('f25dv', {'lat': 45.5, 'lon': -73.6, 'current_clouds': 35, 'timestamp': datetime(2024, 1, 15, 3)})
+    cache.close()
+    
+    reloaded = DiskWeatherCache(ttl_s=600, max_entries=10, path=path)
+    assert reloaded.get('f25dv')['current_clouds'] == 35
+    assert reloaded.get('f25dv')['timestamp'] == datetime(2024, 1, 15, 3)
+    reloaded.close()
+
+
+def test_weather_fetched_once_per_tile_and_cached():
+    async def run(url):
+        async with create_http_client() as client:
+            fetcher = WeatherDataFetcher(client=client)
+            fetcher.base_url = url
+            # Two users a few metres apart and one 100 km away
+            locations = [(45.5017, -73.5673), (45.5018, -73.5674), (46.4, -73.5)]
+            first = await fetcher.fetch_weather_for_multiple_locations(locations)
+            second = await fetcher.fetch_weather_for_multiple_locations(locations)
+            return first, second
+    
+    with StubServer(json_responder({'clouds': {'all': 20}})) as stub:
+        first, second = asyncio.run(run(stub.url))
+        assert stub.requests == 2
+    
+    assert len(first['tiles']) == 2
+    assert second['tiles'] == first['tiles']
+
+
+def test_forecast_mode_interpolates_between_refreshes(monkeypatch):
+    start = 1705287600  # 2024-01-15T03:00:00Z
+    onecall = {
+        'current': {'dt': start, 'clouds': 0},
+        'hourly': [{'dt': start + 3600 * h, 'clouds': 60 * h} for h in range(1, 3)],
+    }
+    now = [float(start)]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    
+    async def run(url):
+        async with create_http_client() as client:
+            fetcher = WeatherDataFetcher(client=client)
+            fetcher.onecall_url = url
+            fetcher.mode = 'forecast'
+            fetcher.cache = WeatherCache(ttl_s=3600, max_entries=10)
+            
+            clouds = []
+            for minutes in (0, 30, 45):
+                now[0] = start + 60 * minutes
+                result = await fetcher.fetch_weather_for_multiple_locations([(64.84, -147.72)])
+                clouds.append(result['weather_data'][0]['current_clouds'])
+            return clouds
+    
+    with StubServer(json_responder(onecall)) as stub:
+        clouds = asyncio.run(run(stub.url))
+        assert stub.requests == 1
+    
+    assert clouds == [0, 30, 45]
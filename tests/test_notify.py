@@ -0,0 +1,179 @@
+import asyncio
+from datetime import datetime
+import numpy as np
+from src.api.database import UserDB
+from src.engine.batch import BatchDecision, UserBatch
+from src.notify.delivery import DeliveryWorker, subscribe_entry, topic_entry, user_entry
+from src.notify.fcm_service import FCMService
+from src.notify.topics import plan_topic_sends, region_topic, region_topics
+from tests.fake_fcm import fake_fcm_app, fcm_responder
+from tests.helpers import make_database, notifications
+from tests.stub_server import StubServer
+
+
+def test_batch_send_returns_per_user_results_across_chunks():
+    with StubServer(fcm_responder(unregistered={'token-3'}, invalid={'token-8'})) as stub:
+        service = FCMService(app=fake_fcm_app(stub.url))
+        service.batch_size = 4
+        try:
+            results = asyncio.run(service.send_notifications_batch(list(notifications(10))))
+        finally:
+            service.close()
+        assert stub.requests == 10
+    
+    assert [result.user_id for result in results] == list(range(10))
+    assert [i for i, result in enumerate(results) if not result.success] == [3, 8]
+    assert results[3].error_code == 'UnregisteredError'
+    assert results[8].error_code == 'InvalidArgumentError'
+    assert [i for i, result in enumerate(results) if result.invalid_token] == [3, 8]
+    assert results[0].message_id.startswith('projects/aurora-bench/messages/')
+
+
+def test_region_topics_group_nearby_users_by_threshold_band():
+    batch = UserBatch(
+        id=np.arange(4), lat=np.array([64.80, 64.81, 64.80, 45.5]), lon=np.array([-147.7, -147.71, -147.7, -73.6]),
+        radius_km=np.full(4, 250), threshold=np.array([15.0, 19.0, 30.0, 15.0]), last_notified=np.full(4, np.nan)
+    )
+    
+    topics = region_topics(batch, precision=3)
+    
+    assert topics[0] == topics[1] == region_topic(64.80, -147.7, 15, 3) == 'aurora-bew-t15'
+    assert topics[2] == 'aurora-bew-t30'
+    assert topics[3] != topics[0]
+
+
+def test_topic_plan_requires_enough_qualifying_members():
+    # Topic a: 30 of 40 subscribers qualify; topic b: 3 of 40; one qualifying user of a is in cooldown
+    topics = np.array(['a'] * 41 + ['b'] * 40, dtype=object)
+    notify = np.zeros(81, dtype=bool)
+    notify[:30] = True
+    notify[41:44] = True
+    subscribed = np.ones(81, dtype=bool)
+    subscribed[40] = False
+    
+    plan = plan_topic_sends(topics, notify, subscribed, min_users=20, min_fraction=0.5)
+    
+    assert list(plan.topics) == ['a']
+    assert plan.topics['a'].tolist() == list(range(40))
+    assert plan.individual.tolist() == [41, 42, 43]
+    # Even with no minimum, a topic where nobody qualifies gets no message
+    plan = plan_topic_sends(topics, np.zeros(81, dtype=bool), subscribed, min_users=0, min_fraction=0.0)
+    assert plan.topics == {} and plan.individual.tolist() == []
+
+
+def test_topic_send_and_membership_through_fake_endpoint():
+    topics, sent = {}, []
+    decision = BatchDecision(
+        user_id=np.arange(3), max_prob=np.array([40.0, 30.0, 20.0]), mean_prob=np.array([20.0, 10.0, 15.0]),
+        cloud_coverage=np.array([10.0, 20.0, 30.0]), is_night=np.ones(3, dtype=bool),
+        notify=np.ones(3, dtype=bool), timestamp=datetime(2024, 1, 15, 3, 0)
+    )
+    
+    async def run(service):
+        await service.update_topics({'aurora-bde-t15': ['token-1', 'token-2']}, subscribe=True)
+        result = await service.send_topic_notification(decision.group_alert(np.arange(3)), 'aurora-bde-t15')
+        await service.update_topic_membership(['token-1'], 'aurora-bde-t15', subscribe=False)
+        return result
+    
+    with StubServer(fcm_responder(topics=topics, sent=sent)) as stub:
+        service = FCMService(app=fake_fcm_app(stub.url))
+        try:
+            result = asyncio.run(run(service))
+        finally:
+            service.close()
+    
+    assert result.success
+    assert sent[0]['topic'] == 'aurora-bde-t15' and sent[0]['data']['max_prob'] == '40.0'
+    assert topics == {'aurora-bde-t15': {'token-2'}}
+
+
+def test_delivery_worker_drains_outbox_with_retry_and_pruning(tmp_path):
+    database = make_database(tmp_path, n_users=4)
+    users = database.get_active_users()
+    alert = next(notifications(1))[0]
+    database.enqueue_outbox([user_entry(alert, user) for user in users], datetime(2024, 1, 15, 3, 0))
+    
+    sent = []
+    responder = fcm_responder(unregistered={'token-1'}, throttled={'token-2'}, sent=sent)
+    with StubServer(responder) as stub:
+        service = FCMService(app=fake_fcm_app(stub.url))
+        worker = DeliveryWorker(database, service)
+        worker.batch_size = 2
+        try:
+            stats = asyncio.run(worker.run_once())
+            # The throttled message waits for its backoff, nothing else is due
+            again = asyncio.run(worker.run_once())
+        finally:
+            service.close()
+    
+    assert stats == {'claimed': 4, 'sent': 2, 'retried': 1, 'dead': 1, 'pruned': 1}
+    assert again['claimed'] == 0
+    assert database.outbox_counts() == {'sent': 2, 'pending': 1, 'dead': 1}
+    assert [user.fcm_token for user in database.get_active_users()] == ['token-0', 'token-2', 'token-3']
+    # Cooldowns start on delivery; the throttled user waits for its retry without one
+    assert [user.last_notified is not None for user in database.get_active_users()] == [True, False, True]
+    delivered = {message['token']: message for message in sent if message['token'] in ('token-0', 'token-3')}
+    assert delivered['token-0']['android']['collapse_key'] == 'aurora-1'
+    assert delivered['token-3']['apns']['headers'] == {'apns-collapse-id': 'aurora-4'}
+
+
+def test_subscriptions_record_only_confirmed_members(tmp_path):
+    database = make_database(tmp_path, n_users=3)
+    users = database.get_active_users()
+    database.enqueue_outbox([subscribe_entry(
+        'aurora-bde-t15', [user.fcm_token for user in users], [user.id for user in users]
+    )], datetime(2024, 1, 15, 3, 0))
+    
+    topics = {}
+    with StubServer(fcm_responder(unregistered={'token-1'}, topics=topics)) as stub:
+        service = FCMService(app=fake_fcm_app(stub.url))
+        try:
+            stats = asyncio.run(DeliveryWorker(database, service).run_once())
+        finally:
+            service.close()
+    
+    # The failed token keeps the entry pending; the others are members already
+    assert stats == {'claimed': 1, 'sent': 0, 'retried': 1, 'dead': 0, 'pruned': 0}
+    assert topics == {'aurora-bde-t15': {'token-0', 'token-2'}}
+    with database.SessionLocal() as session:
+        members = dict(session.query(UserDB.fcm_token, UserDB.topic).all())
+    assert members == {'token-0': 'aurora-bde-t15', 'token-1': None, 'token-2': 'aurora-bde-t15'}
+
+
+def test_failed_topic_leaves_keep_membership_and_retry(tmp_path):
+    database = make_database(tmp_path, n_users=3)
+    users = database.get_active_users()
+    tokens, user_ids = [user.fcm_token for user in users], [user.id for user in users]
+    database.set_topic_members(user_ids, 'aurora-bde-t15')
+    alert = next(notifications(1))[0]
+    database.enqueue_outbox([topic_entry(alert, 'aurora-bde-t15', tokens, user_ids)], datetime(2024, 1, 15, 3, 0))
+    
+    def members():
+        with database.SessionLocal() as session:
+            return dict(session.query(UserDB.fcm_token, UserDB.topic).all())
+    
+    topics = {'aurora-bde-t15': set(tokens)}
+    with StubServer(fcm_responder(topics=topics, stuck={'token-1'})) as stub:
+        service = FCMService(app=fake_fcm_app(stub.url))
+        try:
+            stats = asyncio.run(DeliveryWorker(database, service).run_once())
+        finally:
+            service.close()
+    
+    # The alert went out and every reached user is in cooldown, but token-1 is still in the topic
+    assert stats == {'claimed': 1, 'sent': 1, 'retried': 0, 'dead': 0, 'pruned': 0}
+    assert all(user.last_notified is not None for user in database.get_active_users())
+    assert topics == {'aurora-bde-t15': {'token-1'}}
+    assert members() == {'token-0': None, 'token-1': 'aurora-bde-t15', 'token-2': None}
+    assert database.outbox_counts() == {'sent': 1, 'pending': 1}
+    
+    with StubServer(fcm_responder(topics=topics)) as stub:
+        service = FCMService(app=fake_fcm_app(stub.url))
+        try:
+            retried = asyncio.run(DeliveryWorker(database, service).run_once())
+        finally:
+            service.close()
+    
+    assert retried == {'claimed': 1, 'sent': 1, 'retried': 0, 'dead': 0, 'pruned': 0}
+    assert topics == {'aurora-bde-t15': set()}
+    assert members() == {'token-0': None, 'token-1': None, 'token-2': None}
@@ -0,0 +1,175 @@
+import asyncio
+from datetime import datetime
+import numpy as np
+import pytest
+from src import scheduler as scheduler_module
+from src.api.database import UserDB
+from src.engine.aurora_engine import AuroraEngine
+from src.engine.grid import AuroraGrid
+from src.notify.delivery import user_entry
+from src.notify.topics import region_topic
+from src.scheduler import AuroraScheduler
+from src.utils.config import settings
+from tests.helpers import make_database, notifications
+
+# Fairbanks and Oslo are dark at 03:00 UTC in January, Tokyo is not
+FAIRBANKS, OSLO, TOKYO = (64.8, -147.7), (60.0, 10.0), (35.7, 139.7)
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def utcnow(cls):
+        return datetime(2024, 1, 15, 3, 0)
+
+
+class StubAuroraFetcher:
+    def __init__(self, grid):
+        self.grid = grid
+
+    async def fetch_all_data(self):
+        return {'ovation': self.grid, 'kp': [{'kp_index': 2}], 'grid_version': self.grid.version}
+
+
+class StubWeatherFetcher:
+    def __init__(self, clouds):
+        self.clouds = clouds
+        self.calls = []
+
+    async def fetch_weather_for_multiple_locations(self, locations, priorities=None):
+        self.calls.append((locations, priorities))
+        return {'weather_data': [
+            {'lat': lat, 'lon': lon, 'current_clouds': self.clouds[(lat, lon)]} for lat, lon in locations
+        ]}
+
+
+def make_scheduler(database, grid, clouds) -> AuroraScheduler:
+    scheduler = AuroraScheduler.__new__(AuroraScheduler)
+    scheduler.database = database
+    scheduler.engine = AuroraEngine()
+    scheduler.evaluator = scheduler.engine
+    scheduler.aurora_fetcher = StubAuroraFetcher(grid)
+    scheduler.weather_fetcher = StubWeatherFetcher(clouds)
+    scheduler._last_fingerprint = None
+    scheduler._last_notified_count = 0
+    scheduler.last_cycle_stats = {}
+    return scheduler
+
+
+@pytest.fixture
+def scheduler_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler_module, 'datetime', FrozenDatetime)
+    monkeypatch.setattr(settings, 'user_chunk_size', 2)
+    monkeypatch.setattr(settings, 'fcm_topic_mode', False)
+    database = make_database(tmp_path)
+    with database.SessionLocal() as session:
+        session.add_all([
+            UserDB(lat=lat, lon=lon, radius_km=250, threshold=15, fcm_token=f"token-{i}", active=True)
+            for i, (lat, lon) in enumerate([FAIRBANKS, OSLO, TOKYO])
+        ])
+        session.commit()
+    return database
+
+
+def test_cycle_ranks_weather_by_gate_and_queries_radius_once(scheduler_env, monkeypatch):
+    grid = AuroraGrid.zeros()
+    grid.prob[:, 90 + 55:90 + 75] = 60
+    grid.version = 'v1'
+    scheduler = make_scheduler(scheduler_env, grid, {FAIRBANKS: 10, OSLO: 90, TOKYO: 0})
+    
+    queried = []
+    probabilities = scheduler.engine.probabilities
+    monkeypatch.setattr(scheduler.engine, 'probabilities',
+                        lambda batch, cells: queried.append(len(batch)) or probabilities(batch, cells))
+    asyncio.run(scheduler.check_aurora_conditions())
+    
+    # Dark users under the aurora band are fetched first; radius queries run once, in evaluation
+    locations, priorities = scheduler.weather_fetcher.calls[0]
+    assert locations == [FAIRBANKS, OSLO, TOKYO]
+    assert priorities == [True, True, False]
+    assert queried == [3]
+    # Oslo is clouded over and Tokyo is in daylight
+    assert scheduler.last_cycle_stats == {'queued': 1, 'users': 1}
+    message = scheduler_env.claim_outbox(10, 60)[0]
+    assert message.payload['token'] == 'token-0'
+
+
+def test_users_with_queued_messages_wait_for_delivery(scheduler_env):
+    grid = AuroraGrid.zeros()
+    grid.prob[:, 90 + 55:90 + 75] = 60
+    grid.version = 'v1'
+    scheduler = make_scheduler(scheduler_env, grid, {FAIRBANKS: 10, OSLO: 90, TOKYO: 0})
+    
+    asyncio.run(scheduler.check_aurora_conditions())
+    # Not in cooldown yet, but the queued message already covers Fairbanks
+    asyncio.run(scheduler.check_aurora_conditions())
+    assert scheduler.last_cycle_stats == {'queued': 0, 'users': 0}
+    
+    # A dead message starts no cooldown, so the next cycle tries again
+    message = scheduler_env.claim_outbox(10, 60)[0]
+    scheduler_env.fail_outbox([(message.id, None, 'InternalError')])
+    asyncio.run(scheduler.check_aurora_conditions())
+    assert scheduler.last_cycle_stats == {'queued': 1, 'users': 1}
+
+
+@pytest.fixture
+def topic_env(scheduler_env, monkeypatch):
+    """Topic mode with a second Fairbanks user (id 4), so Fairbanks has two possible members."""
+    monkeypatch.setattr(settings, 'fcm_topic_mode', True)
+    monkeypatch.setattr(settings, 'fcm_topic_min_users', 1)
+    monkeypatch.setattr(settings, 'fcm_topic_min_fraction', 0.0)
+    with scheduler_env.SessionLocal() as session:
+        session.add(UserDB(lat=FAIRBANKS[0], lon=FAIRBANKS[1], radius_km=250, threshold=15,
+                           fcm_token='token-3', active=True))
+        session.commit()
+    return scheduler_env
+
+
+def test_topic_sends_reach_only_confirmed_members(topic_env):
+    fairbanks = region_topic(*FAIRBANKS, 15, settings.fcm_topic_precision)
+    topic_env.set_topic_members([1], fairbanks)
+    grid = AuroraGrid.zeros()
+    grid.prob[:, 90 + 55:90 + 75] = 60
+    grid.version = 'v1'
+    scheduler = make_scheduler(topic_env, grid, {FAIRBANKS: 10, OSLO: 90, TOKYO: 0})
+    
+    asyncio.run(scheduler.check_aurora_conditions())
+    
+    messages = topic_env.claim_outbox(10, 60)
+    by_kind = {kind: [message for message in messages if message.kind == kind]
+               for kind in ('topic', 'user', 'subscribe')}
+    # The confirmed member gets the topic send; the other Fairbanks user is not in the topic yet
+    assert [message.payload['user_ids'] for message in by_kind['topic']] == [[1]]
+    assert [(message.user_id, message.payload['topic']) for message in by_kind['user']] == [(4, fairbanks)]
+    # Oslo and Tokyo join their topics; the Fairbanks user waits for its queued message
+    assert sorted(message.payload['user_ids'] for message in by_kind['subscribe']) == [[2], [3]]
+
+
+def test_topic_sends_skip_members_with_queued_messages(topic_env):
+    fairbanks = region_topic(*FAIRBANKS, 15, settings.fcm_topic_precision)
+    topic_env.set_topic_members([1, 4], fairbanks)
+    # User 4's message from an earlier cycle is backing off, so its cooldown has not started
+    alert = next(notifications(1))[0]
+    topic_env.enqueue_outbox([user_entry(alert, topic_env.get_user_by_token('token-3'), fairbanks)],
+                             datetime(2024, 1, 15, 2, 55))
+    grid = AuroraGrid.zeros()
+    grid.prob[:, 90 + 55:90 + 75] = 60
+    grid.version = 'v1'
+    scheduler = make_scheduler(topic_env, grid, {FAIRBANKS: 10, OSLO: 90, TOKYO: 0})
+    
+    asyncio.run(scheduler.check_aurora_conditions())
+    
+    messages = topic_env.claim_outbox(10, 60)
+    # The topic send leaves user 4 out, and no second message is queued for it
+    assert [message.payload['user_ids'] for message in messages if message.kind == 'topic'] == [[1]]
+    assert [message.user_id for message in messages if message.kind == 'user'] == [4]
+
+
+def test_quiet_cycle_skips_weather(scheduler_env):
+    grid = AuroraGrid.zeros()
+    grid.version = 'v1'
+    scheduler = make_scheduler(scheduler_env, grid, {})
+    
+    asyncio.run(scheduler.check_aurora_conditions())
+    
+    assert scheduler.weather_fetcher.calls == []
+    assert scheduler_env.outbox_counts() == {}